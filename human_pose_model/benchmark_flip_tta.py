@@ -0,0 +1,85 @@
+"""Reports the PCKh gained by left-right flip test-time augmentation against
+its latency cost, by evaluating the latest checkpoint in `log_dir` with and
+without flipping.
+
+Both evaluations run the same number of validation batches, and the time per
+batch includes running the network over the mirrored copy of each batch.
+"""
+import argparse
+import math
+import time
+import numpy as np
+import tensorflow as tf
+from pose_utils import pckh
+from pose_utils.pose_flags import FLAGS
+from dataset.mpii_datatypes import JOINT_NAMES
+from evaluate import setup_evaluation, run_evaluation
+
+def _evaluate_with_flip_tta(checkpoint_path, use_flip_tta):
+    """Evaluates `checkpoint_path` in a new graph and session, with or without
+    flip TTA.
+
+    Returns:
+        (per-joint PCKh@0.5, seconds per batch) tuple.
+    """
+    eval_flags = argparse.Namespace(**dict(FLAGS.flag_values_dict(),
+                                           flip_tta=use_flip_tta))
+
+    with tf.Graph().as_default():
+        num_val_examples, val_loss, streaming_pckh, input_initializer = setup_evaluation(
+            eval_flags)
+
+        restorer = tf.train.Saver(var_list=tf.global_variables())
+
+        with tf.Session(config=tf.ConfigProto(allow_soft_placement=True)) as session:
+            start_time = time.time()
+            _, matched_joints, predicted_joints = run_evaluation(session,
+                                                                 restorer,
+                                                                 checkpoint_path,
+                                                                 val_loss,
+                                                                 streaming_pckh,
+                                                                 input_initializer,
+                                                                 num_val_examples,
+                                                                 eval_flags.batch_size)
+            duration = time.time() - start_time
+
+    threshold_index = streaming_pckh.thresholds.index(pckh.PCKH_THRESHOLD)
+    num_batches = int(math.ceil(num_val_examples/eval_flags.batch_size))
+
+    return (matched_joints[threshold_index]/predicted_joints,
+            duration/num_batches)
+
+
+def main(argv=None):
+    """Usage:
+    ('python3 -m benchmark_flip_tta
+     --log_dir logs/resnet/exp0
+     --eval_cache_dir /mnt/data/datasets/MPII_HumanPose/valid_cache')
+    """
+    checkpoint_path = tf.train.latest_checkpoint(checkpoint_dir=FLAGS.log_dir)
+    assert checkpoint_path is not None
+
+    pckh_without_tta, secs_without_tta = _evaluate_with_flip_tta(checkpoint_path,
+                                                                 False)
+    pckh_with_tta, secs_with_tta = _evaluate_with_flip_tta(checkpoint_path, True)
+
+    print('{:>20} {:>10} {:>10} {:>10}'.format('joint', 'no flip', 'flip', 'gain'))
+    for joint_index, joint_name in enumerate(JOINT_NAMES):
+        print('{:>20} {:>10.4f} {:>10.4f} {:>+10.4f}'.format(
+            joint_name,
+            pckh_without_tta[joint_index],
+            pckh_with_tta[joint_index],
+            pckh_with_tta[joint_index] - pckh_without_tta[joint_index]))
+
+    print('{:>20} {:>10.4f} {:>10.4f} {:>+10.4f}'.format(
+        'Total PCKh',
+        np.mean(pckh_without_tta),
+        np.mean(pckh_with_tta),
+        np.mean(pckh_with_tta) - np.mean(pckh_without_tta)))
+
+    print('\nSeconds per batch: {:.4f} without flip, {:.4f} with flip ({:.2f}x).'.format(
+        secs_without_tta, secs_with_tta, secs_with_tta/secs_without_tta))
+
+
+if __name__ == "__main__":
+    tf.app.run()
@@ -0,0 +1,315 @@
+"""Benchmarks the training or evaluation input pipeline without a model, to
+tell whether training is input-bound.
+
+First, the pipeline is built up one stage at a time (read, decompress, parse,
+JPEG decode, augment, batch, heatmaps), and each partial pipeline is drained to
+find the examples per second up to and including that stage. The difference in
+time per example between consecutive stages is the cost of the later stage.
+
+Then the full pipeline, as built by `setup_train_input_pipeline` or
+`setup_eval_input_pipeline`, is timed for each combination of the
+`num_readers`, `num_preprocess_threads` and `input_queue_memory_factor` values
+to sweep, and the fastest configuration is printed.
+"""
+import itertools
+import time
+import tensorflow as tf
+import input_pipeline
+from pose_utils import pose_util
+from pose_utils import tfrecord_index
+from pose_utils.pose_flags import FLAGS
+
+tf.app.flags.DEFINE_boolean('benchmark_eval', False,
+                            """Benchmark the evaluation input pipeline (True)
+                            or the training input pipeline (False)?""")
+
+tf.app.flags.DEFINE_integer('benchmark_num_batches', 50,
+                            """Number of batches to time for each benchmark.""")
+
+tf.app.flags.DEFINE_integer('benchmark_warmup_batches', 5,
+                            """Number of batches to drain from the full
+                            pipeline before timing it, to fill its buffers.""")
+
+tf.app.flags.DEFINE_string('sweep_num_readers', '',
+                           """Comma-separated values of num_readers to sweep.
+                           Defaults to the num_readers flag.""")
+
+tf.app.flags.DEFINE_string('sweep_num_preprocess_threads', '',
+                           """Comma-separated values of num_preprocess_threads
+                           to sweep. Defaults to the num_preprocess_threads
+                           flag.""")
+
+tf.app.flags.DEFINE_string('sweep_input_queue_memory_factor', '',
+                           """Comma-separated values of
+                           input_queue_memory_factor to sweep. Defaults to the
+                           input_queue_memory_factor flag.""")
+
+DRAIN_BATCH_SIZE = 256
+NUM_STAGES = 7
+
+class _FlagOverrides(object):
+    """Stands in for `FLAGS` in `setup_train_input_pipeline`, with some flags
+    overridden.
+    """
+    def __init__(self, **overrides):
+        self._overrides = overrides
+
+    def __getattr__(self, name):
+        if name in self._overrides:
+            return self._overrides[name]
+
+        return getattr(FLAGS, name)
+
+
+def _parse_sweep_values(sweep_flag, default_value):
+    """Returns the list of integers in `sweep_flag`, or `[default_value]` if
+    it is empty.
+    """
+    if not sweep_flag:
+        return [default_value]
+
+    return [int(value) for value in sweep_flag.split(',')]
+
+
+def _take_stage_files(data_filenames, num_examples):
+    """Returns the first of the sorted `data_filenames` holding at least
+    `num_examples` examples in total, along with their total examples.
+    """
+    stage_filenames = []
+    num_stage_examples = 0
+    for data_file in sorted(data_filenames):
+        shard_index = tfrecord_index.read_shard_index(data_file)
+        assert shard_index is not None, ('{} has no index.'.format(data_file))
+
+        stage_filenames.append(data_file)
+        num_stage_examples += shard_index['num_examples']
+        if num_stage_examples >= num_examples:
+            break
+
+    return stage_filenames, num_stage_examples
+
+
+def _get_stage_datasets(stage_filenames, num_preprocess_threads, is_eval):
+    """Returns a list of (stage name, dataset, examples per element) tuples,
+    where each dataset runs the input pipeline up to and including its stage.
+
+    The first stage only reads the files, and has one element per file, so its
+    examples per element is `None`.
+    """
+    batch_size = FLAGS.batch_size
+    image_dim = FLAGS.image_dim
+    compression_type = tfrecord_index.get_dataset_compression_type(
+        tfrecord_index.get_compression_type(stage_filenames))
+
+    if is_eval:
+        preprocess_example = lambda example_serialized: (
+            input_pipeline._parse_and_preprocess_example_eval(example_serialized,
+                                                              image_dim))
+        preprocess_batch = lambda *batch: input_pipeline._preprocess_batch_eval(
+            FLAGS.heatmap_stddev_pixels,
+            image_dim,
+            *batch)
+    else:
+        preprocess_example = lambda example_serialized: (
+            input_pipeline._parse_and_preprocess_example_train(example_serialized,
+                                                               image_dim,
+                                                               FLAGS.max_rotation_angle,
+                                                               FLAGS.min_scale,
+                                                               FLAGS.max_scale,
+                                                               FLAGS.max_translation))
+        preprocess_batch = lambda *batch: input_pipeline._preprocess_batch_train(
+            FLAGS.heatmap_stddev_pixels,
+            image_dim,
+            *batch)
+
+    filenames = tf.data.Dataset.from_tensor_slices(stage_filenames)
+    read = filenames.map(map_func=tf.read_file)
+
+    examples = tf.data.TFRecordDataset(filenames=stage_filenames,
+                                       compression_type=compression_type)
+    parsed = examples.map(map_func=input_pipeline._parse_example_features,
+                          num_parallel_calls=num_preprocess_threads)
+    decoded = examples.map(
+        map_func=lambda example_serialized: input_pipeline._parse_example_proto(
+            example_serialized, image_dim),
+        num_parallel_calls=num_preprocess_threads)
+    preprocessed = examples.map(map_func=preprocess_example,
+                                num_parallel_calls=num_preprocess_threads)
+    batched = preprocessed.apply(tf.contrib.data.batch_and_drop_remainder(batch_size))
+    heatmaps = batched.map(map_func=preprocess_batch)
+
+    return [('read', read, None),
+            ('decompress', examples, 1),
+            ('parse', parsed, 1),
+            ('decode_jpeg', decoded, 1),
+            ('augment', preprocessed, 1),
+            ('batch', batched, batch_size),
+            ('heatmaps', heatmaps, batch_size)]
+
+
+def _time_stage(dataset):
+    """Drains `dataset`, and returns (number of elements, seconds taken).
+
+    Each element is replaced with a scalar and the scalars are batched, so that
+    the time is spent computing the elements rather than fetching them.
+    """
+    drained = dataset.map(map_func=lambda *element: tf.constant(1, dtype=tf.int64))
+    drained = drained.batch(DRAIN_BATCH_SIZE)
+    next_counts = tf.reduce_sum(drained.make_one_shot_iterator().get_next())
+
+    num_elements = 0
+    with tf.Session() as session:
+        start_time = time.time()
+        try:
+            while True:
+                num_elements += session.run(next_counts)
+        except tf.errors.OutOfRangeError:
+            pass
+
+        return num_elements, time.time() - start_time
+
+
+def benchmark_stages(data_filenames, is_eval):
+    """Times each stage of the input pipeline, reading enough files for
+    `benchmark_num_batches` batches, using `num_preprocess_threads`.
+
+    Returns:
+        List of (stage name, examples/sec) tuples.
+    """
+    stage_filenames, num_stage_examples = _take_stage_files(
+        data_filenames, FLAGS.benchmark_num_batches*FLAGS.batch_size)
+
+    results = []
+    for stage_number in range(NUM_STAGES):
+        # NOTE(brendan): Each stage is timed in a new graph, so that no
+        # threads are left over from timing the previous stage.
+        with tf.Graph().as_default():
+            stage_datasets = _get_stage_datasets(stage_filenames,
+                                                 FLAGS.num_preprocess_threads,
+                                                 is_eval)
+            stage_name, dataset, examples_per_element = stage_datasets[stage_number]
+
+            num_elements, duration = _time_stage(dataset)
+
+        if examples_per_element is None:
+            num_examples = num_stage_examples
+        else:
+            num_examples = num_elements*examples_per_element
+
+        results.append((stage_name, num_examples/duration))
+
+    return results
+
+
+def _time_full_pipeline(data_filenames, num_examples, overrides, is_eval):
+    """Builds the whole input pipeline in a new graph, with the flags in
+    `overrides`, and returns its examples/sec.
+    """
+    flags = _FlagOverrides(**overrides)
+
+    with tf.Graph().as_default():
+        if is_eval:
+            eval_batch = input_pipeline.setup_eval_input_pipeline(
+                flags.batch_size,
+                flags.num_preprocess_threads,
+                flags.image_dim,
+                flags.heatmap_stddev_pixels,
+                data_filenames)
+            batch = [eval_batch.images, eval_batch.heatmaps]
+            initializers = [eval_batch.iterator_initializer]
+        else:
+            examples_per_shard = int(num_examples/len(data_filenames))
+            batch = input_pipeline.setup_train_input_pipeline(flags,
+                                                              data_filenames,
+                                                              examples_per_shard)
+            initializers = []
+
+        # NOTE(brendan): Running a group of the batch tensors dequeues a whole
+        # batch, without copying any of it out of the session.
+        next_batch = tf.group(*batch)
+
+        with tf.Session() as session:
+            session.run(initializers)
+            for _ in range(FLAGS.benchmark_warmup_batches):
+                session.run(next_batch)
+
+            start_time = time.time()
+            for _ in range(FLAGS.benchmark_num_batches):
+                session.run(next_batch)
+            duration = time.time() - start_time
+
+    return FLAGS.benchmark_num_batches*FLAGS.batch_size/duration
+
+
+def sweep_full_pipeline(data_filenames, num_examples, is_eval):
+    """Times the full input pipeline for every combination of the swept flags.
+
+    Returns:
+        List of (overrides, examples/sec) tuples.
+    """
+    sweep_values = {
+        'num_readers': _parse_sweep_values(FLAGS.sweep_num_readers,
+                                           FLAGS.num_readers),
+        'num_preprocess_threads': _parse_sweep_values(FLAGS.sweep_num_preprocess_threads,
+                                                      FLAGS.num_preprocess_threads),
+        'input_queue_memory_factor': _parse_sweep_values(FLAGS.sweep_input_queue_memory_factor,
+                                                         FLAGS.input_queue_memory_factor),
+    }
+    if is_eval:
+        # NOTE(brendan): The evaluation pipeline reads one file at a time and
+        # does not shuffle, so only the preprocessing threads matter.
+        sweep_values['num_readers'] = [FLAGS.num_readers]
+        sweep_values['input_queue_memory_factor'] = [FLAGS.input_queue_memory_factor]
+
+    flag_names = sorted(sweep_values)
+    results = []
+    for values in itertools.product(*[sweep_values[name] for name in flag_names]):
+        overrides = dict(zip(flag_names, values))
+        examples_per_sec = _time_full_pipeline(data_filenames,
+                                               num_examples,
+                                               overrides,
+                                               is_eval)
+        print('{}: {:.1f} examples/sec'.format(overrides, examples_per_sec))
+        results.append((overrides, examples_per_sec))
+
+    return results
+
+
+def main(argv=None):
+    """Usage:
+    ('python3 -m benchmark_input_pipeline
+     --train_data_dir /mnt/data/datasets/MPII_HumanPose/train_512px
+     --image_dim 256
+     --sweep_num_preprocess_threads 2,4,8')
+    """
+    if FLAGS.benchmark_eval:
+        data_dir = FLAGS.validation_data_dir
+        tfrecord_prefix = 'valid'
+    else:
+        data_dir = FLAGS.train_data_dir
+        tfrecord_prefix = 'train'
+
+    num_examples, data_filenames = pose_util.count_training_examples(
+        data_dir, FLAGS.num_preprocess_threads, tfrecord_prefix)
+
+    print('Stages (cumulative):')
+    print('{:>12} {:>14} {:>16}'.format('stage', 'examples/sec', 'added ms/example'))
+    previous_ms_per_example = 0
+    for stage_name, examples_per_sec in benchmark_stages(data_filenames,
+                                                         FLAGS.benchmark_eval):
+        ms_per_example = 1000/examples_per_sec
+        print('{:>12} {:>14.1f} {:>16.3f}'.format(stage_name,
+                                                  examples_per_sec,
+                                                  ms_per_example - previous_ms_per_example))
+        previous_ms_per_example = ms_per_example
+
+    print('\nFull pipeline:')
+    results = sweep_full_pipeline(data_filenames, num_examples, FLAGS.benchmark_eval)
+
+    best_overrides, best_examples_per_sec = max(results, key=lambda result: result[1])
+    print('\nBest configuration: {} ({:.1f} examples/sec)'.format(best_overrides,
+                                                                 best_examples_per_sec))
+
+
+if __name__ == "__main__":
+    tf.app.run()
@@ -0,0 +1,136 @@
+"""Benchmarks the TFRecord compression types that `write_tf_record` can write,
+by rewriting a sample of existing examples with each compression type and
+reporting the bytes on disk against the examples per second read back.
+
+Since the `image_jpeg` feature is already JPEG compressed, most of the bytes
+in each example do not compress further, and the reader CPU spent on
+decompression may not be worth the disk space saved.
+"""
+import os
+import shutil
+import tempfile
+import time
+import tensorflow as tf
+from pose_utils import tfrecord_index
+
+FLAGS = tf.app.flags.FLAGS
+
+tf.app.flags.DEFINE_string('data_dir', '/mnt/data/datasets/MPII_HumanPose/train_512px',
+                           """Directory of TFRecord files, written by
+                           `write_tf_record`, to take example records from.""")
+
+tf.app.flags.DEFINE_string('tfrecord_prefix', 'train',
+                           """Prefix of the TFRecord files in `data_dir`.""")
+
+tf.app.flags.DEFINE_integer('num_examples', 1024,
+                            """Number of examples to rewrite with each
+                            compression type.""")
+
+tf.app.flags.DEFINE_string('compression_configs', 'none,gzip:1,gzip:6,zlib:1,zlib:6,zlib:9',
+                           """Comma-separated list of compression types to
+                           benchmark, each optionally followed by a colon and
+                           a compression level.""")
+
+tf.app.flags.DEFINE_integer('num_trials', 3,
+                            """Number of times to read back each file. The
+                            fastest read is reported.""")
+
+def _read_sample_records(data_dir, tfrecord_prefix, num_examples):
+    """Reads the first `num_examples` serialized examples from the TFRecord
+    files in `data_dir`.
+    """
+    data_filenames = sorted(tf.gfile.Glob(
+        os.path.join(data_dir, tfrecord_prefix + '*tfrecord')))
+    assert data_filenames, ('No data files found.')
+
+    options = tfrecord_index.get_record_options(
+        tfrecord_index.get_compression_type(data_filenames))
+
+    records = []
+    for data_file in data_filenames:
+        for record in tf.python_io.tf_record_iterator(path=data_file, options=options):
+            records.append(record)
+            if len(records) == num_examples:
+                return records
+
+    return records
+
+
+def _parse_compression_config(config):
+    """Parses a 'type[:level]' string into (compression_type, compression_level)."""
+    if ':' in config:
+        compression_type, compression_level = config.split(':')
+        return compression_type, int(compression_level)
+
+    return config, None
+
+
+def _time_read(tfrecord_filepath, options, num_trials):
+    """Returns the fastest time in seconds, out of `num_trials`, to read and
+    parse every example in `tfrecord_filepath`.
+    """
+    fastest_read_secs = float('inf')
+    for _ in range(num_trials):
+        start_time = time.time()
+        for record in tf.python_io.tf_record_iterator(path=tfrecord_filepath,
+                                                      options=options):
+            tf.train.Example.FromString(record)
+        fastest_read_secs = min(fastest_read_secs, time.time() - start_time)
+
+    return fastest_read_secs
+
+
+def benchmark_compression(records, compression_configs, num_trials):
+    """Writes `records` once per compression config and times reading them
+    back.
+
+    Returns:
+        List of (config, bytes on disk, examples/sec) tuples, in the order of
+        `compression_configs`.
+    """
+    results = []
+    benchmark_dir = tempfile.mkdtemp()
+    try:
+        for config in compression_configs:
+            compression_type, compression_level = _parse_compression_config(config)
+            options = tfrecord_index.get_record_options(compression_type,
+                                                        compression_level)
+
+            tfrecord_filepath = os.path.join(benchmark_dir,
+                                             config.replace(':', '_') + '.tfrecord')
+            with tf.python_io.TFRecordWriter(path=tfrecord_filepath, options=options) as writer:
+                for record in records:
+                    writer.write(record)
+
+            read_secs = _time_read(tfrecord_filepath, options, num_trials)
+            results.append((config,
+                            os.path.getsize(tfrecord_filepath),
+                            len(records)/read_secs))
+    finally:
+        shutil.rmtree(benchmark_dir)
+
+    return results
+
+
+def main(argv=None):
+    """Usage:
+    ('python3 -m benchmark_tfrecord_compression
+     --data_dir /mnt/data/datasets/MPII_HumanPose/train_512px
+     --compression_configs none,zlib:6')
+    """
+    records = _read_sample_records(FLAGS.data_dir,
+                                   FLAGS.tfrecord_prefix,
+                                   FLAGS.num_examples)
+
+    results = benchmark_compression(records,
+                                    FLAGS.compression_configs.split(','),
+                                    FLAGS.num_trials)
+
+    print('Benchmarked {} examples.'.format(len(records)))
+    print('{:>10} {:>14} {:>14}'.format('codec', 'bytes', 'examples/sec'))
+    for config, num_bytes, examples_per_sec in results:
+        print('{:>10} {:>14} {:>14.1f}'.format(config, num_bytes, examples_per_sec))
+
+
+if __name__ == "__main__":
+    tf.app.run()
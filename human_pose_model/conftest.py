@@ -0,0 +1,20 @@
+"""pytest configuration for the tests of `human_pose_model`, which are run
+from the `human_pose_model` directory with `python3 -m pytest`.
+
+The tests of TensorFlow code import TensorFlow at the top, as the modules they
+test do, and are not collected where a module that they need is not
+installed.
+"""
+import importlib.util
+
+REQUIRED_MODULES = {
+    'pose_utils/tfrecord_index_test.py': ['tensorflow'],
+    'pose_utils/pckh_test.py': ['tensorflow'],
+    'pose_utils/profiling_test.py': ['tensorflow'],
+    'pose_utils/async_checkpoint_test.py': ['tensorflow'],
+}
+
+collect_ignore = [test_filepath
+                  for test_filepath, modules in REQUIRED_MODULES.items()
+                  if any(importlib.util.find_spec(module) is None
+                         for module in modules)]
@@ -0,0 +1,99 @@
+"""
+A module for caching the parsed MPII annotations on disk.
+
+Parsing the MPII .mat file with `scipy.io.loadmat` and walking every
+annotation in Python takes tens of seconds. The result of that parse is small,
+so it is exported once to a columnar NumPy `.npz` file, which can be loaded in
+milliseconds on later runs.
+
+The cache holds the arrays backing an `MpiiDataset` (see
+`dataset.mpii_datatypes.MpiiDataset`) as they are, with one row per image in
+`img_filenames`, `img_dims` and `people_offsets`, and one row per person in `joints`,
+`objpos`, `scale` and `head_rects`.
+
+The cache is tied to the .mat file it was parsed from by the file's size and
+modification time, and is ignored (then rewritten) if either changes.
+"""
+import os
+import numpy as np
+from dataset.mpii_datatypes import MpiiDataset
+
+CACHE_FORMAT_VERSION = 3
+
+def get_mpii_cache_filepath(mpii_dataset_filepath, is_train, cache_dir=None):
+    """Returns the path of the annotation cache for `mpii_dataset_filepath`.
+
+    Args:
+        mpii_dataset_filepath: The filepath to the .mat file provided from the
+            MPII Human Pose website.
+        is_train: Training (True) or test (False) annotations?
+        cache_dir: Directory to keep the cache in. Defaults to the directory of
+            the .mat file.
+    """
+    if cache_dir is None:
+        cache_dir = os.path.dirname(mpii_dataset_filepath)
+
+    mat_basename = os.path.splitext(os.path.basename(mpii_dataset_filepath))[0]
+    if is_train:
+        cache_basename = mat_basename + '.train.npz'
+    else:
+        cache_basename = mat_basename + '.test.npz'
+
+    return os.path.join(cache_dir, cache_basename)
+
+
+def _get_mat_fingerprint(mpii_dataset_filepath):
+    """Returns an array of (format version, size, modification time in ns) that
+    changes whenever the .mat file at `mpii_dataset_filepath` does.
+    """
+    mat_stat = os.stat(mpii_dataset_filepath)
+
+    return np.array([CACHE_FORMAT_VERSION, mat_stat.st_size, mat_stat.st_mtime_ns],
+                    dtype=np.int64)
+
+
+def save_mpii_cache(cache_filepath, mpii_dataset_filepath, mpii_dataset):
+    """Writes the parsed annotations in `mpii_dataset` to `cache_filepath`.
+
+    The cache is written to a temporary file first and then moved into place,
+    so that a run interrupted part-way through never leaves a truncated cache
+    behind.
+    """
+    tmp_filepath = cache_filepath + '.tmp'
+    with open(tmp_filepath, 'wb') as f:
+        np.savez(f,
+                 mat_fingerprint=_get_mat_fingerprint(mpii_dataset_filepath),
+                 img_filenames=np.array(mpii_dataset.img_filenames, dtype=np.str_),
+                 img_dims=mpii_dataset.img_dims,
+                 people_offsets=mpii_dataset.people_offsets,
+                 joints=mpii_dataset.joints,
+                 objpos=mpii_dataset.objpos,
+                 scale=mpii_dataset.scale,
+                 head_rects=mpii_dataset.head_rects)
+
+    os.replace(tmp_filepath, cache_filepath)
+
+
+def load_mpii_cache(cache_filepath, mpii_dataset_filepath):
+    """Loads the parsed annotations from `cache_filepath`.
+
+    Returns:
+        An `MpiiDataset` in the order it was saved in, or `None` if there is
+        no cache, or the cache is out of date with respect to the .mat file at
+        `mpii_dataset_filepath`.
+    """
+    if not os.path.exists(cache_filepath):
+        return None
+
+    with np.load(cache_filepath) as cache:
+        if not np.array_equal(cache['mat_fingerprint'],
+                              _get_mat_fingerprint(mpii_dataset_filepath)):
+            return None
+
+        return MpiiDataset(cache['img_filenames'].tolist(),
+                           cache['img_dims'],
+                           cache['people_offsets'],
+                           cache['joints'],
+                           cache['objpos'],
+                           cache['scale'],
+                           cache['head_rects'])
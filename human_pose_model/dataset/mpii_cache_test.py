@@ -0,0 +1,87 @@
+"""Tests for the on-disk MPII annotation cache."""
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from dataset.mpii_cache import (get_mpii_cache_filepath,
+                                save_mpii_cache,
+                                load_mpii_cache)
+from dataset.mpii_datatypes import MpiiDataset, Person
+
+class MpiiCacheTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp_dir = tempfile.mkdtemp()
+        self._mat_filepath = os.path.join(self._tmp_dir, 'mpii_human_pose_v1_u12_1.mat')
+        with open(self._mat_filepath, 'wb') as f:
+            f.write(b'mat file contents')
+
+        self._cache_filepath = get_mpii_cache_filepath(self._mat_filepath, True)
+
+        # NOTE(brendan): Two images, with two people and one person. The
+        # second person has no head rectangle, and joint 4 unannotated.
+        joints = np.arange(3*Person.NUM_JOINTS*3, dtype=np.float32).reshape(
+            [3, Person.NUM_JOINTS, 3])
+        joints[1, 4] = np.nan
+
+        self._dataset = MpiiDataset(
+            ['a.jpg', 'b.jpg'],
+            np.array([[640, 480], [1280, 720]], dtype=np.int64),
+            np.array([0, 2, 3], dtype=np.int64),
+            joints,
+            np.array([[10, 20], [30, 40], [50, 60]], dtype=np.float64),
+            np.array([1.0, 2.0, 3.0]),
+            np.array([[1, 2, 3, 4], [np.nan]*4, [5, 6, 7, 8]], dtype=np.float64))
+
+    def tearDown(self):
+        shutil.rmtree(self._tmp_dir)
+
+    def test_cache_filepath(self):
+        self.assertEqual(self._cache_filepath,
+                         os.path.join(self._tmp_dir, 'mpii_human_pose_v1_u12_1.train.npz'))
+        self.assertEqual(get_mpii_cache_filepath(self._mat_filepath, False, '/cache'),
+                         '/cache/mpii_human_pose_v1_u12_1.test.npz')
+
+    def test_missing_cache(self):
+        self.assertIsNone(load_mpii_cache(self._cache_filepath, self._mat_filepath))
+
+    def test_round_trip(self):
+        save_mpii_cache(self._cache_filepath, self._mat_filepath, self._dataset)
+        self.assertFalse(os.path.exists(self._cache_filepath + '.tmp'))
+
+        loaded = load_mpii_cache(self._cache_filepath, self._mat_filepath)
+
+        self.assertEqual(loaded.img_filenames, self._dataset.img_filenames)
+        for array_name in ['img_dims',
+                           'people_offsets',
+                           'joints',
+                           'objpos',
+                           'scale',
+                           'head_rects']:
+            np.testing.assert_array_equal(getattr(loaded, array_name),
+                                          getattr(self._dataset, array_name),
+                                          err_msg=array_name)
+
+    def test_invalidated_by_mat_mtime(self):
+        save_mpii_cache(self._cache_filepath, self._mat_filepath, self._dataset)
+
+        mat_stat = os.stat(self._mat_filepath)
+        os.utime(self._mat_filepath,
+                 ns=(mat_stat.st_atime_ns, mat_stat.st_mtime_ns + 10**9))
+
+        self.assertIsNone(load_mpii_cache(self._cache_filepath, self._mat_filepath))
+
+    def test_invalidated_by_mat_size(self):
+        save_mpii_cache(self._cache_filepath, self._mat_filepath, self._dataset)
+
+        mat_stat = os.stat(self._mat_filepath)
+        with open(self._mat_filepath, 'ab') as f:
+            f.write(b'more')
+        os.utime(self._mat_filepath,
+                 ns=(mat_stat.st_atime_ns, mat_stat.st_mtime_ns))
+
+        self.assertIsNone(load_mpii_cache(self._cache_filepath, self._mat_filepath))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,8 @@
 """This module contains the datatype definitions particular to the MPII
 dataset.
 """
+import numpy as np
+from dataset.shapes import Point, Rectangle
 
 JOINT_NAMES = ['0 - r ankle',
                '1 - r knee',
@@ -19,34 +21,41 @@ JOINT_NAMES = ['0 - r ankle',
                '14 - l elbow',
                '15 - l wrist']
 
+# NOTE(brendan): Index `i` holds the joint that joint `i` becomes when the image
+# is mirrored left-right, e.g. the r ankle (0) becomes the l ankle (5).
+LEFT_RIGHT_FLIPPED_INDICES = [5, 4, 3, 2, 1, 0, 6, 7, 8, 9, 15, 14, 13, 12, 11, 10]
+
 class Joint(object):
     """Class to represent a joint, including x and y position and `is_visible`
     indicating whether the joint is visible or occluded.
+
+    A `Joint` is a view onto one (x, y, is_visible) row of the joints array of
+    an `MpiiDataset`, and holds no data of its own.
     """
-    def __init__(self, x, y, is_visible):
-        self._x = x
-        self._y = y
-        self._is_visible = is_visible
+    __slots__ = ('_xyv',)
+
+    def __init__(self, xyv):
+        self._xyv = xyv
 
     @property
     def x(self):
-        return self._x
+        return float(self._xyv[0])
 
     @property
     def y(self):
-        return self._y
+        return float(self._xyv[1])
 
     @property
     def is_visible(self):
-        return self._is_visible
+        return int(self._xyv[2])
 
 
 class Person(object):
     """A class representing each person in a given image, including their
     joints, objpos and scale.
 
-    The joints should be a list of (x, y) tuples where x and y are both in the
-    range [img_x_max, img_y_max], and the joint ids are as follows,
+    The joints are (x, y) positions where x and y are both in the range
+    [img_x_max, img_y_max], and the joint ids are as follows,
 
     0 - r ankle
     1 - r knee
@@ -65,54 +74,78 @@ class Person(object):
     14 - l elbow
     15 - l wrist
 
+    A `Person` is a view onto one row of the per-person arrays of an
+    `MpiiDataset`, and holds no data of its own.
+
     Attributes:
-        joints: A list of 16 joints for the person, which all default to
-            `None`. Their values are potentially filled in from the MPII
-            dataset annotations.
+        joints: A list of 16 joints for the person, where joints that are not
+            annotated in the MPII dataset are `None`.
+        joints_array: The [16, 3] array of (x, y, is_visible) rows backing
+            `joints`, with NaN rows for unannotated joints.
         objpos: The approximate position of the center of the person in the
             image.
         scale: Scale of the person with respect to 200px.
+        head_rect: `Rectangle` around the person's head, or `None` if there is
+            no head annotation.
     """
     NUM_JOINTS = 16
 
-    def __init__(self, joints, objpos, scale, head_rect):
-        self._joints = Person.NUM_JOINTS*[None]
+    __slots__ = ('_dataset', '_index')
 
-        if not hasattr(joints, '__iter__'):
-            joints = [joints]
+    def __init__(self, dataset, index):
+        self._dataset = dataset
+        self._index = index
 
-        for joint in joints:
-            # NOTE(brendan): Only certain joints have the `is_visible`
-            # annotation, and some images have no `is_visible` annotations at
-            # all. Since the majority of joints are visible, we convert
-            # unannotated joints to visible.
-            # An experiment would be to try the opposite and compare results.
-            if (type(joint.is_visible) is not int):
-                is_visible = 1
+    @property
+    def joints(self):
+        joints = []
+        for xyv in self.joints_array:
+            if np.isnan(xyv[0]):
+                joints.append(None)
             else:
-                is_visible = joint.is_visible
+                joints.append(Joint(xyv))
 
-            self._joints[joint.id] = Joint(joint.x, joint.y, is_visible)
-
-        self._objpos = objpos
-        self._scale = scale
-        self._head_rect = head_rect
+        return joints
 
     @property
-    def joints(self):
-        return self._joints
+    def joints_array(self):
+        return self._dataset.joints[self._index]
 
     @property
     def objpos(self):
-        return self._objpos
+        return Point(*self._dataset.objpos[self._index].tolist())
 
     @property
     def scale(self):
-        return self._scale
+        return float(self._dataset.scale[self._index])
 
     @property
     def head_rect(self):
-        return self._head_rect
+        head_rect = self._dataset.head_rects[self._index]
+        if np.isnan(head_rect[0]):
+            return None
+
+        return Rectangle(head_rect.tolist())
+
+
+class _PeopleInImgs(object):
+    """Sequence of lists of `Person` views, one list per image of an
+    `MpiiDataset`.
+    """
+    __slots__ = ('_dataset',)
+
+    def __init__(self, dataset):
+        self._dataset = dataset
+
+    def __len__(self):
+        return len(self._dataset.img_filenames)
+
+    def __getitem__(self, img_index):
+        people_offsets = self._dataset.people_offsets
+
+        return [Person(self._dataset, person_index)
+                for person_index in range(people_offsets[img_index],
+                                          people_offsets[img_index + 1])]
 
 
 class MpiiDataset(object):
@@ -124,22 +157,99 @@ class MpiiDataset(object):
     Currently only the images and person-centric body joint annotations are
     taken from the dataset.
 
+    The annotations are stored as a struct of arrays, with one row per person,
+    rather than as one Python object per person and per joint. The people in
+    image `i` are the rows `people_offsets[i]:people_offsets[i + 1]`.
+
     Attributes:
         img_filenames: A list of the names of the paths of each image.
-        people_in_imgs: A list of lists of the `Person` class, where each list
+        img_dims: [num_imgs, 2] array of the (width, height) of each image.
+        people_offsets: [num_imgs + 1] array of offsets into the per-person
+            arrays.
+        joints: [num_people, 16, 3] float32 array of (x, y, is_visible) for
+            each joint, with NaN in place of unannotated joints.
+        objpos: [num_people, 2] float64 array of (x, y) person centers.
+        scale: [num_people] float64 array of person scales with respect to
+            200px.
+        head_rects: [num_people, 4] float64 array of (x1, y1, x2, y2) head
+            rectangles, with NaN where there is no head annotation.
+        people_in_imgs: A sequence of lists of `Person` views, where each list
             of `Person`s represents all the people in the image at the same
-            list index. Must be the same length as `img_filenames`.
+            index of `img_filenames`.
     """
-    def __init__(self, img_filenames, people_in_imgs):
-        assert len(img_filenames) == len(people_in_imgs)
+    def __init__(self,
+                 img_filenames,
+                 img_dims,
+                 people_offsets,
+                 joints,
+                 objpos,
+                 scale,
+                 head_rects):
+        assert len(img_filenames) == len(img_dims)
+        assert len(img_filenames) + 1 == len(people_offsets)
+        num_people = people_offsets[-1]
+        assert joints.shape == (num_people, Person.NUM_JOINTS, 3)
+        assert len(objpos) == len(scale) == len(head_rects) == num_people
 
         self._img_filenames = img_filenames
-        self._people_in_imgs = people_in_imgs
+        self._img_dims = img_dims
+        self._people_offsets = people_offsets
+        self._joints = joints
+        self._objpos = objpos
+        self._scale = scale
+        self._head_rects = head_rects
+
+    def take(self, img_indices):
+        """Returns a new `MpiiDataset` containing the images at `img_indices`
+        (in that order), along with the people in those images.
+        """
+        img_indices = np.asarray(img_indices, dtype=np.int64)
+
+        num_people_in_imgs = np.diff(self._people_offsets)[img_indices]
+        people_offsets = np.zeros(len(img_indices) + 1, dtype=np.int64)
+        np.cumsum(num_people_in_imgs, out=people_offsets[1:])
+
+        first_person_indices = self._people_offsets[img_indices]
+        person_indices = (np.arange(people_offsets[-1]) +
+                          np.repeat(first_person_indices - people_offsets[:-1],
+                                    num_people_in_imgs))
+
+        return MpiiDataset([self._img_filenames[index] for index in img_indices],
+                           self._img_dims[img_indices],
+                           people_offsets,
+                           self._joints[person_indices],
+                           self._objpos[person_indices],
+                           self._scale[person_indices],
+                           self._head_rects[person_indices])
 
     @property
     def img_filenames(self):
         return self._img_filenames
 
+    @property
+    def img_dims(self):
+        return self._img_dims
+
+    @property
+    def people_offsets(self):
+        return self._people_offsets
+
+    @property
+    def joints(self):
+        return self._joints
+
+    @property
+    def objpos(self):
+        return self._objpos
+
+    @property
+    def scale(self):
+        return self._scale
+
+    @property
+    def head_rects(self):
+        return self._head_rects
+
     @property
     def people_in_imgs(self):
-        return self._people_in_imgs
+        return _PeopleInImgs(self)
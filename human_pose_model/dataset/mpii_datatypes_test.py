@@ -0,0 +1,109 @@
+"""Tests for the array-backed `MpiiDataset` and its `Person` and `Joint`
+views.
+"""
+import unittest
+import numpy as np
+from dataset.mpii_datatypes import (JOINT_NAMES,
+                                    LEFT_RIGHT_FLIPPED_INDICES,
+                                    MpiiDataset,
+                                    Person)
+
+class MpiiDatasetTest(unittest.TestCase):
+    def setUp(self):
+        # NOTE(brendan): Three images, with two, zero and one people. Person
+        # `i` has objpos (i, i), scale `i` and joints (i, joint index), except
+        # for joint 3 of person 0, which is unannotated.
+        num_people = 3
+        joints = np.zeros([num_people, Person.NUM_JOINTS, 3], dtype=np.float32)
+        joints[:, :, 0] = np.arange(num_people)[:, np.newaxis]
+        joints[:, :, 1] = np.arange(Person.NUM_JOINTS)
+        joints[:, :, 2] = 1
+        joints[0, 3] = np.nan
+
+        self._dataset = MpiiDataset(
+            ['a.jpg', 'b.jpg', 'c.jpg'],
+            np.array([[640, 480], [320, 240], [1280, 720]], dtype=np.int64),
+            np.array([0, 2, 2, 3], dtype=np.int64),
+            joints,
+            np.array([[0, 0], [1, 1], [2, 2]], dtype=np.float64),
+            np.array([0.0, 1.0, 2.0]),
+            np.array([[1, 2, 11, 22], [np.nan]*4, [3, 4, 13, 24]], dtype=np.float64))
+
+    def test_people_in_imgs(self):
+        people_in_imgs = self._dataset.people_in_imgs
+
+        self.assertEqual(len(people_in_imgs), 3)
+        self.assertEqual([len(people_in_imgs[i]) for i in range(3)], [2, 0, 1])
+        self.assertEqual([person.scale for person in people_in_imgs[0]], [0.0, 1.0])
+        self.assertEqual(people_in_imgs[2][0].scale, 2.0)
+
+    def test_person_attributes(self):
+        first_person, second_person = self._dataset.people_in_imgs[0]
+
+        self.assertEqual((second_person.objpos.x, second_person.objpos.y), (1.0, 1.0))
+        self.assertIsNone(second_person.head_rect)
+        self.assertEqual(second_person.joints_array.shape, (Person.NUM_JOINTS, 3))
+
+        self.assertEqual(first_person.head_rect.get_width(), 10)
+        self.assertEqual(first_person.head_rect.get_height(), 20)
+
+    def test_joints(self):
+        joints = self._dataset.people_in_imgs[0][0].joints
+
+        self.assertEqual(len(joints), Person.NUM_JOINTS)
+        self.assertIsNone(joints[3])
+        self.assertEqual((joints[5].x, joints[5].y, joints[5].is_visible),
+                         (0.0, 5.0, 1))
+
+    def test_views_share_data(self):
+        person = self._dataset.people_in_imgs[2][0]
+
+        self._dataset.joints[2, 0, 0] = 100
+        self.assertEqual(person.joints[0].x, 100.0)
+
+    def test_take_reorders_images_and_people(self):
+        taken = self._dataset.take([2, 1, 0])
+
+        self.assertEqual(taken.img_filenames, ['c.jpg', 'b.jpg', 'a.jpg'])
+        np.testing.assert_array_equal(taken.img_dims,
+                                      [[1280, 720], [320, 240], [640, 480]])
+        np.testing.assert_array_equal(taken.people_offsets, [0, 1, 1, 3])
+        np.testing.assert_array_equal(taken.scale, [2.0, 0.0, 1.0])
+        np.testing.assert_array_equal(taken.objpos, [[2, 2], [0, 0], [1, 1]])
+        np.testing.assert_array_equal(taken.joints[1:], self._dataset.joints[0:2])
+        np.testing.assert_array_equal(taken.head_rects[0], self._dataset.head_rects[2])
+
+    def test_take_repeats_and_subsets(self):
+        taken = self._dataset.take([0, 0])
+
+        np.testing.assert_array_equal(taken.people_offsets, [0, 2, 4])
+        np.testing.assert_array_equal(taken.scale, [0.0, 1.0, 0.0, 1.0])
+
+    def test_take_images_without_people(self):
+        taken = self._dataset.take([1])
+
+        self.assertEqual(taken.img_filenames, ['b.jpg'])
+        np.testing.assert_array_equal(taken.people_offsets, [0, 0])
+        self.assertEqual(taken.joints.shape, (0, Person.NUM_JOINTS, 3))
+        self.assertEqual(taken.people_in_imgs[0], [])
+
+
+class LeftRightFlippedIndicesTest(unittest.TestCase):
+    def test_flipping_twice_is_identity(self):
+        self.assertEqual(sorted(LEFT_RIGHT_FLIPPED_INDICES), list(range(Person.NUM_JOINTS)))
+        for joint_index, flipped_index in enumerate(LEFT_RIGHT_FLIPPED_INDICES):
+            self.assertEqual(LEFT_RIGHT_FLIPPED_INDICES[flipped_index], joint_index)
+
+    def test_flipped_joints_swap_sides(self):
+        swapped_sides = {'r': 'l', 'l': 'r'}
+        for joint_index, flipped_index in enumerate(LEFT_RIGHT_FLIPPED_INDICES):
+            joint_name = JOINT_NAMES[joint_index].split(' - ')[1].split(' ')
+            flipped_name = JOINT_NAMES[flipped_index].split(' - ')[1].split(' ')
+            if joint_name[0] in swapped_sides:
+                joint_name[0] = swapped_sides[joint_name[0]]
+
+            self.assertEqual(joint_name, flipped_name)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -40,8 +40,11 @@ import sys
 import os
 import scipy.io
 import numpy as np
-from dataset.shapes import Rectangle
+from PIL import Image
 from dataset.mpii_datatypes import Person, MpiiDataset
+from dataset.mpii_cache import (get_mpii_cache_filepath,
+                                load_mpii_cache,
+                                save_mpii_cache)
 
 def _make_iterable(maybe_iterable):
     """Checks whether `maybe_iterable` is iterable, and if not returns an
@@ -61,6 +64,29 @@ def _make_iterable(maybe_iterable):
     return maybe_iterable
 
 
+def _parse_person_joints(annopoints):
+    """Parses the `annopoints.point` annotations of one person into a
+    [Person.NUM_JOINTS, 3] array of (x, y, is_visible) rows, with NaN rows for
+    the joints that are not annotated.
+    """
+    joints = np.full((Person.NUM_JOINTS, 3), np.nan, dtype=np.float32)
+
+    for joint in _make_iterable(annopoints):
+        # NOTE(brendan): Only certain joints have the `is_visible`
+        # annotation, and some images have no `is_visible` annotations at
+        # all. Since the majority of joints are visible, we convert
+        # unannotated joints to visible.
+        # An experiment would be to try the opposite and compare results.
+        if (type(joint.is_visible) is not int):
+            is_visible = 1
+        else:
+            is_visible = joint.is_visible
+
+        joints[joint.id] = (joint.x, joint.y, is_visible)
+
+    return joints
+
+
 def _parse_annotation(img_annotation,
                       single_person_list,
                       mpii_images_dir,
@@ -82,8 +108,10 @@ def _parse_annotation(img_annotation,
     Returns:
         img_abs_filepath: Filepath of the image corresponding to
             `img_annotation`.
-        people: A list of `Person`s corresponding to the annotated people in
-            the image.
+        people: A list of (joints, objpos, scale, head_rect) tuples
+            corresponding to the annotated people in the image, where `joints`
+            is a [Person.NUM_JOINTS, 3] array from `_parse_person_joints`,
+            `objpos` is (x, y) and `head_rect` is (x1, y1, x2, y2).
     """
     img_abs_filepath = os.path.join(mpii_images_dir,
                                     img_annotation.image.name)
@@ -104,88 +132,77 @@ def _parse_annotation(img_annotation,
         except AttributeError:
             continue
 
+        objpos = (objpos.x, objpos.y)
         try:
-            head_rect = Rectangle((img_annorect.x1, img_annorect.y1,
-                                   img_annorect.x2, img_annorect.y2))
-            person = Person(img_annorect.annopoints.point,
-                            objpos,
-                            scale,
-                            head_rect)
-            people.append(person)
+            head_rect = (img_annorect.x1, img_annorect.y1,
+                         img_annorect.x2, img_annorect.y2)
+            joints = _parse_person_joints(img_annorect.annopoints.point)
         except AttributeError:
             if is_train:
                 continue
 
-            people.append(Person([], objpos, scale))
+            head_rect = 4*(np.nan,)
+            joints = _parse_person_joints([])
 
-    return img_abs_filepath, people
+        people.append((joints, objpos, scale, head_rect))
 
+    return img_abs_filepath, people
 
-def _shuffle_list(list_l, shuffled_indices):
-    """Shuffles list_l by re-ordering the list based on the indices in
-    shuffled_indices.
 
-    Args:
-        list_l: List to be shuffled.
-        shuffled_indices: Set of indices containing [0:len(list_l)), which is
-            assumed to have already been shuffled.
+def _read_img_dims(img_filenames):
+    """Reads the dimensions of each image in `img_filenames` from its header,
+    without decoding the image.
 
     Returns:
-        List with all the same elements as `list_l`, in the shuffled order given
-        by `shuffled_indices`.
+        [len(img_filenames), 2] array of the (width, height) of each image.
     """
-    return [list_l[index] for index in shuffled_indices]
+    img_dims = np.empty((len(img_filenames), 2), dtype=np.int64)
+    for img_index, img_filename in enumerate(img_filenames):
+        with Image.open(img_filename) as img:
+            img_dims[img_index] = img.size
 
+    return img_dims
 
-def _shuffle_dataset(img_filenames, people_in_imgs):
-    """Shuffles the list of filenames and labels in the MPII dataset.
+
+def _shuffle_dataset(mpii_dataset):
+    """Shuffles the images, and the people in them, in the MPII dataset.
 
     Args:
-        img_filenames: List of filenames in the MPII dataset to be shuffled.
-        people_in_imgs: List of `Person`s in the MPII dataset, to be shuffled.
+        mpii_dataset: `MpiiDataset` to be shuffled.
+
+    Returns:
+        A new `MpiiDataset` with the images of `mpii_dataset` in random order.
     """
-    img_indices = list(range(len(img_filenames)))
-    np.random.shuffle(img_indices)
+    img_indices = np.random.permutation(len(mpii_dataset.img_filenames))
 
-    img_filenames = _shuffle_list(img_filenames, img_indices)
-    people_in_imgs = _shuffle_list(people_in_imgs, img_indices)
+    return mpii_dataset.take(img_indices)
 
-    return img_filenames, people_in_imgs
 
+def _parse_mpii_annotations(mpii_dataset_mat, mpii_images_dir, is_train):
+    """Parses the annotations out of `mpii_dataset_mat`, in the order in which
+    they appear in the .mat file.
 
-def parse_mpii_data_from_mat(mpii_dataset_mat, mpii_images_dir, is_train):
-    """Parses the training data out of `mpii_dataset_mat` into a `MpiiDataset`
-    Python object.
-
-    To save time during debugging sessions, you can manually get
-    `mpii_dataset_mat` using `scipy.io.loadmat` once, and then iteratively call
-    this function as you make changes, without reloading the .mat file.
-
-    Args:
-        mpii_dataset_mat: A dictionary of MATLAB structures loaded using
-            `scipy.io.loadmat`. The arguments `struct_as_record = False` and
-            `squeeze_me = True` must be set in the `loadmat` call.
-        mpii_images_dir: The path of the directory where all the MPII images
-            are stored.
-        is_train: Parse training data (True), or test data (False)?
+    See `parse_mpii_data_from_mat` for a description of the arguments.
 
-    Returns: An `MpiiDataset` Python object correspodning to
-        `mpii_dataset_mat`.
+    Returns:
+        An `MpiiDataset` of the images on disk with at least one usable
+        person.
     """
     mpii_annotations = mpii_dataset_mat.annolist
     train_or_test = mpii_dataset_mat.img_train
 
     img_filenames = []
-    people_in_imgs = []
+    people = []
+    people_offsets = [0]
     filenames_on_disk = set(os.listdir(mpii_images_dir))
     for img_index in range(len(mpii_annotations)):
         if train_or_test[img_index] == int(is_train):
             single_person_list = _make_iterable(mpii_dataset_mat.single_person[img_index])
-            img_abs_filepath, people = _parse_annotation(mpii_annotations[img_index],
-                                                         single_person_list,
-                                                         mpii_images_dir,
-                                                         is_train)
-            if len(people) == 0:
+            img_abs_filepath, people_in_img = _parse_annotation(mpii_annotations[img_index],
+                                                                single_person_list,
+                                                                mpii_images_dir,
+                                                                is_train)
+            if len(people_in_img) == 0:
                 continue
 
             # NOTE(brendan): There are annotations in the MPII dataset for
@@ -196,34 +213,97 @@ def parse_mpii_data_from_mat(mpii_dataset_mat, mpii_images_dir, is_train):
                 continue
 
             img_filenames.append(img_abs_filepath)
-            people_in_imgs.append(people)
+            people.extend(people_in_img)
+            people_offsets.append(len(people))
+
+    if len(people) == 0:
+        joints = np.empty((0, Person.NUM_JOINTS, 3), dtype=np.float32)
+        objpos = np.empty((0, 2), dtype=np.float64)
+        scale = np.empty(0, dtype=np.float64)
+        head_rects = np.empty((0, 4), dtype=np.float64)
+    else:
+        joints, objpos, scale, head_rects = zip(*people)
+        joints = np.stack(joints)
+        objpos = np.array(objpos, dtype=np.float64)
+        scale = np.array(scale, dtype=np.float64)
+        head_rects = np.array(head_rects, dtype=np.float64)
+
+    return MpiiDataset(img_filenames,
+                       _read_img_dims(img_filenames),
+                       np.array(people_offsets, dtype=np.int64),
+                       joints,
+                       objpos,
+                       scale,
+                       head_rects)
 
-    img_filenames, people_in_imgs = _shuffle_dataset(img_filenames,
-                                                     people_in_imgs)
 
-    return MpiiDataset(img_filenames, people_in_imgs)
+def parse_mpii_data_from_mat(mpii_dataset_mat, mpii_images_dir, is_train):
+    """Parses the training data out of `mpii_dataset_mat` into a `MpiiDataset`
+    Python object.
 
+    To save time during debugging sessions, you can manually get
+    `mpii_dataset_mat` using `scipy.io.loadmat` once, and then iteratively call
+    this function as you make changes, without reloading the .mat file.
 
-def mpii_read(mpii_dataset_filepath, is_train):
+    Args:
+        mpii_dataset_mat: A dictionary of MATLAB structures loaded using
+            `scipy.io.loadmat`. The arguments `struct_as_record = False` and
+            `squeeze_me = True` must be set in the `loadmat` call.
+        mpii_images_dir: The path of the directory where all the MPII images
+            are stored.
+        is_train: Parse training data (True), or test data (False)?
+
+    Returns: An `MpiiDataset` Python object correspodning to
+        `mpii_dataset_mat`.
+    """
+    mpii_dataset = _parse_mpii_annotations(mpii_dataset_mat,
+                                           mpii_images_dir,
+                                           is_train)
+
+    return _shuffle_dataset(mpii_dataset)
+
+
+def mpii_read(mpii_dataset_filepath, is_train, use_cache=True, cache_dir=None):
     """
     Note that the images are assumed to reside in a folder one up from the .mat
     file that is being parsed (i.e. ../images).
 
+    Unless `use_cache` is False, the parsed annotations are cached on disk the
+    first time they are read, and subsequent reads of the same, unmodified,
+    .mat file are served from the cache. See `dataset.mpii_cache`.
+
     Args:
         mpii_dataset_filepath: The filepath to the .mat file provided from the
             MPII Human Pose website.
         is_train: Read training data (True), or test data (False)?
+        use_cache: Read from, and write to, the annotation cache?
+        cache_dir: Directory to keep the annotation cache in. Defaults to the
+            directory of the .mat file.
 
-    Returns: Parsed `MpiiDataset` object from `parse_mpii_data_from_mat`.
+    Returns: Parsed `MpiiDataset` object, in a random order.
     """
-    mpii_dataset_mat = scipy.io.loadmat(mpii_dataset_filepath,
-                                        struct_as_record=False,
-                                        squeeze_me=True)['RELEASE']
-
-    mpii_dataset_dir = os.path.dirname(mpii_dataset_filepath)
-    mpii_images_dir = os.path.join(mpii_dataset_dir, '../images')
-
-    return parse_mpii_data_from_mat(mpii_dataset_mat, mpii_images_dir, is_train)
+    mpii_dataset = None
+    if use_cache:
+        cache_filepath = get_mpii_cache_filepath(mpii_dataset_filepath,
+                                                 is_train,
+                                                 cache_dir)
+        mpii_dataset = load_mpii_cache(cache_filepath, mpii_dataset_filepath)
+
+    if mpii_dataset is None:
+        mpii_dataset_mat = scipy.io.loadmat(mpii_dataset_filepath,
+                                            struct_as_record=False,
+                                            squeeze_me=True)['RELEASE']
+
+        mpii_dataset_dir = os.path.dirname(mpii_dataset_filepath)
+        mpii_images_dir = os.path.join(mpii_dataset_dir, '../images')
+
+        mpii_dataset = _parse_mpii_annotations(mpii_dataset_mat,
+                                               mpii_images_dir,
+                                               is_train)
+        if use_cache:
+            save_mpii_cache(cache_filepath, mpii_dataset_filepath, mpii_dataset)
+
+    return _shuffle_dataset(mpii_dataset)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,241 @@
+"""Plans how each person in an `MpiiDataset` is cropped out of their image
+and labeled, for all people at once and without reading any images.
+"""
+import numpy as np
+
+class PersonCrops(object):
+    """The crop, padding and normalized joint labels of every person in an
+    `MpiiDataset`, computed up front by `plan_person_crops`.
+
+    All attributes are arrays with one row per person, in the same order as the
+    people in the `MpiiDataset`.
+
+    Attributes:
+        top_left: [num_people, 2] (x, y) offsets of the crop around each person
+            in the original image.
+        crop_dims: [num_people, 2] (width, height) of each crop.
+        padding: [num_people, 2] (x_padding, y_padding) needed to pad each crop
+            to a square, at least one of which will be zero.
+        padded_dim: [num_people] edge length of each padded, square crop.
+        x_joints, y_joints: [num_people, Person.NUM_JOINTS] joint coordinates
+            relative to the center of each crop, scaled to [-0.5, 0.5].
+        is_labeled: [num_people, Person.NUM_JOINTS] boolean mask of the joints
+            that are annotated and lie inside the crop.
+        is_visible: [num_people, Person.NUM_JOINTS] visibility of each joint.
+        head_size: [num_people] head segment length, relative to
+            `padded_dim`, as used by the PCKh metric.
+    """
+    def __init__(self,
+                 top_left,
+                 crop_dims,
+                 padding,
+                 padded_dim,
+                 x_joints,
+                 y_joints,
+                 is_labeled,
+                 is_visible,
+                 head_size):
+        self._top_left = top_left
+        self._crop_dims = crop_dims
+        self._padding = padding
+        self._padded_dim = padded_dim
+        self._x_joints = x_joints
+        self._y_joints = y_joints
+        self._is_labeled = is_labeled
+        self._is_visible = is_visible
+        self._head_size = head_size
+
+    @property
+    def top_left(self):
+        return self._top_left
+
+    @property
+    def crop_dims(self):
+        return self._crop_dims
+
+    @property
+    def padding(self):
+        return self._padding
+
+    @property
+    def padded_dim(self):
+        return self._padded_dim
+
+    @property
+    def x_joints(self):
+        return self._x_joints
+
+    @property
+    def y_joints(self):
+        return self._y_joints
+
+    @property
+    def is_labeled(self):
+        return self._is_labeled
+
+    @property
+    def is_visible(self):
+        return self._is_visible
+
+    @property
+    def head_size(self):
+        return self._head_size
+
+    def get_sparse_labels(self, person_index):
+        """Returns the labels of one person in the sparse format written to
+        each Example.
+
+        Not all joints are labeled for each person, so the x and y joint
+        coordinates come with a sparse list of indices, where each index
+        indicates which joint is labeled.
+
+        Returns:
+            (x_sparse_joints, y_sparse_joints, sparse_joint_indices,
+            is_visible_list) tuple of lists.
+
+            Visually: `x_sparse_joints` [x0, x1, x2]
+                      `y_sparse_joints` [y0, y1, y2]
+                      `sparse_joint_indices` [0, 1, 3]
+
+                      The above corresponds to a person for whom (x0, y0),
+                      (x1, y1) and (x2, y2) are joints 0, 1 and 3 (indexed 0-15
+                      in (x, y) pairs as in the MPII dataset), respectively.
+        """
+        sparse_joint_indices = np.flatnonzero(self._is_labeled[person_index])
+
+        return (self._x_joints[person_index, sparse_joint_indices].tolist(),
+                self._y_joints[person_index, sparse_joint_indices].tolist(),
+                sparse_joint_indices.tolist(),
+                self._is_visible[person_index, sparse_joint_indices].tolist())
+
+
+def _find_person_bounding_boxes(objpos, scale, img_dims):
+    """Finds an enclosing bounding box for every person, given their `objpos`
+    and `scale`, and the dimensions of the images they are in.
+
+    Currently the bounding box is found by taking the
+    (scale*200px) by (scale*200px) rectangle centered around `objpos`.
+
+    One experiment would be to take the bounding box found with the current
+    method, and expand or shrink each dimension to the minimum spanning
+    rectangle such that all the labelled joints are contained.
+
+    Args:
+        objpos: [num_people, 2] (x, y) centers of each person.
+        scale: [num_people] MPII scale of each person.
+        img_dims: [num_people, 2] (width, height) of the image each person is
+            in.
+
+    Returns:
+        [num_people, 4] array of (x1, y1, x2, y2) boxes bounding each person,
+        clamped to the edges of their image.
+    """
+    # NOTE(brendan): The MPII `scale` is with respect to 200px object height,
+    # and `objpos` is at the person's center.
+    person_half_dim = 100*scale[:, np.newaxis]
+
+    corners = np.concatenate([objpos - person_half_dim, objpos + person_half_dim],
+                             axis=1)
+
+    return np.clip(corners, 0, np.tile(img_dims, 2))
+
+
+def _find_padded_person_dims(crop_dims):
+    """Finds the large dimension and padding needed to make the bounding box
+    around each person square.
+
+    Args:
+        crop_dims: [num_people, 2] (width, height) of each bounding box.
+
+    Returns:
+        padded_dim: [num_people] larger dimension of each bounding box.
+        padding: [num_people, 2] (padding_x, padding_y) for each person, at
+            least one of which will be zero.
+    """
+    person_width = crop_dims[:, 0]
+    person_height = crop_dims[:, 1]
+    pad = np.abs(person_height - person_width)/2
+    is_taller = person_height > person_width
+
+    padding = np.stack([np.where(is_taller, pad, 0), np.where(is_taller, 0, pad)],
+                       axis=1)
+    padded_dim = np.maximum(person_width, person_height)
+
+    return padded_dim, padding
+
+
+def _extract_labeled_joints(joints, top_left, crop_dims, padded_dim):
+    """Translates and scales the joints of every person to be relative to the
+    center of their crop, in the range [-0.5, 0.5].
+
+    Args:
+        joints: [num_people, Person.NUM_JOINTS, 3] (x, y, is_visible) joints,
+            with NaN rows for unlabeled joints.
+        top_left: [num_people, 2] (x, y) offsets of each crop.
+        crop_dims: [num_people, 2] (width, height) of each crop.
+        padded_dim: [num_people] edge length of each padded crop.
+
+    Returns:
+        (x_joints, y_joints, is_labeled) tuple of [num_people,
+        Person.NUM_JOINTS] arrays, where `is_labeled` is False for joints that
+        are unlabeled or outside of the crop.
+    """
+    xy = joints[..., 0:2]
+    bottom_right = top_left + crop_dims
+    crop_center = top_left + crop_dims/2
+
+    # NOTE: Comparisons with NaN are False, so unlabeled joints are masked
+    # out here along with joints outside of the crop.
+    with np.errstate(invalid='ignore'):
+        is_labeled = np.all((top_left[:, np.newaxis] <= xy) &
+                            (xy <= bottom_right[:, np.newaxis]),
+                            axis=2)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        scaled_xy = np.clip((xy - crop_center[:, np.newaxis])/padded_dim[:, np.newaxis, np.newaxis],
+                            -0.5,
+                            0.5)
+
+    return scaled_xy[..., 0], scaled_xy[..., 1], is_labeled
+
+
+def plan_person_crops(mpii_dataset):
+    """Computes the crop rectangle, padding, normalized joint coordinates and
+    head size of every person in `mpii_dataset`, in one pass over the
+    dataset's arrays and without reading any images.
+
+    Returns:
+        A `PersonCrops` with one row per person in `mpii_dataset`.
+    """
+    num_people_in_imgs = np.diff(mpii_dataset.people_offsets)
+    img_dims = np.repeat(mpii_dataset.img_dims, num_people_in_imgs, axis=0)
+
+    corners = _find_person_bounding_boxes(mpii_dataset.objpos,
+                                          mpii_dataset.scale,
+                                          img_dims)
+    top_left = corners[:, 0:2]
+    crop_dims = corners[:, 2:4] - top_left
+
+    padded_dim, padding = _find_padded_person_dims(crop_dims)
+
+    x_joints, y_joints, is_labeled = _extract_labeled_joints(mpii_dataset.joints,
+                                                             top_left,
+                                                             crop_dims,
+                                                             padded_dim)
+
+    is_visible = np.nan_to_num(mpii_dataset.joints[..., 2]).astype(np.int64)
+
+    head_rects = mpii_dataset.head_rects
+    with np.errstate(invalid='ignore', divide='ignore'):
+        head_dims = (head_rects[:, 2:4] - head_rects[:, 0:2])/padded_dim[:, np.newaxis]
+    head_size = 0.6*np.sqrt(np.sum(np.square(head_dims), axis=1))
+
+    return PersonCrops(top_left,
+                       crop_dims,
+                       padding,
+                       padded_dim,
+                       x_joints,
+                       y_joints,
+                       is_labeled,
+                       is_visible,
+                       head_size)
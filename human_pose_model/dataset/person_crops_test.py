@@ -0,0 +1,67 @@
+"""Tests for the crops and labels planned for every person in an
+`MpiiDataset`.
+"""
+import unittest
+import numpy as np
+from dataset.mpii_datatypes import MpiiDataset, Person
+from dataset.person_crops import plan_person_crops
+
+class PlanPersonCropsTest(unittest.TestCase):
+    def setUp(self):
+        joints = np.full([2, Person.NUM_JOINTS, 3], np.nan, dtype=np.float32)
+        joints[0, 0] = [150, 100, 1]
+        joints[0, 1] = [350, 150, 1]
+        joints[0, 2] = [300, 250, 0]
+        joints[1, 0] = [20, 150, 1]
+
+        self._dataset = MpiiDataset(['a.jpg'],
+                                    np.array([[400, 300]], dtype=np.int64),
+                                    np.array([0, 2], dtype=np.int64),
+                                    joints,
+                                    np.array([[200, 150], [20, 150]], dtype=np.float64),
+                                    np.array([1.0, 0.5]),
+                                    np.array([[180, 60, 220, 90],
+                                              [np.nan]*4]))
+
+        self._crops = plan_person_crops(self._dataset)
+
+    def test_crop_rectangles(self):
+        np.testing.assert_array_equal(self._crops.top_left, [[100, 50], [0, 100]])
+        np.testing.assert_array_equal(self._crops.crop_dims, [[200, 200], [70, 100]])
+
+    def test_padding_to_square(self):
+        np.testing.assert_array_equal(self._crops.padded_dim, [200, 100])
+        np.testing.assert_array_equal(self._crops.padding, [[0, 0], [15, 0]])
+
+    def test_labeled_joints(self):
+        is_labeled = self._crops.is_labeled
+        self.assertTrue(is_labeled[0, 0])
+        self.assertFalse(is_labeled[0, 1])
+        self.assertTrue(is_labeled[0, 2])
+        self.assertFalse(is_labeled[0, 3])
+        self.assertEqual(np.count_nonzero(is_labeled), 3)
+
+        self.assertAlmostEqual(self._crops.x_joints[0, 0], -0.25)
+        self.assertAlmostEqual(self._crops.y_joints[0, 0], -0.25)
+        self.assertAlmostEqual(self._crops.x_joints[0, 2], 0.5)
+        self.assertAlmostEqual(self._crops.y_joints[0, 2], 0.5)
+        self.assertAlmostEqual(self._crops.x_joints[1, 0], -0.15)
+        self.assertAlmostEqual(self._crops.y_joints[1, 0], 0.0)
+
+        np.testing.assert_array_equal(self._crops.is_visible[0, 0:4], [1, 1, 0, 0])
+
+    def test_head_size(self):
+        self.assertAlmostEqual(self._crops.head_size[0], 0.6*0.25)
+        self.assertTrue(np.isnan(self._crops.head_size[1]))
+
+    def test_sparse_labels(self):
+        x_joints, y_joints, joint_indices, is_visible = self._crops.get_sparse_labels(0)
+
+        self.assertEqual(joint_indices, [0, 2])
+        np.testing.assert_allclose(x_joints, [-0.25, 0.5])
+        np.testing.assert_allclose(y_joints, [-0.25, 0.5])
+        self.assertEqual(is_visible, [1, 0])
+
+
+if __name__ == "__main__":
+    unittest.main()
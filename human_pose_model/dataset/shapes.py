@@ -2,12 +2,16 @@
 """
 
 class Point(object):
+    __slots__ = ('x', 'y')
+
     def __init__(self, x, y):
         self.x = x
         self.y = y
 
 
 class Rectangle(object):
+    __slots__ = ('top_left', 'bottom_right')
+
     def __init__(self, rect):
         self.top_left = Point(rect[0], rect[1])
         self.bottom_right = Point(rect[2], rect[3])
@@ -0,0 +1,66 @@
+"""Splits the images of an `MpiiDataset` into the shards written by
+`write_tf_record`, before any images are read.
+"""
+import os
+import numpy as np
+
+def _estimate_example_bytes(mpii_dataset, image_dim):
+    """Estimates the size in bytes of the JPEG image written in each example
+    of each image in `mpii_dataset`, without reading any images.
+
+    The estimate assumes that the output JPEG has the same bytes per pixel as
+    the source JPEG, and that every example is `image_dim*image_dim` pixels.
+
+    Args:
+        mpii_dataset: `MpiiDataset` to write.
+        image_dim: Dimension of the square images that will be written.
+
+    Returns:
+        [num_imgs] array of the estimated bytes per example of each image.
+    """
+    img_file_bytes = np.array([os.path.getsize(img_filename)
+                               for img_filename in mpii_dataset.img_filenames],
+                              dtype=np.float64)
+    img_pixels = np.prod(mpii_dataset.img_dims, axis=1)
+
+    return img_file_bytes*(image_dim**2)/img_pixels
+
+
+def plan_shards(mpii_dataset, num_shards, image_dim):
+    """Assigns the images in `mpii_dataset` to `num_shards` shards, such that
+    each shard holds about the same number of examples and about the same
+    number of bytes.
+
+    Images contain differing numbers of people, and therefore produce
+    differing numbers of examples, so splitting the images evenly by count
+    gives unevenly sized shards. Here images are instead assigned greedily,
+    largest first, to the shard whose larger load (fraction of all examples,
+    or fraction of all estimated bytes) would be smallest after adding the
+    image.
+
+    Args:
+        mpii_dataset: `MpiiDataset` to write.
+        num_shards: Number of shards to split `mpii_dataset` into.
+        image_dim: Dimension of the square images that will be written.
+
+    Returns:
+        A list of `num_shards` arrays of image indices, where each array is in
+        the order of `mpii_dataset` (i.e. still shuffled).
+    """
+    num_examples_in_imgs = np.diff(mpii_dataset.people_offsets)
+    est_img_bytes = num_examples_in_imgs*_estimate_example_bytes(mpii_dataset,
+                                                                 image_dim)
+
+    img_costs = np.stack([num_examples_in_imgs/max(np.sum(num_examples_in_imgs), 1),
+                          est_img_bytes/max(np.sum(est_img_bytes), 1)],
+                         axis=1)
+
+    shard_loads = np.zeros((num_shards, 2))
+    img_shards = np.empty(len(img_costs), dtype=np.int64)
+    for img_index in np.argsort(-np.max(img_costs, axis=1), kind='stable'):
+        shard_index = np.argmin(np.max(shard_loads + img_costs[img_index], axis=1))
+        img_shards[img_index] = shard_index
+        shard_loads[shard_index] += img_costs[img_index]
+
+    return [np.flatnonzero(img_shards == shard_index)
+            for shard_index in range(num_shards)]
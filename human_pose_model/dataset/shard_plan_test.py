@@ -0,0 +1,82 @@
+"""Tests for the split of an `MpiiDataset` into balanced shards."""
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from dataset import shard_plan
+from dataset.mpii_datatypes import MpiiDataset, Person
+
+class PlanShardsTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._tmp_dir)
+
+    def _make_dataset(self, num_people_in_imgs, img_file_bytes, img_dims):
+        """Returns an `MpiiDataset` of images with `img_file_bytes` bytes on
+        disk, and `num_people_in_imgs` people in each.
+        """
+        img_filenames = []
+        for img_index, file_bytes in enumerate(img_file_bytes):
+            img_filename = os.path.join(self._tmp_dir, '{}.jpg'.format(img_index))
+            with open(img_filename, 'wb') as f:
+                f.write(b'\0'*file_bytes)
+            img_filenames.append(img_filename)
+
+        people_offsets = np.concatenate([[0], np.cumsum(num_people_in_imgs)])
+        num_people = people_offsets[-1]
+
+        return MpiiDataset(img_filenames,
+                           np.array(img_dims, dtype=np.int64),
+                           people_offsets.astype(np.int64),
+                           np.full([num_people, Person.NUM_JOINTS, 3], np.nan,
+                                   dtype=np.float32),
+                           np.zeros([num_people, 2]),
+                           np.ones(num_people),
+                           np.full([num_people, 4], np.nan))
+
+    def test_estimate_example_bytes(self):
+        dataset = self._make_dataset([1, 1], [1000, 3000], [[100, 100], [100, 300]])
+
+        np.testing.assert_allclose(
+            shard_plan._estimate_example_bytes(dataset, 10), [10.0, 10.0])
+
+    def test_shards_balance_examples(self):
+        num_people_in_imgs = [4, 1, 1, 1, 1, 2, 2, 4]
+        dataset = self._make_dataset(num_people_in_imgs,
+                                     [1000]*len(num_people_in_imgs),
+                                     [[100, 100]]*len(num_people_in_imgs))
+
+        shards = shard_plan.plan_shards(dataset, 2, 10)
+
+        self.assertEqual(len(shards), 2)
+        self.assertEqual(sorted(np.concatenate(shards).tolist()),
+                         list(range(len(num_people_in_imgs))))
+        for img_indices in shards:
+            self.assertEqual(img_indices.tolist(), sorted(img_indices.tolist()))
+            self.assertEqual(np.sum(np.array(num_people_in_imgs)[img_indices]), 8)
+
+    def test_shards_balance_bytes(self):
+        dataset = self._make_dataset([1, 1, 1, 1],
+                                     [4000, 1000, 1000, 4000],
+                                     [[100, 100]]*4)
+
+        shards = shard_plan.plan_shards(dataset, 2, 10)
+
+        for img_indices in shards:
+            self.assertEqual(len(img_indices), 2)
+            self.assertEqual(len(set(img_indices.tolist()) & {0, 3}), 1)
+
+    def test_more_shards_than_images(self):
+        dataset = self._make_dataset([1, 2], [1000, 1000], [[100, 100]]*2)
+
+        shards = shard_plan.plan_shards(dataset, 3, 10)
+
+        self.assertEqual(sorted(len(img_indices) for img_indices in shards),
+                         [0, 1, 1])
+
+
+if __name__ == "__main__":
+    unittest.main()
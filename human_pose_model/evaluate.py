@@ -1,32 +1,39 @@
+import collections
+import json
 import math
 import os
+import time
 import numpy as np
 from tqdm import tqdm
 import tensorflow as tf
 import tensorflow.contrib.slim as slim
+from pose_utils import flip_tta
+from pose_utils import pckh
 from pose_utils import pose_util
 from dataset.mpii_datatypes import Person, JOINT_NAMES
-from pose_utils.sparse_to_dense import sparse_joints_to_dense
 from input_pipeline import setup_eval_input_pipeline
 from networks.inference import inference
+from pose_utils.pose_flags import FLAGS
 import pandas
 
-def _get_points_from_flattened_joints(x_joints, y_joints, batch_size):
-    """Takes in a list of batches of x and y joint coordinates, and returns a
-    list of batches of tuples (x, y) of joint points.
-    """
-    joint_points = []
-    for batch_index in range(batch_size):
-        joint_points.append([(x, y) for (x, y) in zip(x_joints[batch_index], y_joints[batch_index])])
-
-    return np.array(joint_points)
+EVALUATED_CHECKPOINTS_FILENAME = 'last_evaluated_checkpoint.json'
+EVAL_LOG_FILENAME = 'eval_log'
 
-def setup_val_loss_op(num_gpus, eval_batch, image_dim, network_name, loss_name):
+def setup_val_loss_op(num_gpus,
+                      eval_batch,
+                      image_dim,
+                      network_name,
+                      loss_name,
+                      use_flip_tta=False):
     """Creates the inference part of the validation graph, and returns the
     total loss calculated across all `num_gpus` used to do the evaluation.
 
     Also returns the concatenated list of per-tower logits, which are used as
     predictions for the batch of examples.
+
+    If `use_flip_tta` is set, each tower's batch is concatenated with its
+    mirrored copy (along with mirrored ground truth, for the loss), and the
+    logits predicted for both are averaged. See `pose_utils.flip_tta`.
     """
     images_split = tf.split(value=eval_batch.images,
                             num_or_size_splits=num_gpus,
@@ -49,11 +56,28 @@ def setup_val_loss_op(num_gpus, eval_batch, image_dim, network_name, loss_name):
     for gpu_index in range(num_gpus):
         with tf.device(device_name_or_function='/gpu:{}'.format(gpu_index)):
             with tf.name_scope('tower_{}'.format(gpu_index)) as scope:
-                loss, logits = inference(images_split[gpu_index],
-                                         binary_maps_split[gpu_index],
-                                         heatmaps_split[gpu_index],
-                                         weights_split[gpu_index],
-                                         is_visible_weights_split[gpu_index],
+                tower_images = images_split[gpu_index]
+                tower_binary_maps = binary_maps_split[gpu_index]
+                tower_heatmaps = heatmaps_split[gpu_index]
+                tower_weights = weights_split[gpu_index]
+                tower_is_visible_weights = is_visible_weights_split[gpu_index]
+                if use_flip_tta:
+                    tower_images = flip_tta.concat_flipped(tower_images,
+                                                           flip_tta.flip_images)
+                    tower_binary_maps = flip_tta.concat_flipped(tower_binary_maps,
+                                                                flip_tta.flip_joint_maps)
+                    tower_heatmaps = flip_tta.concat_flipped(tower_heatmaps,
+                                                             flip_tta.flip_joint_maps)
+                    tower_weights = flip_tta.concat_flipped(tower_weights,
+                                                            flip_tta.flip_joint_weights)
+                    tower_is_visible_weights = flip_tta.concat_flipped(
+                        tower_is_visible_weights, flip_tta.flip_joint_weights)
+
+                loss, logits = inference(tower_images,
+                                         tower_binary_maps,
+                                         tower_heatmaps,
+                                         tower_weights,
+                                         tower_is_visible_weights,
                                          gpu_index,
                                          network_name,
                                          loss_name,
@@ -61,6 +85,9 @@ def setup_val_loss_op(num_gpus, eval_batch, image_dim, network_name, loss_name):
                                          False,
                                          scope)
 
+                if use_flip_tta:
+                    logits = flip_tta.merge_flipped_logits(logits)
+
                 tower_logits_list.append(logits)
                 total_loss += loss
 
@@ -80,14 +107,16 @@ def setup_val_loss_op(num_gpus, eval_batch, image_dim, network_name, loss_name):
     return total_loss, tower_logits
 
 
-def setup_evaluation(FLAGS):
-    """Sets up the entire input pipeline and inference graph for evaluation,
-    using interfaces exposed from `evaluate.py`.
+def setup_eval_input(FLAGS):
+    """Counts the validation examples in `FLAGS.validation_data_dir`, and sets
+    up the evaluation input pipeline over them.
+
+    Every path that builds the evaluation input, including the evaluation
+    cache, goes through here, so that they all agree on the validation shards
+    and their number of examples.
 
     Returns:
-        (val_fetches, val_session) tuple, where val_fetches must be kept
-        synchronized with the outputs from the session.run() call in
-        evaluate.py.
+        (num_val_examples, eval_batch) tuple.
     """
     num_counting_threads = FLAGS.num_preprocess_threads + FLAGS.num_readers
     num_val_examples, val_data_filenames = pose_util.count_training_examples(
@@ -97,150 +126,247 @@ def setup_evaluation(FLAGS):
                                            FLAGS.num_preprocess_threads,
                                            FLAGS.image_dim,
                                            FLAGS.heatmap_stddev_pixels,
-                                           val_data_filenames)
+                                           val_data_filenames,
+                                           num_val_examples,
+                                           FLAGS.eval_cache_dir,
+                                           FLAGS.eval_cache_in_memory)
+
+    return num_val_examples, eval_batch
+
+
+def setup_evaluation(FLAGS):
+    """Sets up the entire input pipeline and inference graph for evaluation,
+    using interfaces exposed from `evaluate.py`.
+
+    Returns:
+        (num_val_examples, val_loss, streaming_pckh, input_initializer) tuple,
+        where `streaming_pckh` accumulates the PCKh match counts in the graph,
+        at the thresholds in `FLAGS.pckh_thresholds` and at 0.5, and
+        `input_initializer` restarts the validation set from its first
+        example.
+    """
+    num_val_examples, eval_batch = setup_eval_input(FLAGS)
 
     val_loss, val_tower_logits = setup_val_loss_op(FLAGS.num_gpus,
                                                    eval_batch,
                                                    FLAGS.image_dim,
                                                    FLAGS.network_name,
-                                                   FLAGS.loss_name)
+                                                   FLAGS.loss_name,
+                                                   FLAGS.flip_tta)
+
+    pckh_thresholds = pckh.parse_thresholds(FLAGS.pckh_thresholds)
+    streaming_pckh = pckh.setup_streaming_pckh(val_tower_logits,
+                                               FLAGS.image_dim,
+                                               eval_batch.x_dense_joints,
+                                               eval_batch.y_dense_joints,
+                                               eval_batch.weights,
+                                               eval_batch.head_size,
+                                               set(pckh_thresholds) | {pckh.PCKH_THRESHOLD})
+
+    return num_val_examples, val_loss, streaming_pckh, eval_batch.iterator_initializer
+
+
+def run_evaluation(session,
+                   restorer,
+                   checkpoint_path,
+                   loss,
+                   streaming_pckh,
+                   input_initializer,
+                   num_val_examples,
+                   batch_size,
+                   show_progress=True):
+    """Restores the model checkpoint `checkpoint_path` into `session`, and runs
+    it over the validation set.
+
+    The evaluation graph from `setup_evaluation` is assumed to have been
+    constructed in `session`, which can be reused to evaluate any number of
+    checkpoints, since the variables are restored and the input and PCKh
+    accumulators are reset for each evaluation.
+
+    If `checkpoint_path` is `None`, the variables are assumed to have been
+    loaded into `session` already, e.g. from an in-memory snapshot of the
+    training variables, and nothing is restored.
+
+    The joints are decoded and matched inside the graph, so each step only
+    fetches the loss, and the match counts are fetched once at the end.
+
+    Returns:
+        (mean_loss, matched_joints, predicted_joints) tuple, where
+        `matched_joints` is [num_thresholds, NUM_JOINTS] for the thresholds of
+        `streaming_pckh`, and `predicted_joints` is [NUM_JOINTS].
+    """
+    with session.graph.as_default():
+        with tf.device('/cpu:0'):
+            if checkpoint_path is not None:
+                restorer.restore(sess=session, save_path=checkpoint_path)
+            session.run([streaming_pckh.reset_op, input_initializer])
+
+            num_batches = int(math.ceil(num_val_examples/batch_size))
+            mean_loss = 0
+            for _ in tqdm(range(num_batches), disable=not show_progress):
+                batch_loss, _ = session.run(fetches=[loss, streaming_pckh.update_op])
 
-    next_x_gt_joints, next_y_gt_joints, next_weights = sparse_joints_to_dense(
-        eval_batch, Person.NUM_JOINTS)
+                mean_loss += batch_loss
+            mean_loss /= num_batches
 
-    gt_data = [next_x_gt_joints, next_y_gt_joints, next_weights, eval_batch.head_size]
+            matched_joints, predicted_joints = session.run(
+                fetches=[streaming_pckh.matched_joints, streaming_pckh.total_joints])
 
-    return num_val_examples, val_loss, val_tower_logits, gt_data
+            return mean_loss, matched_joints, predicted_joints
 
 
-def evaluate_single_epoch(restorer,
-                          restore_path,
+def evaluate_single_epoch(session,
+                          restorer,
+                          checkpoint_path,
                           loss,
-                          logits,
-                          gt_data,
+                          streaming_pckh,
+                          input_initializer,
                           num_val_examples,
                           batch_size,
-                          image_dim,
                           epoch,
                           log_file_handle,
                           next_row):
-    """Evaluates the model checkpoint given by `restore_path` using the PCKh
-    metric.
+    """Evaluates the model checkpoint `checkpoint_path` using the PCKh metric,
+    at each of the thresholds of `streaming_pckh`, and writes the results to
+    `log_file_handle`. See `run_evaluation`.
+    """
+    valid_epoch_mean_loss, matched_joints, predicted_joints = run_evaluation(
+        session,
+        restorer,
+        checkpoint_path,
+        loss,
+        streaming_pckh,
+        input_initializer,
+        num_val_examples,
+        batch_size)
+
+    if (epoch > 1):
+        log_file_handle.write('\n')
+
+    log_file_handle.write('\nMean validation loss: {}\n\n'.format(valid_epoch_mean_loss))
+    log_file_handle.write('************************************************\n')
+    log_file_handle.write('Epoch {} PCKh metric.\n'.format(epoch))
+    log_file_handle.write('************************************************\n\n')
+
+    threshold_index = streaming_pckh.thresholds.index(pckh.PCKH_THRESHOLD)
+    log_file_handle.write('Matched joints: {}\n'.format(matched_joints[threshold_index]))
+    log_file_handle.write('Predicted joints: {}\n'.format(predicted_joints))
+
+    PCKh = matched_joints/predicted_joints
+    log_file_handle.write('PCKh:\n')
+    for joint_index in range(Person.NUM_JOINTS):
+        log_file_handle.write('{}: {}\n'.format(JOINT_NAMES[joint_index],
+                                                PCKh[threshold_index, joint_index]))
+
+    total_pckh = np.mean(PCKh[threshold_index])
+    next_row['Total_PCKh'].append(total_pckh)
+    log_file_handle.write('\nTotal PCKh: {}\n'.format(total_pckh))
+
+    log_file_handle.write('\nPCKh curve:\n')
+    for threshold, threshold_pckh in zip(streaming_pckh.thresholds,
+                                         np.mean(PCKh, axis=1)):
+        log_file_handle.write('PCKh@{}: {}\n'.format(threshold, threshold_pckh))
+    log_file_handle.flush()
+
+    return valid_epoch_mean_loss
+
+
+def _read_evaluated_checkpoints(log_dir):
+    """Returns the ordered dictionary of results of the checkpoints in
+    `log_dir` that have already been evaluated, keyed by checkpoint filename.
+    """
+    evaluated_filepath = os.path.join(log_dir, EVALUATED_CHECKPOINTS_FILENAME)
+    if not os.path.exists(evaluated_filepath):
+        return collections.OrderedDict()
 
-    The entire graph is assumed to have been constructed in `session`, such
-    that all there is to run validation is to run `val_fetches`, and compute
-    relevant metrics.
+    with open(evaluated_filepath, 'r') as f:
+        return json.load(f, object_pairs_hook=collections.OrderedDict)
+
+
+def _write_evaluated_checkpoints(log_dir, evaluated_checkpoints):
+    """Writes the results of the evaluated checkpoints to `log_dir`.
+
+    The file is written to a temporary file and then renamed, so that it is
+    never left half-written if the evaluator crashes.
     """
-    with tf.Session(config=tf.ConfigProto(allow_soft_placement=True)) as session:
-        with tf.device('/cpu:0'):
-            latest_checkpoint = tf.train.latest_checkpoint(checkpoint_dir=restore_path)
-            assert latest_checkpoint is not None
+    evaluated_filepath = os.path.join(log_dir, EVALUATED_CHECKPOINTS_FILENAME)
+    temp_filepath = evaluated_filepath + '.tmp'
+    with open(temp_filepath, 'w') as f:
+        json.dump(evaluated_checkpoints, f, indent=4)
 
-            restorer.restore(sess=session, save_path=latest_checkpoint)
+    os.rename(temp_filepath, evaluated_filepath)
 
-            coord = tf.train.Coordinator()
-            threads = tf.train.start_queue_runners(sess=session, coord=coord)
 
-            num_batches = int(math.ceil(num_val_examples/batch_size))
-            matched_joints = Person.NUM_JOINTS*[0]
-            predicted_joints = Person.NUM_JOINTS*[0]
-            valid_epoch_mean_loss = 0
-            for _ in tqdm(range(num_batches)):
-                [batch_loss, predictions, x_gt_joints, y_gt_joints, weights, head_size] = session.run(
-                    fetches=[loss, logits] + gt_data)
-
-                valid_epoch_mean_loss += batch_loss
-                head_size = np.reshape(head_size, [batch_size, 1])
-
-                gt_joint_points = _get_points_from_flattened_joints(
-                    x_gt_joints, y_gt_joints, batch_size)
-
-                x_predicted_joints = np.empty((batch_size, Person.NUM_JOINTS))
-                y_predicted_joints = np.empty((batch_size, Person.NUM_JOINTS))
-                for batch_index in range(batch_size):
-                    for joint_index in range(Person.NUM_JOINTS):
-                        joint_heatmap = predictions[batch_index, ..., joint_index]
-                        xy_max_confidence = np.unravel_index(
-                            joint_heatmap.argmax(), joint_heatmap.shape)
-                        y_predicted_joints[batch_index, joint_index] = xy_max_confidence[0]/image_dim - 0.5
-                        x_predicted_joints[batch_index, joint_index] = xy_max_confidence[1]/image_dim - 0.5
-
-                predicted_joint_points = _get_points_from_flattened_joints(
-                    x_predicted_joints,
-                    y_predicted_joints,
-                    batch_size)
-
-                # NOTE(brendan): Here we are following steps to calculate the
-                # PCKh metric, which defines a joint estimate as matching the
-                # ground truth if the estimate lies within 50% of the head
-                # segment length. Head segment length is defined as the
-                # diagonal across the annotated head rectangle in the MPII
-                # data, multiplied by a factor of 0.6.
-                joint_weights = weights[:, 0:Person.NUM_JOINTS]
-
-                distance_from_gt = np.sqrt(np.sum(np.square(gt_joint_points - predicted_joint_points), 2))
-                matched_joints += np.sum(joint_weights*(distance_from_gt < 0.5*head_size), 0)
-
-                predicted_joints += np.sum(joint_weights, 0)
-
-                gt_joints = np.concatenate((x_gt_joints, y_gt_joints), 1)
-
-            if (epoch > 1):
-                log_file_handle.write('\n')
-            valid_epoch_mean_loss /= num_batches
-
-            log_file_handle.write('\nMean validation loss: {}\n\n'.format(valid_epoch_mean_loss))
-            log_file_handle.write('************************************************\n')
-            log_file_handle.write('Epoch {} PCKh metric.\n'.format(epoch))
-            log_file_handle.write('************************************************\n\n')
-            log_file_handle.write('Matched joints: {}\n'.format(matched_joints))
-            log_file_handle.write('Predicted joints: {}\n'.format(predicted_joints))
-
-            PCKh = matched_joints/predicted_joints
-            log_file_handle.write('PCKh:\n')
-            for joint_index in range(Person.NUM_JOINTS):
-                log_file_handle.write('{}: {}\n'.format(JOINT_NAMES[joint_index], PCKh[joint_index]))
-                # next_row[JOINT_NAMES[joint_index]].append(PCKh[joint_index])
-
-            next_row['Total_PCKh'].append(np.sum(PCKh)/len(PCKh))
-            log_file_handle.write('\nTotal PCKh: {}\n'.format(np.sum(PCKh)/len(PCKh)))
-            log_file_handle.flush()
-
-            coord.request_stop()
-            coord.join(threads=threads)
-
-            return valid_epoch_mean_loss
+def _get_new_checkpoints(log_dir, evaluated_checkpoints):
+    """Returns the paths of the checkpoints in `log_dir` that have not been
+    evaluated yet, oldest first.
+    """
+    checkpoint_state = tf.train.get_checkpoint_state(checkpoint_dir=log_dir)
+    if checkpoint_state is None:
+        return []
+
+    return [checkpoint_path
+            for checkpoint_path in checkpoint_state.all_model_checkpoint_paths
+            if os.path.basename(checkpoint_path) not in evaluated_checkpoints]
 
 
 def evaluate():
-    """Does a loop checking for new checkpoints and evaluating them all, then
-    exits.
+    """Polls `FLAGS.log_dir` every `FLAGS.eval_interval_secs`, and evaluates
+    each new checkpoint once, oldest first.
 
-    TODO(brendan):
+    The evaluation graph, input pipeline and session are built once, and
+    reused for every checkpoint.
 
-    1. Check for `last_evaluated_checkpoint.json` in `FLAGS.log_dir`.
-    2. When the process starts, checks the last evaluated checkpoint, and
-       evaluates all checkpoints present that came later.
-    3. Once there are no new checkpoints, the evaluation process exits.
+    The results of each evaluated checkpoint are recorded in
+    `last_evaluated_checkpoint.json` in `FLAGS.log_dir`, so that when the
+    evaluator is restarted (e.g. after a crash) it resumes with the first
+    checkpoint that it has not evaluated.
     """
-    num_val_examples, val_loss, val_logits, gt_data = setup_evaluation(FLAGS)
+    with tf.Graph().as_default():
+        num_val_examples, val_loss, streaming_pckh, input_initializer = setup_evaluation(FLAGS)
 
-    restorer = tf.train.Saver(var_list=tf.global_variables())
+        restorer = tf.train.Saver(var_list=tf.global_variables())
 
-    evaluate_single_epoch(restorer,
-                          restore_path,
-                          val_loss,
-                          val_logits,
-                          gt_data,
-                          num_val_examples,
-                          FLAGS.batch_size,
-                          FLAGS.image_dim,
-                          epoch,
-                          log_file_handle)
+        session = tf.Session(config=tf.ConfigProto(allow_soft_placement=True))
+
+    evaluated_checkpoints = _read_evaluated_checkpoints(FLAGS.log_dir)
+
+    with open(os.path.join(FLAGS.log_dir, EVAL_LOG_FILENAME), 'a') as log_file_handle:
+        while True:
+            for checkpoint_path in _get_new_checkpoints(FLAGS.log_dir,
+                                                        evaluated_checkpoints):
+                # NOTE(brendan): The trainer only keeps its most recent
+                # checkpoints, so a checkpoint can be deleted before it is
+                # evaluated.
+                if not tf.train.checkpoint_exists(checkpoint_path):
+                    continue
+
+                log_file_handle.write('\nCheckpoint: {}\n'.format(checkpoint_path))
+
+                next_row = collections.OrderedDict([('Total_PCKh', [])])
+                valid_epoch_mean_loss = evaluate_single_epoch(
+                    session,
+                    restorer,
+                    checkpoint_path,
+                    val_loss,
+                    streaming_pckh,
+                    input_initializer,
+                    num_val_examples,
+                    FLAGS.batch_size,
+                    len(evaluated_checkpoints) + 1,
+                    log_file_handle,
+                    next_row)
+
+                evaluated_checkpoints[os.path.basename(checkpoint_path)] = {
+                    'Mean_Validation_Loss': float(valid_epoch_mean_loss),
+                    'Total_PCKh': float(next_row['Total_PCKh'][0])}
+                _write_evaluated_checkpoints(FLAGS.log_dir, evaluated_checkpoints)
+
+            time.sleep(FLAGS.eval_interval_secs)
 
 
 def main(argv=None):
-    """Usage: python3 -m evaluate
+    """Usage: python3 -m evaluate --log_dir logs/resnet/exp0
     """
     evaluate()
 
@@ -0,0 +1,230 @@
+"""Evaluates the checkpoints in many log directories, e.g. from a sweep of
+`train_from_config` runs, across a pool of processes, and merges the results
+into one table of mean validation loss and per-joint PCKh.
+
+Each process builds the evaluation graph and session once, and reuses them
+for every checkpoint it is given. The decoded validation set is read from the
+evaluation cache in `eval_cache_dir`, which is built once before the pool
+starts, and is memory-mapped by every process so that it is only held in
+memory once.
+
+All checkpoints are assumed to be of the network given by the `network_name`
+flag.
+"""
+import argparse
+import multiprocessing
+import os
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+import tensorflow as tf
+from pose_utils import pckh
+from pose_utils.pose_flags import FLAGS
+from dataset.mpii_datatypes import JOINT_NAMES
+from evaluate import setup_eval_input, setup_evaluation, run_evaluation
+
+tf.app.flags.DEFINE_string('checkpoint_dirs', None,
+                           """Comma-separated list of log directories whose
+                           checkpoints should be evaluated.""")
+
+tf.app.flags.DEFINE_boolean('evaluate_all_checkpoints', False,
+                            """Evaluate every checkpoint kept in each
+                            directory (True), or only the latest (False)?""")
+
+tf.app.flags.DEFINE_integer('num_eval_processes', 2,
+                            """Number of processes evaluating checkpoints in
+                            parallel.""")
+
+tf.app.flags.DEFINE_string('eval_gpus', None,
+                           """Comma-separated list of GPUs to give the
+                           evaluation processes, round-robin. Each process uses
+                           one GPU. If not set, each process sees all GPUs,
+                           and allocates GPU memory as it needs it.""")
+
+tf.app.flags.DEFINE_string('results_filepath', None,
+                           """CSV file to write the table of results to.""")
+
+# NOTE(brendan): Each process holds its own evaluation graph and session, which
+# are built once by `_init_worker`.
+_worker_state = {}
+
+def _build_shared_eval_cache(flag_values):
+    """Builds the evaluation cache in `eval_cache_dir`, if it does not exist or
+    is out of date.
+
+    This is run in its own process, so that the parent process never creates a
+    session, and holds no GPU memory.
+    """
+    worker_flags = argparse.Namespace(**flag_values)
+
+    with tf.Graph().as_default():
+        setup_eval_input(worker_flags)
+
+
+def _init_worker(flag_values, gpu_queue):
+    """Builds the evaluation graph and session of a worker process."""
+    if gpu_queue is not None:
+        os.environ['CUDA_VISIBLE_DEVICES'] = gpu_queue.get()
+
+    flag_values = dict(flag_values, num_gpus=1)
+    worker_flags = argparse.Namespace(**flag_values)
+
+    graph = tf.Graph()
+    with graph.as_default():
+        num_val_examples, val_loss, streaming_pckh, input_initializer = setup_evaluation(
+            worker_flags)
+
+        restorer = tf.train.Saver(var_list=tf.global_variables())
+
+        # NOTE(brendan): Without `eval_gpus`, every worker sees every GPU, so
+        # each worker must only take the GPU memory it needs, rather than all
+        # of it, for the other workers to fit.
+        config = tf.ConfigProto(allow_soft_placement=True)
+        config.gpu_options.allow_growth = True
+        session = tf.Session(config=config)
+
+    _worker_state.update(flags=worker_flags,
+                         session=session,
+                         restorer=restorer,
+                         val_loss=val_loss,
+                         streaming_pckh=streaming_pckh,
+                         input_initializer=input_initializer,
+                         num_val_examples=num_val_examples)
+
+
+def _evaluate_checkpoint(checkpoint_path):
+    """Evaluates `checkpoint_path` in the worker's session.
+
+    Returns:
+        Dictionary of the row of results for `checkpoint_path`.
+    """
+    streaming_pckh = _worker_state['streaming_pckh']
+    mean_loss, matched_joints, predicted_joints = run_evaluation(
+        _worker_state['session'],
+        _worker_state['restorer'],
+        checkpoint_path,
+        _worker_state['val_loss'],
+        streaming_pckh,
+        _worker_state['input_initializer'],
+        _worker_state['num_val_examples'],
+        _worker_state['flags'].batch_size,
+        False)
+
+    PCKh = matched_joints/predicted_joints
+    threshold_index = streaming_pckh.thresholds.index(pckh.PCKH_THRESHOLD)
+
+    row = {'Checkpoint_Dir': os.path.dirname(checkpoint_path),
+           'Checkpoint': os.path.basename(checkpoint_path),
+           'Mean_Validation_Loss': mean_loss}
+    for joint_index, joint_name in enumerate(JOINT_NAMES):
+        row[joint_name] = PCKh[threshold_index, joint_index]
+    row['Total_PCKh'] = np.mean(PCKh[threshold_index])
+    for threshold, threshold_pckh in zip(streaming_pckh.thresholds,
+                                         np.mean(PCKh, axis=1)):
+        row['PCKh@{}'.format(threshold)] = threshold_pckh
+
+    return row
+
+
+def _get_checkpoint_paths(checkpoint_dirs, evaluate_all_checkpoints):
+    """Returns the paths of the checkpoints to evaluate in `checkpoint_dirs`."""
+    checkpoint_paths = []
+    for checkpoint_dir in checkpoint_dirs:
+        checkpoint_state = tf.train.get_checkpoint_state(checkpoint_dir=checkpoint_dir)
+        if checkpoint_state is None:
+            print('No checkpoints found in {}.'.format(checkpoint_dir))
+            continue
+
+        if evaluate_all_checkpoints:
+            checkpoint_paths += list(checkpoint_state.all_model_checkpoint_paths)
+        else:
+            checkpoint_paths.append(checkpoint_state.model_checkpoint_path)
+
+    return checkpoint_paths
+
+
+def evaluate_checkpoints(checkpoint_paths,
+                         flag_values,
+                         num_processes,
+                         gpus=None):
+    """Evaluates `checkpoint_paths` across a pool of `num_processes` processes.
+
+    Args:
+        checkpoint_paths: List of paths of checkpoints to evaluate.
+        flag_values: Dictionary of flag values, as in `pose_flags`, to set up
+            the evaluation with.
+        num_processes: Number of evaluation processes.
+        gpus: List of GPUs (as strings) to give the processes, round-robin, or
+            `None` to let each process see all GPUs.
+
+    Returns:
+        A `pandas.DataFrame` of results, one row per checkpoint.
+    """
+    # NOTE(brendan): Processes are spawned rather than forked, since forking a
+    # process that has used TensorFlow is not safe.
+    context = multiprocessing.get_context('spawn')
+
+    cache_process = context.Process(target=_build_shared_eval_cache,
+                                    args=(flag_values,))
+    cache_process.start()
+    cache_process.join()
+    assert cache_process.exitcode == 0, ('Building the evaluation cache failed.')
+
+    gpu_queue = None
+    if gpus is not None:
+        gpu_queue = context.Queue()
+        for process_index in range(num_processes):
+            gpu_queue.put(gpus[process_index % len(gpus)])
+
+    rows = []
+    with context.Pool(processes=num_processes,
+                      initializer=_init_worker,
+                      initargs=(flag_values, gpu_queue)) as pool:
+        for row in tqdm(pool.imap_unordered(_evaluate_checkpoint, checkpoint_paths),
+                        total=len(checkpoint_paths)):
+            rows.append(row)
+
+    columns = (['Checkpoint_Dir', 'Checkpoint', 'Mean_Validation_Loss'] +
+               JOINT_NAMES +
+               ['Total_PCKh'] +
+               sorted(column for column in rows[0] if column.startswith('PCKh@')))
+    results = pd.DataFrame(rows, columns=columns)
+
+    return results.sort_values(by=['Checkpoint_Dir', 'Checkpoint']).reset_index(drop=True)
+
+
+def main(argv=None):
+    """Usage:
+    ('python3 -m evaluate_checkpoints
+     --checkpoint_dirs logs/resnet/exp0,logs/resnet/exp1
+     --eval_cache_dir /mnt/data/datasets/MPII_HumanPose/valid_cache
+     --eval_gpus 0,1 --num_eval_processes 2
+     --results_filepath results.csv')
+    """
+    assert FLAGS.checkpoint_dirs is not None, ('No checkpoint_dirs given.')
+    assert FLAGS.eval_cache_dir is not None, (
+        'eval_cache_dir is required, so that processes share the decoded validation set.')
+
+    checkpoint_paths = _get_checkpoint_paths(FLAGS.checkpoint_dirs.split(','),
+                                             FLAGS.evaluate_all_checkpoints)
+    if not checkpoint_paths:
+        return
+
+    gpus = None
+    if FLAGS.eval_gpus is not None:
+        gpus = FLAGS.eval_gpus.split(',')
+
+    results = evaluate_checkpoints(checkpoint_paths,
+                                   FLAGS.flag_values_dict(),
+                                   FLAGS.num_eval_processes,
+                                   gpus)
+
+    with pd.option_context('display.max_rows', None, 'display.max_columns', None):
+        print(results)
+
+    if FLAGS.results_filepath is not None:
+        results.to_csv(FLAGS.results_filepath, index=False)
+
+
+if __name__ == "__main__":
+    tf.app.run()
@@ -3,17 +3,24 @@ import os
 import numpy as np
 import tensorflow as tf
 from pose_utils.sparse_to_dense import sparse_joints_to_dense_single_example
-from dataset.mpii_datatypes import Person
+from dataset.mpii_datatypes import Person, LEFT_RIGHT_FLIPPED_INDICES
+from pose_utils import tfrecord_index
+from pose_utils import eval_cache
 
 EXAMPLES_PER_SHARD = 256
-LEFT_RIGHT_FLIPPED_INDICES = [5, 4, 3, 2, 1, 0, 6, 7, 8, 9, 15, 14, 13, 12, 11, 10]
+PREFETCH_BATCHES = 2
+BINARY_MAP_RADIUS_PIXELS = 10
+INPUT_ITERATOR_SAVEABLES = 'input_iterator_saveables'
 
 class EvalBatch(object):
     """Contains an evaluation batch of images along with corresponding
     ground-truth joint vectors for the annotated person in that image.
 
-    images, *_joints, joint_indices and head_size should all be lists of length
-    `batch_size`.
+    All tensors have first dimension `batch_size`. The dense joints are
+    [batch_size, NUM_JOINTS], and zero for joints that are not annotated, as
+    indicated by `weights`.
+
+    `iterator_initializer` restarts the batches from the first example.
     """
     def __init__(self,
                  images,
@@ -21,22 +28,22 @@ class EvalBatch(object):
                  heatmaps,
                  weights,
                  is_visible_weights,
-                 joint_indices,
-                 x_joints,
-                 y_joints,
+                 x_dense_joints,
+                 y_dense_joints,
                  head_size,
-                 batch_size):
+                 batch_size,
+                 iterator_initializer):
         assert images.get_shape()[0] == batch_size
         self._images = images
         self._binary_maps = binary_maps
         self._heatmaps = heatmaps
         self._weights = weights
         self._is_visible_weights = is_visible_weights
-        self._joint_indices = joint_indices
-        self._x_joints = x_joints
-        self._y_joints = y_joints
+        self._x_dense_joints = x_dense_joints
+        self._y_dense_joints = y_dense_joints
         self._head_size = head_size
         self._batch_size = batch_size
+        self._iterator_initializer = iterator_initializer
 
     @property
     def images(self):
@@ -59,16 +66,12 @@ class EvalBatch(object):
         return self._is_visible_weights
 
     @property
-    def joint_indices(self):
-        return self._joint_indices
-
-    @property
-    def x_joints(self):
-        return self._x_joints
+    def x_dense_joints(self):
+        return self._x_dense_joints
 
     @property
-    def y_joints(self):
-        return self._y_joints
+    def y_dense_joints(self):
+        return self._y_dense_joints
 
     @property
     def head_size(self):
@@ -78,56 +81,112 @@ class EvalBatch(object):
     def batch_size(self):
         return self._batch_size
 
+    @property
+    def iterator_initializer(self):
+        return self._iterator_initializer
+
+
+def _setup_worker_filenames(data_filenames,
+                            num_workers,
+                            worker_index,
+                            reshuffle_worker_shards,
+                            seed):
+    """Sets up an infinitely repeating, shuffled dataset of the TFRecord files
+    in `data_filenames` that belong to worker `worker_index` of `num_workers`.
+
+    By default each worker is given the same, disjoint, subset of the files
+    every epoch. With `reshuffle_worker_shards`, all of the files are instead
+    permuted every epoch, using a permutation that depends only on `seed` and
+    the epoch, and each worker takes its subset of the permuted files. Workers
+    with the same `seed` therefore still read disjoint files every epoch.
+    """
+    data_filenames = sorted(data_filenames)
+    assert len(data_filenames) >= num_workers, (
+        'Fewer shards than workers.')
+
+    if not reshuffle_worker_shards:
+        filenames = tf.data.Dataset.from_tensor_slices(data_filenames)
+        filenames = filenames.shard(num_shards=num_workers, index=worker_index)
+
+        return filenames.shuffle(buffer_size=len(data_filenames), seed=seed).repeat()
+
+    if seed is None:
+        seed = 0
+
+    def _get_epoch_worker_filenames(epoch):
+        rand_uniform = tf.contrib.stateless.stateless_random_uniform(
+            shape=[len(data_filenames)],
+            seed=tf.stack([tf.constant(seed, dtype=tf.int64), epoch]))
+        _, epoch_order = tf.nn.top_k(input=rand_uniform, k=len(data_filenames))
+
+        epoch_filenames = tf.data.Dataset.from_tensor_slices(
+            tf.gather(params=data_filenames, indices=epoch_order))
+
+        return epoch_filenames.shard(num_shards=num_workers, index=worker_index)
+
+    return tf.contrib.data.Counter().flat_map(_get_epoch_worker_filenames)
 
-def _setup_example_queue(filename_queue,
-                         num_readers,
-                         input_queue_memory_factor,
-                         batch_size):
-    """Sets up a randomly shuffled queue containing example protobufs, read
-    from the TFRecord files in `filename_queue`.
+
+def _setup_example_dataset(data_filenames,
+                           num_readers,
+                           shuffle_buffer_size,
+                           compression_type,
+                           seed,
+                           num_workers=1,
+                           worker_index=0,
+                           reshuffle_worker_shards=False):
+    """Sets up a randomly shuffled, infinitely repeating dataset of example
+    protobufs, read from the TFRecord files in `data_filenames`.
+
+    The order of the files is reshuffled every epoch, and `num_readers` files
+    are read from at once, with their examples interleaved. Only the files
+    belonging to this worker are read, see `_setup_worker_filenames`.
 
     Args:
-        filename_queue: A queue of filepaths to the TFRecord files containing
-            the input Example protobufs.
-        num_readers: Number of file readers to use.
-        input_queue_memory_factor: Factor by which to scale up the minimum
-            number of examples in the example queue. A larger factor increases
-            the mixing of examples, but will also increase memory pressure.
-        batch_size: Number of training elements in a batch.
+        data_filenames: List of filepaths to the TFRecord files containing the
+            input Example protobufs.
+        num_readers: Number of files to read from in parallel.
+        shuffle_buffer_size: Number of examples to shuffle from. A larger
+            buffer increases the mixing of examples, but will also increase
+            memory pressure.
+        compression_type: Compression type of the TFRecord files, as a key of
+            `tfrecord_index.COMPRESSION_TYPES`.
+        seed: Seed for the shuffling, or `None`. If set, the files are also
+            interleaved in a deterministic order, so that the order of the
+            examples is reproducible.
+        num_workers: Number of workers splitting the files between them.
+        worker_index: Index of this worker.
+        reshuffle_worker_shards: Reassign files to workers every epoch?
 
     Returns:
-        A dequeue op that will dequeue one Tensor containing an input example
-        from `examples_queue`.
+        A `tf.data.Dataset` of serialized examples.
     """
-    min_queue_examples = input_queue_memory_factor*EXAMPLES_PER_SHARD
+    dataset_compression_type = tfrecord_index.get_dataset_compression_type(
+        compression_type)
 
-    examples_queue = tf.RandomShuffleQueue(capacity=min_queue_examples + 3*batch_size,
-                                           min_after_dequeue=min_queue_examples,
-                                           dtypes=[tf.string])
+    filenames = _setup_worker_filenames(data_filenames,
+                                        num_workers,
+                                        worker_index,
+                                        reshuffle_worker_shards,
+                                        seed)
 
-    enqueue_ops = []
-    for _ in range(num_readers):
-        options = tf.python_io.TFRecordOptions(
-            compression_type=tf.python_io.TFRecordCompressionType.ZLIB)
-        reader = tf.TFRecordReader(options=options)
-        _, per_thread_example = reader.read(queue=filename_queue)
-        enqueue_ops.append(examples_queue.enqueue(vals=[per_thread_example]))
+    examples = filenames.apply(tf.contrib.data.parallel_interleave(
+        lambda filename: tf.data.TFRecordDataset(
+            filenames=filename, compression_type=dataset_compression_type),
+        cycle_length=num_readers,
+        sloppy=(seed is None)))
 
-    tf.train.queue_runner.add_queue_runner(
-        qr=tf.train.queue_runner.QueueRunner(queue=examples_queue,
-                                             enqueue_ops=enqueue_ops))
+    return examples.shuffle(buffer_size=shuffle_buffer_size, seed=seed)
 
-    return examples_queue.dequeue()
 
+def _parse_example_features(example_serialized):
+    """Parses the features of an example proto, without decoding the image.
 
-def _parse_example_proto(example_serialized, image_dim):
-    """Parses an example proto and returns a tuple containing
-    (raw image reshaped to the image dimensions in float32 format, sparse joint
-    indices, sparse joints).
+    The `binary_maps` feature written by `write_tf_record` is not parsed,
+    since binary maps are rendered from the joints after augmentation.
     """
     feature_map = {
         'image_jpeg': tf.FixedLenFeature(shape=[], dtype=tf.string),
-        'binary_maps': tf.FixedLenFeature(shape=[], dtype=tf.string),
         'joint_indices': tf.VarLenFeature(dtype=tf.int64),
         'is_visible_list': tf.VarLenFeature(dtype=tf.int64),
         'x_joints': tf.VarLenFeature(dtype=tf.float32),
@@ -135,8 +194,16 @@ def _parse_example_proto(example_serialized, image_dim):
         'head_size': tf.FixedLenFeature(shape=[], dtype=tf.float32)
     }
 
-    features = tf.parse_single_example(
-        serialized=example_serialized, features=feature_map)
+    return tf.parse_single_example(serialized=example_serialized,
+                                   features=feature_map)
+
+
+def _parse_example_proto(example_serialized, image_dim):
+    """Parses an example proto and returns a tuple containing
+    (raw image reshaped to the image dimensions in float32 format, sparse joint
+    indices, sparse joints).
+    """
+    features = _parse_example_features(example_serialized)
 
     img_jpeg = features['image_jpeg']
     with tf.name_scope(name='decode_jpeg', values=[img_jpeg]):
@@ -146,7 +213,6 @@ def _parse_example_proto(example_serialized, image_dim):
             image=img_tensor, dtype=tf.float32)
 
     parsed_example = {'image': decoded_img,
-                      'binary_maps': features['binary_maps'],
                       'joint_indices': features['joint_indices'],
                       'x_joints': features['x_joints'],
                       'y_joints': features['y_joints'],
@@ -156,254 +222,351 @@ def _parse_example_proto(example_serialized, image_dim):
     return parsed_example
 
 
-def _distort_colour(distorted_image, thread_id):
+def _distort_colour(distorted_image):
     """Distorts the brightness, saturation, hue and contrast of an image
     randomly, and returns the result.
 
-    The colour distortions are non-commutative, so we do them in a random order
-    per thread (based on `thread_id`).
+    The colour distortions are non-commutative, so we do them in one of two
+    orders, chosen randomly per example.
     """
-    colour_ordering = thread_id % 2
+    def _saturation_hue_contrast(image):
+        image = tf.image.random_saturation(image=image, lower=0.5, upper=1.5)
+        image = tf.image.random_hue(image=image, max_delta=0.2)
+        return tf.image.random_contrast(image=image, lower=0.5, upper=1.5)
+
+    def _contrast_saturation_hue(image):
+        image = tf.image.random_contrast(image=image, lower=0.5, upper=1.5)
+        image = tf.image.random_saturation(image=image, lower=0.5, upper=1.5)
+        return tf.image.random_hue(image=image, max_delta=0.2)
 
     distorted_image = tf.image.random_brightness(image=distorted_image, max_delta=32./255.)
-    if colour_ordering == 0:
-        distorted_image = tf.image.random_saturation(image=distorted_image, lower=0.5, upper=1.5)
-        distorted_image = tf.image.random_hue(image=distorted_image, max_delta=0.2)
-        distorted_image = tf.image.random_contrast(image=distorted_image, lower=0.5, upper=1.5)
-    else:
-        distorted_image = tf.image.random_contrast(image=distorted_image, lower=0.5, upper=1.5)
-        distorted_image = tf.image.random_saturation(image=distorted_image, lower=0.5, upper=1.5)
-        distorted_image = tf.image.random_hue(image=distorted_image, max_delta=0.2)
+    rand_uniform = tf.random_uniform(shape=[],
+                                     minval=0,
+                                     maxval=1.0)
+    distorted_image = tf.cond(pred=rand_uniform < 0.5,
+                              fn1=lambda: _saturation_hue_contrast(distorted_image),
+                              fn2=lambda: _contrast_saturation_hue(distorted_image))
 
     return tf.clip_by_value(t=distorted_image, clip_value_min=0.0, clip_value_max=1.0)
 
 
-def _decode_binary_maps(binary_maps, image_dim):
-    """Decodes a binary map for an example from its post-decompression format
-    (uint8), and reshapes the tensor so that TensorFlow will understand it.
-    """
-    binary_maps = tf.decode_raw(bytes=binary_maps, out_type=tf.uint8)
-    binary_maps = tf.reshape(tensor=binary_maps,
-                             shape=[image_dim, image_dim, Person.NUM_JOINTS])
-
-    return tf.cast(binary_maps, tf.float32)
+def _get_random_affine(max_rotation_angle, min_scale, max_scale, max_translation):
+    """Randomly chooses a left-right flip, rotation, scale and translation, and
+    composes them into one affine transform of joint co-ordinates in
+    [-0.5, 0.5] about the image centre.
 
+    The joints are first flipped, then rotated, then scaled about the image
+    centre, and finally translated.
 
-def _flip_with_left_right_permutation(maps):
-    """Flips ground truth maps, accounting for the fact that when mirrored the
-    images' left and right have also been swapped.
+    Args:
+        max_rotation_angle: Maximum amount to rotate by, in radians.
+        min_scale: Minimum factor to scale by.
+        max_scale: Maximum factor to scale by.
+        max_translation: Maximum translation in x and in y, as a fraction of
+            the image dimension.
 
-    TODO(brendan): Apparently `tf.transpose` is slow.
-    Replace with `tf.reshape` -> replace gather column indices with a list of
-    individual element indices?
+    Returns:
+        (matrix, translation, should_flip) tuple, where the transformed joints
+        are `matrix*joints + translation`, `matrix` is 2x2 and `translation`
+        has shape [2].
     """
-    maps = tf.image.flip_left_right(image=maps)
+    should_flip = tf.random_uniform(shape=[], minval=0, maxval=1.0) < 0.5
+    flip_sign = 1.0 - 2.0*tf.cast(should_flip, tf.float32)
 
-    maps = tf.transpose(a=maps, perm=[2, 0, 1])
-    maps = tf.gather(params=maps,
-                     indices=LEFT_RIGHT_FLIPPED_INDICES)
-
-    return tf.transpose(a=maps, perm=[1, 2, 0])
-
-
-def _maybe_flip_maps(maps, should_flip):
-    """Conditionally flip ground truth maps left-right (i.e. left becomes right
-    and vice versa).
+    rand_angle = tf.random_uniform(shape=[],
+                                   minval=-max_rotation_angle,
+                                   maxval=max_rotation_angle)
+    rand_scale = tf.random_uniform(shape=[], minval=min_scale, maxval=max_scale)
+    translation = tf.random_uniform(shape=[2],
+                                    minval=-max_translation,
+                                    maxval=max_translation)
+
+    # NOTE(brendan): In image co-ordinates, where y points down, a rotation
+    # that appears counter-clockwise takes (x, y) to R(-angle)*(x, y).
+    cos_angle = rand_scale*tf.cos(rand_angle)
+    sin_angle = rand_scale*tf.sin(rand_angle)
+    matrix = tf.stack([tf.stack([flip_sign*cos_angle, sin_angle]),
+                       tf.stack([-flip_sign*sin_angle, cos_angle])])
+
+    return matrix, translation, should_flip
+
+
+def _affine_transform_joints(x_dense_joints,
+                             y_dense_joints,
+                             matrix,
+                             translation,
+                             should_flip):
+    """Transforms dense joints by the affine transform from
+    `_get_random_affine`.
+
+    If the transform flips left and right, the joints are also permuted, since
+    the mirrored image's left and right have been swapped.
     """
-    return tf.cond(pred=should_flip,
-                   fn1=lambda: _flip_with_left_right_permutation(maps),
-                   fn2=lambda: maps)
-
+    x_transformed_joints = (matrix[0, 0]*x_dense_joints +
+                            matrix[0, 1]*y_dense_joints +
+                            translation[0])
+    y_transformed_joints = (matrix[1, 0]*x_dense_joints +
+                            matrix[1, 1]*y_dense_joints +
+                            translation[1])
 
-def _randomly_flip(image, binary_maps, heatmaps):
-    """Randomly flips an image and set of joint-maps left or right, and returns
-    the (possibly) flipped results.
-    """
-    rand_uniform = tf.random_uniform(shape=[],
-                                     minval=0,
-                                     maxval=1.0)
-    should_flip = rand_uniform < 0.5
-    flipped_image = tf.cond(
-        pred=should_flip,
-        fn1=lambda: tf.image.flip_left_right(image=image),
-        fn2=lambda: image)
+    x_transformed_joints = _maybe_flip_weights(x_transformed_joints, should_flip)
+    y_transformed_joints = _maybe_flip_weights(y_transformed_joints, should_flip)
 
-    flipped_binary_maps = _maybe_flip_maps(binary_maps, should_flip)
-    flipped_heatmaps = _maybe_flip_maps(heatmaps, should_flip)
+    return x_transformed_joints, y_transformed_joints
 
-    return flipped_image, flipped_binary_maps, flipped_heatmaps, should_flip
 
+def _get_image_transform(matrix, translation, image_dim):
+    """Returns the 8-element projective transform that warps an image by the
+    affine transform from `_get_random_affine`, in the format expected by
+    `tf.contrib.image.transform`.
 
-def _randomly_rotate(image, binary_maps, heatmaps, max_rotation_angle):
-    """Randomly rotates inputs between +/-`max_rotation_angle`, and returns the
-    results.
+    `tf.contrib.image.transform` maps each output pixel to the input pixel it
+    samples from, so the transform is the inverse of `matrix` and
+    `translation`, converted from [-0.5, 0.5] co-ordinates to pixels.
     """
-    rand_angle = tf.random_uniform(shape=[],
-                                   minval=-max_rotation_angle,
-                                   maxval=max_rotation_angle)
+    inverse_matrix = tf.matrix_inverse(matrix)
 
-    rotated_image = tf.contrib.image.rotate(images=image, angles=rand_angle)
+    centre = (image_dim - 1)/2
+    centre_pixel = tf.constant([centre, centre], dtype=tf.float32)
+    offset = (centre_pixel -
+              tf.reshape(tf.matmul(inverse_matrix, tf.reshape(centre_pixel, [2, 1])), [2]) -
+              (image_dim - 1)*tf.reshape(tf.matmul(inverse_matrix, tf.reshape(translation, [2, 1])), [2]))
 
-    rotated_maps = tf.contrib.image.rotate(images=[binary_maps, heatmaps],
-                                           angles=rand_angle)
-    rotated_binary_maps = rotated_maps[0]
-    rotated_heatmaps = rotated_maps[1]
-
-    return rotated_image, rotated_binary_maps, rotated_heatmaps
+    return tf.stack([inverse_matrix[0, 0], inverse_matrix[0, 1], offset[0],
+                     inverse_matrix[1, 0], inverse_matrix[1, 1], offset[1],
+                     0.0, 0.0])
 
 
 def _distort_image(decoded_image,
-                   binary_maps,
-                   heatmaps,
+                   x_dense_joints,
+                   y_dense_joints,
                    image_dim,
-                   thread_id,
-                   max_rotation_angle):
-    """Randomly distorts the image from `parsed_example` by randomly rotating,
-    randomly flipping left and right, and randomly distorting the colour of
-    that image.
+                   max_rotation_angle,
+                   min_scale,
+                   max_scale,
+                   max_translation):
+    """Randomly distorts the colour of the image from `parsed_example`, and
+    chooses a random flip, rotation, scale and translation for it.
+
+    The geometric distortions are composed into one affine transform, which is
+    applied to the dense joints here. The image itself is warped once, after
+    batching, by `_preprocess_batch_train`. Since the colour distortions are
+    per-pixel, doing them before the warp gives the same result as after.
 
     Args:
         decoded_image: Raw image, decoded from JPEG.
-        binary_maps: Binary maps of joint positions.
-        heatmaps: Confidence maps of joint positions.
+        x_dense_joints: Dense x co-ordinates of the joints.
+        y_dense_joints: Dense y co-ordinates of the joints.
         image_dim: Dimension of the image as required when input to the
             network.
-        thread_id: Number of the image preprocessing thread responsible for
-            these image distortions.
         max_rotation_angle: Maximum amount to rotate images, in radians.
+        min_scale: Minimum factor to scale images by.
+        max_scale: Maximum factor to scale images by.
+        max_translation: Maximum translation of images in x and in y, as a
+            fraction of the image dimension.
 
     Returns:
-        (distorted_image, distorted_binary_maps, distorted_heatmaps) tuple
-        containing joint-maps and image post flipping, rotation, and colour
-        distortion.
+        (distorted_image, image_transform, x_distorted_joints,
+        y_distorted_joints, should_flip) tuple, containing the colour
+        distorted image, the transform to warp it by, the transformed joints,
+        and whether the transform flips the image.
     """
     decoded_image = tf.reshape(tensor=decoded_image,
                                  shape=[image_dim, image_dim, 3])
-    binary_maps = _decode_binary_maps(binary_maps, image_dim)
 
-    flipped_image, flipped_binary_maps, flipped_heatmaps, should_flip = _randomly_flip(
-        decoded_image, binary_maps, heatmaps)
+    distorted_image = _distort_colour(decoded_image)
 
-    distorted_image = _distort_colour(flipped_image, thread_id)
+    matrix, translation, should_flip = _get_random_affine(max_rotation_angle,
+                                                          min_scale,
+                                                          max_scale,
+                                                          max_translation)
 
-    distorted_image, distorted_binary_maps, distorted_heatmaps = _randomly_rotate(
-        distorted_image, flipped_binary_maps, flipped_heatmaps, max_rotation_angle)
+    x_distorted_joints, y_distorted_joints = _affine_transform_joints(x_dense_joints,
+                                                                      y_dense_joints,
+                                                                      matrix,
+                                                                      translation,
+                                                                      should_flip)
 
-    distorted_image = tf.subtract(x=distorted_image, y=0.5)
-    distorted_image = tf.multiply(x=distorted_image, y=2.0)
+    image_transform = _get_image_transform(matrix, translation, image_dim)
 
-    return distorted_image, distorted_binary_maps, distorted_heatmaps, should_flip
+    return distorted_image, image_transform, x_distorted_joints, y_distorted_joints, should_flip
 
 
-def _parse_and_preprocess_example_eval(heatmap_stddev_pixels,
-                                       example_serialized,
-                                       num_preprocess_threads,
-                                       image_dim):
+def _parse_and_preprocess_example_eval(example_serialized, image_dim):
     """Same as `_parse_and_preprocess_example_train`, except without image
-    distortion or heatmap creation.
+    distortion, and without heatmap creation, which is done after batching by
+    `_preprocess_batch_eval`.
 
-    Hence this function returns dense x and y joints, instead of dense
-    heatmaps.
+    Hence this function returns dense x and y joints instead of joint maps,
+    along with the head size needed to compute PCKh, in the order of
+    `eval_cache.ARRAY_NAMES`.
     """
-    images_and_jointmaps = []
-    for thread_id in range(num_preprocess_threads):
-        parsed_example = _parse_example_proto(example_serialized, image_dim)
+    parsed_example = _parse_example_proto(example_serialized, image_dim)
 
-        decoded_img = parsed_example['image']
-        binary_maps = parsed_example['binary_maps']
-        joint_indices = parsed_example['joint_indices']
-        x_joints = parsed_example['x_joints']
-        y_joints = parsed_example['y_joints']
+    decoded_img = tf.reshape(tensor=parsed_example['image'],
+                             shape=[image_dim, image_dim, 3])
 
-        binary_maps = _decode_binary_maps(binary_maps, image_dim)
+    x_dense_joints, y_dense_joints, weights, sparse_joint_indices = sparse_joints_to_dense_single_example(
+        parsed_example['x_joints'],
+        parsed_example['y_joints'],
+        parsed_example['joint_indices'],
+        Person.NUM_JOINTS)
 
-        decoded_img = tf.reshape(tensor=decoded_img,
-                                 shape=[image_dim, image_dim, 3])
+    is_visible_weights = _get_is_visible_weights(sparse_joint_indices,
+                                                 parsed_example['is_visible_list'].values,
+                                                 weights)
+
+    return (decoded_img,
+            x_dense_joints,
+            y_dense_joints,
+            weights,
+            is_visible_weights,
+            parsed_example['head_size'])
 
-        decoded_img = tf.subtract(x=decoded_img, y=0.5)
-        decoded_img = tf.multiply(x=decoded_img, y=2.0)
 
-        x_dense_joints, y_dense_joints, weights, sparse_joint_indices = sparse_joints_to_dense_single_example(
-            x_joints, y_joints, joint_indices, Person.NUM_JOINTS)
+def _scale_images(images):
+    """Scales the colours of a batch of `images` from [0, 1] to [-1, 1]."""
+    images = tf.subtract(x=images, y=0.5)
 
-        is_visible_weights = _get_is_visible_weights(sparse_joint_indices,
-                                                     parsed_example['is_visible_list'].values,
-                                                     weights)
+    return tf.multiply(x=images, y=2.0)
 
-        heatmaps = _get_joint_heatmaps(heatmap_stddev_pixels,
-                                       image_dim,
-                                       x_dense_joints,
-                                       y_dense_joints)
 
-        images_and_jointmaps.append([decoded_img,
-                                     binary_maps,
-                                     heatmaps,
-                                     weights,
-                                     is_visible_weights,
-                                     joint_indices,
-                                     x_joints,
-                                     y_joints,
-                                     parsed_example['head_size']])
+def _render_joint_maps(heatmap_stddev_pixels,
+                       image_dim,
+                       x_dense_joints,
+                       y_dense_joints):
+    """Renders the (binary_maps, heatmaps) ground truth of a batch of dense
+    joints.
+    """
+    binary_maps = _get_binary_maps(image_dim, x_dense_joints, y_dense_joints)
+    heatmaps = _get_joint_heatmaps(heatmap_stddev_pixels,
+                                   image_dim,
+                                   x_dense_joints,
+                                   y_dense_joints)
+
+    return binary_maps, heatmaps
+
+
+def _preprocess_batch_eval(heatmap_stddev_pixels,
+                           image_dim,
+                           images,
+                           x_dense_joints,
+                           y_dense_joints,
+                           weights,
+                           is_visible_weights,
+                           head_size):
+    """Scales a batch from `_parse_and_preprocess_example_eval`, and renders
+    binary maps and heatmaps of its dense joints.
+
+    Returns:
+        The batch in the order of the arguments to `EvalBatch`.
+    """
+    binary_maps, heatmaps = _render_joint_maps(heatmap_stddev_pixels,
+                                               image_dim,
+                                               x_dense_joints,
+                                               y_dense_joints)
+
+    return (_scale_images(images),
+            binary_maps,
+            heatmaps,
+            weights,
+            is_visible_weights,
+            x_dense_joints,
+            y_dense_joints,
+            head_size)
+
+
+def _preprocess_batch_train(heatmap_stddev_pixels,
+                            image_dim,
+                            images,
+                            image_transforms,
+                            x_dense_joints,
+                            y_dense_joints,
+                            weights,
+                            is_visible_weights):
+    """Warps and scales a batch from `_parse_and_preprocess_example_train`, and
+    replaces its distorted dense joints with binary maps and heatmaps of those
+    joints.
+    """
+    images = tf.contrib.image.transform(images=images,
+                                        transforms=image_transforms,
+                                        interpolation='BILINEAR')
 
-    return images_and_jointmaps
+    binary_maps, heatmaps = _render_joint_maps(heatmap_stddev_pixels,
+                                               image_dim,
+                                               x_dense_joints,
+                                               y_dense_joints)
 
+    return _scale_images(images), binary_maps, heatmaps, weights, is_visible_weights
 
-def _get_joints_normal_pdf(dense_joints, std_dev, coords, expand_axis):
-    """Creates a set of 1-D Normal distributions with means equal to the
-    elements of `dense_joints`, and the standard deviations equal to the values
-    in `std_dev`.
 
-    The shapes of the input tensors `dense_joints` and `std_dev` must be the
-    same.
+def _get_joints_normal_pdf(dense_joints, std_dev, coords):
+    """Evaluates the 1-D Normal PDFs with means equal to the elements of
+    `dense_joints`, and standard deviation `std_dev`, at each of `coords`.
 
     Args:
-        dense_joints: Dense tensor of ground truth joint locations in 1-D.
+        dense_joints: [batch_size, NUM_JOINTS] tensor of ground truth joint
+            locations in 1-D.
         std_dev: Standard deviation to use for the normal distribution.
-        coords: Set of co-ordinates over which to evaluate the Normal's PDF.
-        expand_axis: Axis to expand the probabilities by using
-            `tf.expand_dims`. E.g., an `expand_axis` of -2 will turn the result
-            PDF output from a tensor with shape [16, 380] to a tensor with
-            shape [16, 380, 1]
-
+        coords: 1-D NumPy array of co-ordinates over which to evaluate the
+            Normal's PDF.
 
-        3-D tensor with first dim being the length of `dense_joints`, and two
-        more dimensions, one of which is the length of `coords` and the other
-        of which has size 1.
+    Returns:
+        [batch_size, len(coords), NUM_JOINTS] tensor of probabilities.
     """
-    normal = tf.contrib.distributions.Normal(dense_joints, std_dev)
-    probs = normal.prob(coords)
-    probs = tf.transpose(probs)
+    distances = (np.reshape(coords, [1, -1, 1]) -
+                 tf.expand_dims(input=dense_joints, axis=1))
 
-    return tf.expand_dims(input=probs, axis=expand_axis)
+    return tf.exp(-0.5*tf.square(distances/std_dev))/(std_dev*math.sqrt(2*math.pi))
 
 
 def _get_joint_heatmaps(heatmap_stddev_pixels,
                         image_dim,
                         x_dense_joints,
                         y_dense_joints):
-    """Calculates a set of confidence maps for the joints given by
-    `x_dense_joints` and `y_dense_joints`.
+    """Calculates a set of confidence maps for a batch of joints given by
+    `x_dense_joints` and `y_dense_joints`, each of shape
+    [batch_size, NUM_JOINTS].
 
     The confidence maps are 2-D Gaussians with means given by the joints'
     (x, y) locations, and standard deviations given by `heatmap_stddev_pixels`.
     So, e.g. for a set of 16 joints and an image dimension of 380, a set of
-    tensors with shape [380, 380, 16] will be returned, where each
-    [380, 380, i] tensor will be a gaussian corresponding to the i'th joint.
+    tensors with shape [batch_size, 380, 380, 16] will be returned, where each
+    [b, 380, 380, i] tensor will be a gaussian corresponding to the i'th joint.
+
+    Since the 2-D Gaussians are separable, each heatmap is the outer product
+    of a 1-D Gaussian along y with a 1-D Gaussian along x.
+    """
+    std_dev = heatmap_stddev_pixels/image_dim
+
+    coords = np.linspace(-0.5, 0.5, image_dim).astype(np.float32)
+
+    x_probs = _get_joints_normal_pdf(x_dense_joints, std_dev, coords)
+    y_probs = _get_joints_normal_pdf(y_dense_joints, std_dev, coords)
+
+    return tf.multiply(tf.expand_dims(input=y_probs, axis=2),
+                       tf.expand_dims(input=x_probs, axis=1))
+
+
+def _get_binary_maps(image_dim, x_dense_joints, y_dense_joints):
+    """Creates binary maps of shape [batch_size, image_dim, image_dim,
+    NUM_JOINTS] for a batch of dense joints, that are 1 within
+    `BINARY_MAP_RADIUS_PIXELS` of each joint and 0 elsewhere.
+
+    These are the same maps that `write_tf_record` writes to the TFRecords.
     """
-    std_dev = np.full(Person.NUM_JOINTS, heatmap_stddev_pixels/image_dim)
-    std_dev = tf.cast(std_dev, tf.float32)
+    coords = np.linspace(-0.5, 0.5, image_dim).astype(np.float32)
 
-    pixel_spacing = np.linspace(-0.5, 0.5, image_dim)
-    coords = np.empty((image_dim, Person.NUM_JOINTS), dtype=np.float32)
-    coords[...] = pixel_spacing[:, None]
+    y_distances = (np.reshape(coords, [1, -1, 1, 1]) -
+                   tf.reshape(y_dense_joints, [-1, 1, 1, Person.NUM_JOINTS]))
+    x_distances = (np.reshape(coords, [1, 1, -1, 1]) -
+                   tf.reshape(x_dense_joints, [-1, 1, 1, Person.NUM_JOINTS]))
 
-    x_probs = _get_joints_normal_pdf(x_dense_joints, std_dev, coords, -2)
-    y_probs = _get_joints_normal_pdf(y_dense_joints, std_dev, coords, -1)
+    binary_maps = (tf.square(y_distances) + tf.square(x_distances) <
+                   (BINARY_MAP_RADIUS_PIXELS/image_dim)**2)
 
-    heatmaps = tf.matmul(a=y_probs, b=x_probs)
-    heatmaps = tf.transpose(a=heatmaps, perm=[1, 2, 0])
+    return tf.cast(binary_maps, tf.float32)
 
-    return heatmaps
 
 def _get_is_visible_weights(sparse_joint_indices, is_visible_list, weights):
     """Calculates and returns a set of per-joint weights, which are 1 if and
@@ -423,82 +586,68 @@ def _maybe_flip_weights(weights, should_flip):
 
 
 def _parse_and_preprocess_example_train(example_serialized,
-                                        num_preprocess_threads,
                                         image_dim,
-                                        heatmap_stddev_pixels,
-                                        max_rotation_angle):
-    """Parses Example protobufs containing input images and their ground truth
-    vectors and preprocesses those images, returning a vector with one
-    preprocessed tensor per thread.
-
-    The loop over the threads (as opposed to a deep copy of the first resultant
-    Tensor) allows for different image distortion to be done depending on the
-    thread ID, although currently all image preprocessing is identical.
+                                        max_rotation_angle,
+                                        min_scale,
+                                        max_scale,
+                                        max_translation):
+    """Parses an Example protobuf containing an input image and its ground
+    truth vectors and preprocesses that image.
 
     Args:
         example_serialized: Tensor containing a serialized example, as read
             from a TFRecord file.
-        num_preprocess_threads: Number of threads to use for image
-            preprocessing.
         image_dim: Dimension of square input images.
-        heatmap_stddev_pixels: Standard deviation of Gaussian joint heatmap, in
-            pixels.
         max_rotation_angle: Maximum amount to rotate images, in radians.
+        min_scale: Minimum factor to scale images by.
+        max_scale: Maximum factor to scale images by.
+        max_translation: Maximum translation of images in x and in y, as a
+            fraction of the image dimension.
 
     Returns:
-        A list of lists, one for each thread, where each inner list contains a
-        decoded image with colours scaled to range [-1, 1], as well as the
-        sparse joint ground truth vectors.
+        A tuple containing a colour distorted image with colours in range
+        [0, 1] and the transform to warp it by, as well as the distorted dense
+        joints and weights. The image is warped, and ground truth maps are
+        rendered from the joints, after batching by `_preprocess_batch_train`.
     """
-    images_and_joint_maps = []
-    for thread_id in range(num_preprocess_threads):
-        parsed_example = _parse_example_proto(example_serialized, image_dim)
-
-        x_dense_joints, y_dense_joints, weights, sparse_joint_indices = sparse_joints_to_dense_single_example(
-            parsed_example['x_joints'],
-            parsed_example['y_joints'],
-            parsed_example['joint_indices'],
-            Person.NUM_JOINTS)
-
-        is_visible_weights = _get_is_visible_weights(sparse_joint_indices,
-                                                     parsed_example['is_visible_list'].values,
-                                                     weights)
-
-        heatmaps = _get_joint_heatmaps(heatmap_stddev_pixels,
-                                       image_dim,
-                                       x_dense_joints,
-                                       y_dense_joints)
-
-        distorted_image, binary_maps, heatmaps, should_flip = _distort_image(
-            parsed_example['image'],
-            parsed_example['binary_maps'],
-            heatmaps,
-            image_dim,
-            thread_id,
-            max_rotation_angle)
-
-        weights = _maybe_flip_weights(weights, should_flip)
-        is_visible_weights = _maybe_flip_weights(is_visible_weights, should_flip)
-
-        images_and_joint_maps.append([distorted_image,
-                                      binary_maps,
-                                      heatmaps,
-                                      weights,
-                                      is_visible_weights])
-
-    return images_and_joint_maps
-
-
-def _setup_batch_queue(images_and_joint_maps, batch_size, num_preprocess_threads):
-    """Sets up a batch queue that returns, e.g., a batch of 32 each of images,
-    sparse joints and sparse joint indices.
+    parsed_example = _parse_example_proto(example_serialized, image_dim)
+
+    x_dense_joints, y_dense_joints, weights, sparse_joint_indices = sparse_joints_to_dense_single_example(
+        parsed_example['x_joints'],
+        parsed_example['y_joints'],
+        parsed_example['joint_indices'],
+        Person.NUM_JOINTS)
+
+    is_visible_weights = _get_is_visible_weights(sparse_joint_indices,
+                                                 parsed_example['is_visible_list'].values,
+                                                 weights)
+
+    distorted_image, image_transform, x_dense_joints, y_dense_joints, should_flip = _distort_image(
+        parsed_example['image'],
+        x_dense_joints,
+        y_dense_joints,
+        image_dim,
+        max_rotation_angle,
+        min_scale,
+        max_scale,
+        max_translation)
+
+    weights = _maybe_flip_weights(weights, should_flip)
+    is_visible_weights = _maybe_flip_weights(is_visible_weights, should_flip)
+
+    return (distorted_image,
+            image_transform,
+            x_dense_joints,
+            y_dense_joints,
+            weights,
+            is_visible_weights)
+
+
+def add_batch_summaries(images, binary_maps, heatmaps):
+    """Adds image summaries of a batch of `images`, and of the ground truth
+    `binary_maps` and `heatmaps` of all joints merged into one image.
     """
-    images, binary_maps, heatmaps, weights, is_visible_weights = tf.train.batch_join(
-        tensors_list=images_and_joint_maps,
-        batch_size=batch_size,
-        capacity=num_preprocess_threads*batch_size)
-
-    image_dim = heatmaps.get_shape().as_list()[1]
+    batch_size, image_dim = heatmaps.get_shape().as_list()[0:2]
 
     merged_heatmaps = tf.reshape(tf.reduce_max(heatmaps,3),[batch_size,image_dim, image_dim, 1])
     merged_heatmaps = tf.cast(merged_heatmaps, tf.float32)
@@ -510,75 +659,195 @@ def _setup_batch_queue(images_and_joint_maps, batch_size, num_preprocess_threads
     tf.summary.image(name='heatmaps', tensor=merged_heatmaps)
     tf.summary.image(name='binary_maps', tensor=merged_binary_maps)
 
-    return images, binary_maps, heatmaps, weights, is_visible_weights
+
+def _setup_eval_example_dataset(data_filenames, image_dim, num_preprocess_threads):
+    """Sets up a dataset of the examples in `data_filenames` from
+    `_parse_and_preprocess_example_eval`, read in order, once.
+    """
+    compression_type = tfrecord_index.get_compression_type(data_filenames)
+    dataset_compression_type = tfrecord_index.get_dataset_compression_type(
+        compression_type)
+
+    dataset = tf.data.TFRecordDataset(filenames=data_filenames,
+                                      compression_type=dataset_compression_type)
+
+    return dataset.map(
+        map_func=lambda example_serialized: _parse_and_preprocess_example_eval(
+            example_serialized, image_dim),
+        num_parallel_calls=num_preprocess_threads)
+
+
+def _build_eval_cache(cache_dir,
+                      data_filenames,
+                      num_examples,
+                      image_dim,
+                      batch_size,
+                      num_preprocess_threads):
+    """Decodes and preprocesses each example in `data_filenames` once, in its
+    own graph and session, and writes the results to a new evaluation cache in
+    `cache_dir` (see `pose_utils.eval_cache`).
+    """
+    with tf.Graph().as_default():
+        dataset = _setup_eval_example_dataset(data_filenames,
+                                              image_dim,
+                                              num_preprocess_threads)
+        dataset = dataset.map(
+            map_func=lambda image, *labels: (
+                (tf.image.convert_image_dtype(image=image, dtype=tf.uint8, saturate=True),) +
+                labels))
+        dataset = dataset.batch(batch_size)
+        next_batch = dataset.make_one_shot_iterator().get_next()
+
+        cache_arrays = eval_cache.create_eval_cache(cache_dir,
+                                                    num_examples,
+                                                    image_dim)
+
+        with tf.Session() as session:
+            start = 0
+            while start < num_examples:
+                batch = session.run(next_batch)
+                end = start + len(batch[0])
+                for array_name, values in zip(eval_cache.ARRAY_NAMES, batch):
+                    cache_arrays[array_name][start:end] = values
+                start = end
+
+    eval_cache.finish_eval_cache(cache_dir, cache_arrays, data_filenames, image_dim)
+
+
+def _setup_cached_eval_batches(cache_arrays, batch_size, image_dim):
+    """Sets up an infinitely repeating dataset of batches read, in order, from
+    the evaluation cache `cache_arrays`, in the same format as batches of
+    `_parse_and_preprocess_example_eval`.
+    """
+    num_examples = len(cache_arrays['head_size'])
+
+    def _gather_cached_examples(example_indices):
+        return [cache_arrays[array_name][example_indices]
+                for array_name in eval_cache.ARRAY_NAMES]
+
+    def _read_cached_batch(example_indices):
+        batch = tf.py_func(
+            func=_gather_cached_examples,
+            inp=[example_indices],
+            Tout=[tf.uint8, tf.float32, tf.float32, tf.float32, tf.float32, tf.float32],
+            stateful=False)
+
+        images = tf.reshape(batch[0], [batch_size, image_dim, image_dim, 3])
+        images = tf.image.convert_image_dtype(image=images, dtype=tf.float32)
+        labels = [tf.reshape(labels, [batch_size, Person.NUM_JOINTS])
+                  for labels in batch[1:5]]
+        head_size = tf.reshape(batch[5], [batch_size])
+
+        return tuple([images] + labels + [head_size])
+
+    dataset = tf.data.Dataset.range(num_examples).repeat()
+    dataset = dataset.apply(tf.contrib.data.batch_and_drop_remainder(batch_size))
+
+    return dataset.map(map_func=_read_cached_batch)
 
 
 def setup_eval_input_pipeline(batch_size,
                               num_preprocess_threads,
                               image_dim,
                               heatmap_stddev_pixels,
-                              data_filenames):
+                              data_filenames,
+                              num_examples=None,
+                              eval_cache_dir=None,
+                              eval_cache_in_memory=False):
     """Sets up an input pipeline for model evaluation.
 
     This function is similar to `setup_train_input_pipeline`, except that
-    images are not distorted, and the filename queue will process only one
-    TFRecord at a time. Therefore no Example queue is needed.
+    images are not distorted, and the TFRecords are read one at a time, in
+    order. Therefore no shuffling is needed.
+
+    The examples repeat indefinitely. The iterator must be initialized, with
+    the returned batch's `iterator_initializer`, before reading, and can be
+    re-initialized to read from the first example again, so that the same
+    session can evaluate several checkpoints on the same batches.
+
+    If `eval_cache_dir` is given, the decoded examples are read from the
+    evaluation cache in that directory instead of from the TFRecords, and the
+    cache is built first if it does not exist or is out of date. Building the
+    cache requires `num_examples`, the number of examples in
+    `data_filenames`.
     """
-    filename_queue = tf.train.string_input_producer(
-        string_tensor=data_filenames,
-        shuffle=False,
-        capacity=16)
-
-    options = tf.python_io.TFRecordOptions(
-        compression_type=tf.python_io.TFRecordCompressionType.ZLIB)
-    reader = tf.TFRecordReader(options=options)
-    _, example_serialized = reader.read(filename_queue)
-
-    images_and_joint_maps = _parse_and_preprocess_example_eval(
-        heatmap_stddev_pixels,
-        example_serialized,
-        num_preprocess_threads,
-        image_dim)
-
-    images, binary_maps, heatmaps, weights, is_visible_weights, joint_indices, x_joints, y_joints, head_size = tf.train.batch_join(
-        tensors_list=images_and_joint_maps,
-        batch_size=batch_size,
-        capacity=num_preprocess_threads*batch_size)
+    if eval_cache_dir is None:
+        dataset = _setup_eval_example_dataset(data_filenames,
+                                              image_dim,
+                                              num_preprocess_threads)
+        dataset = dataset.repeat()
+        dataset = dataset.apply(tf.contrib.data.batch_and_drop_remainder(batch_size))
+    else:
+        cache_arrays = eval_cache.load_eval_cache(eval_cache_dir,
+                                                  data_filenames,
+                                                  image_dim,
+                                                  eval_cache_in_memory)
+        if cache_arrays is None:
+            assert num_examples is not None
+            _build_eval_cache(eval_cache_dir,
+                              data_filenames,
+                              num_examples,
+                              image_dim,
+                              batch_size,
+                              num_preprocess_threads)
+            cache_arrays = eval_cache.load_eval_cache(eval_cache_dir,
+                                                      data_filenames,
+                                                      image_dim,
+                                                      eval_cache_in_memory)
+
+        dataset = _setup_cached_eval_batches(cache_arrays, batch_size, image_dim)
+
+    dataset = dataset.map(
+        map_func=lambda *batch: _preprocess_batch_eval(heatmap_stddev_pixels,
+                                                       image_dim,
+                                                       *batch))
+    dataset = dataset.prefetch(buffer_size=PREFETCH_BATCHES)
+
+    iterator = dataset.make_initializable_iterator()
+    images, binary_maps, heatmaps, weights, is_visible_weights, x_dense_joints, y_dense_joints, head_size = (
+        iterator.get_next())
 
     return EvalBatch(images,
                      binary_maps,
                      heatmaps,
                      weights,
                      is_visible_weights,
-                     joint_indices,
-                     x_joints,
-                     y_joints,
+                     x_dense_joints,
+                     y_dense_joints,
                      head_size,
-                     batch_size)
+                     batch_size,
+                     iterator.initializer)
 
 
-def setup_train_input_pipeline(FLAGS, data_filenames):
+def setup_train_input_pipeline(FLAGS,
+                               data_filenames,
+                               examples_per_shard=EXAMPLES_PER_SHARD):
     """Sets up an input pipeline that reads example protobufs from all TFRecord
     files, assumed to be named train*.tfrecord (e.g. train0.tfrecord),
     decodes and preprocesses the images.
 
-    There are three queues: `filename_queue`, contains the TFRecord filenames,
-    and feeds `examples_queue` with serialized example protobufs.
+    The TFRecord filenames are shuffled, and `num_readers` of them are read in
+    parallel into a shuffle buffer of serialized example protobufs (see
+    `_setup_example_dataset`).
 
-    Then, serialized examples are dequeued from `examples_queue`, preprocessed
-    in parallel by `num_preprocess_threads` and the result is enqueued into the
-    queue created by `batch_join`. A dequeue operation from the `batch_join`
-    queue is what is returned from `preprocess_images`. What is dequeued is a
+    Then, serialized examples are preprocessed in parallel by
+    `num_preprocess_threads`, batched, and prefetched. What is returned is a
     batch of size `batch_size` containing a set of, for example, 32 images in
-    the case of `images` or a sparse vector of floating-point joint
-    co-ordinates (in range [0,1]) in the case of `joints`.
+    the case of `images` or dense heatmaps in the case of `heatmaps`.
+
+    No summaries of the batch are added here, since running them would dequeue
+    another batch. See `add_batch_summaries`.
 
-    Also adds a summary for the images.
+    The position of the pipeline's iterator, including the contents of its
+    shuffle buffer, can be checkpointed by a `tf.train.Saver` of the
+    saveables in the `INPUT_ITERATOR_SAVEABLES` collection, so that a resumed
+    training run continues from the next example.
 
     Args:
         num_readers: Number of file readers to use.
-        input_queue_memory_factor: Input to `_setup_example_queue`. See
-            `_setup_example_queue` for details.
+        input_queue_memory_factor: Factor by which to scale
+            `examples_per_shard` up to the size of the example shuffle
+            buffer.
         batch_size: Number of examples to process at once (in one training
             step).
         num_preprocess_threads: Number of threads to use to preprocess image
@@ -586,6 +855,19 @@ def setup_train_input_pipeline(FLAGS, data_filenames):
         image_dim: Dimension of square input images.
         data_filenames: Set of filenames to get examples from.
         max_rotation_angle: Maximum amount to rotate images, in radians.
+        min_scale: Minimum factor to scale images by.
+        max_scale: Maximum factor to scale images by.
+        max_translation: Maximum translation of images in x and in y, as a
+            fraction of the image dimension.
+        input_seed: Seed for shuffling the examples, or `None`. Augmentation
+            is seeded by the graph-level seed.
+        num_workers: Number of training processes splitting the shards of
+            `data_filenames` between them.
+        worker_index: Index of this training process.
+        reshuffle_worker_shards: Reassign the shards to workers every epoch?
+        examples_per_shard: Average number of examples in each file of
+            `data_filenames`, used to size the shuffle buffer. Defaults to
+            an estimate, `EXAMPLES_PER_SHARD`.
 
     Returns:
         (images, heatmaps, weights, batch_size): List of image
@@ -601,28 +883,50 @@ def setup_train_input_pipeline(FLAGS, data_filenames):
     image_dim = FLAGS.image_dim
     heatmap_stddev_pixels = FLAGS.heatmap_stddev_pixels
     max_rotation_angle = FLAGS.max_rotation_angle
+    min_scale = FLAGS.min_scale
+    max_scale = FLAGS.max_scale
+    max_translation = FLAGS.max_translation
+    input_seed = FLAGS.input_seed
+    num_workers = FLAGS.num_workers
+    worker_index = FLAGS.worker_index
+    reshuffle_worker_shards = FLAGS.reshuffle_worker_shards
 
-    # TODO(brendan): num_readers == 1 case
-    assert num_readers > 1
+    compression_type = tfrecord_index.get_compression_type(data_filenames)
 
     with tf.name_scope('batch_processing'):
-        filename_queue = tf.train.string_input_producer(
-            string_tensor=data_filenames,
-            shuffle=True,
-            capacity=16)
-
-        example_serialized = _setup_example_queue(filename_queue,
-                                                  num_readers,
-                                                  input_queue_memory_factor,
-                                                  batch_size)
-
-        images_and_joint_maps = _parse_and_preprocess_example_train(
-            example_serialized,
-            num_preprocess_threads,
-            image_dim,
-            heatmap_stddev_pixels,
-            max_rotation_angle)
-
-        return _setup_batch_queue(images_and_joint_maps,
-                                  batch_size,
-                                  num_preprocess_threads)
+        examples = _setup_example_dataset(data_filenames,
+                                          num_readers,
+                                          input_queue_memory_factor*examples_per_shard,
+                                          compression_type,
+                                          input_seed,
+                                          num_workers,
+                                          worker_index,
+                                          reshuffle_worker_shards)
+
+        # NOTE(brendan): The preprocessing graph is built once, and run on
+        # `num_preprocess_threads` examples at a time, so the size of the graph
+        # does not depend on the number of threads.
+        dataset = examples.map(
+            map_func=lambda example_serialized: _parse_and_preprocess_example_train(
+                example_serialized,
+                image_dim,
+                max_rotation_angle,
+                min_scale,
+                max_scale,
+                max_translation),
+            num_parallel_calls=num_preprocess_threads)
+        dataset = dataset.apply(tf.contrib.data.batch_and_drop_remainder(batch_size))
+        dataset = dataset.map(
+            map_func=lambda *batch: _preprocess_batch_train(heatmap_stddev_pixels,
+                                                            image_dim,
+                                                            *batch))
+        dataset = dataset.prefetch(buffer_size=PREFETCH_BATCHES)
+
+        iterator = dataset.make_one_shot_iterator()
+        tf.add_to_collection(
+            name=INPUT_ITERATOR_SAVEABLES,
+            value=tf.contrib.data.make_saveable_from_iterator(iterator))
+
+        images, binary_maps, heatmaps, weights, is_visible_weights = iterator.get_next()
+
+        return images, binary_maps, heatmaps, weights, is_visible_weights
@@ -0,0 +1,138 @@
+"""This module saves checkpoints without blocking the training loop.
+
+Saving a checkpoint is split in two. First, in the training thread, the values
+of the variables are fetched into host memory, which is the only part that
+has to wait for the training session. Then, a background thread writes that
+snapshot to disk, while training continues.
+
+The background thread writes with a `tf.train.Saver` of its own, over
+variables in a separate graph with the same names as the training variables.
+The checkpoints, including the `checkpoint` state file that keeps the most
+recent `max_to_keep` of them, are therefore the same as if the training
+graph's `Saver` had written them, and are found by `tf.train.latest_checkpoint`
+in the same way.
+"""
+import queue
+import threading
+import tensorflow as tf
+
+class AsyncCheckpointSaver(object):
+    """Saves checkpoints of `var_list`, from the training session, on a
+    background thread.
+
+    At most one snapshot waits to be written while another is being written,
+    so a `save` blocks if checkpoints are requested faster than they can be
+    written.
+    """
+    def __init__(self, var_list, checkpoint_dir, max_to_keep=5):
+        self._var_list = var_list
+        self._snapshot = None
+        self._write_error = None
+
+        self._writer_graph = tf.Graph()
+        with self._writer_graph.as_default():
+            with tf.device('/cpu:0'):
+                self._writer_variables = {}
+                for var in var_list:
+                    self._writer_variables[var.op.name] = tf.Variable(
+                        initial_value=tf.placeholder(dtype=var.dtype.base_dtype,
+                                                     shape=var.get_shape()),
+                        trainable=False,
+                        collections=[],
+                        name=var.op.name)
+
+                self._writer_saver = tf.train.Saver(var_list=self._writer_variables,
+                                                    max_to_keep=max_to_keep)
+            self._writer_session = tf.Session()
+
+        # NOTE(brendan): Carry on the retention of checkpoints from a previous
+        # run in `checkpoint_dir`, so that they are deleted in turn.
+        checkpoint_state = tf.train.get_checkpoint_state(checkpoint_dir=checkpoint_dir)
+        if checkpoint_state is not None:
+            self._writer_saver.recover_last_checkpoints(
+                checkpoint_state.all_model_checkpoint_paths)
+
+        self._write_queue = queue.Queue(maxsize=1)
+        self._writer_thread = threading.Thread(target=self._write_checkpoints)
+        self._writer_thread.daemon = True
+        self._writer_thread.start()
+
+    @property
+    def snapshot(self):
+        """Dictionary of the values of the variables at the last `save`, keyed
+        by variable name.
+        """
+        return self._snapshot
+
+    def _write_checkpoints(self):
+        """Writes each snapshot put on the write queue, until `None` is put."""
+        while True:
+            write_request = self._write_queue.get()
+            try:
+                if write_request is None:
+                    return
+
+                snapshot, save_path, global_step = write_request
+
+                initializers = []
+                feed_dict = {}
+                for var_name, writer_variable in self._writer_variables.items():
+                    initializers.append(writer_variable.initializer)
+                    feed_dict[writer_variable.initializer.inputs[1]] = snapshot[var_name]
+
+                self._writer_session.run(initializers, feed_dict=feed_dict)
+                self._writer_saver.save(sess=self._writer_session,
+                                        save_path=save_path,
+                                        global_step=global_step)
+            except Exception as error:
+                self._write_error = error
+            finally:
+                self._write_queue.task_done()
+
+    def _raise_write_error(self):
+        if self._write_error is not None:
+            write_error = self._write_error
+            self._write_error = None
+            raise write_error
+
+    def save(self, session, save_path, global_step):
+        """Snapshots the variables in `session`, and queues the snapshot to be
+        written to `save_path`-`global_step`.
+
+        Returns:
+            The path that the checkpoint will be written to.
+        """
+        self._raise_write_error()
+
+        values = session.run(self._var_list)
+        self._snapshot = {var.op.name: value
+                          for var, value in zip(self._var_list, values)}
+
+        self._write_queue.put((self._snapshot, save_path, global_step))
+
+        return '{}-{}'.format(save_path, global_step)
+
+    def restore_snapshot(self, session, var_list):
+        """Loads the variables `var_list` in `session`, which may belong to
+        another graph (e.g. an evaluation graph), from the last snapshot, by
+        name, without waiting for it to be written.
+        """
+        initializers = []
+        feed_dict = {}
+        for var in var_list:
+            initializers.append(var.initializer)
+            feed_dict[var.initializer.inputs[1]] = self._snapshot[var.op.name]
+
+        session.run(initializers, feed_dict=feed_dict)
+
+    def wait(self):
+        """Blocks until all queued checkpoints have been written."""
+        self._write_queue.join()
+        self._raise_write_error()
+
+    def close(self):
+        """Writes any queued checkpoints, and stops the writer thread."""
+        self._write_queue.put(None)
+        self._writer_thread.join()
+        self._writer_session.close()
+        self._raise_write_error()
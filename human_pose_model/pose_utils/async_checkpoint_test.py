@@ -0,0 +1,115 @@
+"""Tests for the background checkpoint writer."""
+import os
+import tempfile
+import numpy as np
+import tensorflow as tf
+from pose_utils.async_checkpoint import AsyncCheckpointSaver
+
+def _build_variables():
+    """Builds the two variables that the tests checkpoint, in the default
+    graph.
+    """
+    weights = tf.Variable(tf.zeros([2, 3]), name='weights')
+    with tf.variable_scope('layer'):
+        bias = tf.Variable(tf.zeros([3]), name='bias')
+
+    return weights, bias
+
+
+class AsyncCheckpointSaverTest(tf.test.TestCase):
+    def setUp(self):
+        super(AsyncCheckpointSaverTest, self).setUp()
+        self._checkpoint_dir = tempfile.mkdtemp(dir=self.get_temp_dir())
+        self._save_path = os.path.join(self._checkpoint_dir, 'model.ckpt')
+
+        self._variables = _build_variables()
+        self._session = tf.Session()
+        self._session.run(tf.global_variables_initializer())
+
+    def tearDown(self):
+        self._session.close()
+        super(AsyncCheckpointSaverTest, self).tearDown()
+
+    def _set_step_values(self, step):
+        weights, bias = self._variables
+        weights.load(np.full([2, 3], step), self._session)
+        bias.load(np.full([3], -step), self._session)
+
+    def _restore(self, checkpoint_path):
+        """Restores `checkpoint_path` into a new graph with a plain
+        `tf.train.Saver`, and returns the values of the variables.
+        """
+        with tf.Graph().as_default():
+            variables = _build_variables()
+            with tf.Session() as session:
+                tf.train.Saver().restore(session, checkpoint_path)
+                return session.run(variables)
+
+    def test_save_is_found_by_latest_checkpoint(self):
+        saver = AsyncCheckpointSaver(self._variables, self._checkpoint_dir)
+        self._set_step_values(1)
+        checkpoint_path = saver.save(self._session, self._save_path, 1)
+        # NOTE(brendan): Values changed after `save` returns must not be
+        # written, since the snapshot was already taken.
+        self._set_step_values(2)
+        saver.close()
+
+        self.assertEqual(tf.train.latest_checkpoint(self._checkpoint_dir),
+                         checkpoint_path)
+
+        weights, bias = self._restore(checkpoint_path)
+        self.assertAllEqual(weights, np.full([2, 3], 1))
+        self.assertAllEqual(bias, np.full([3], -1))
+
+    def test_bounded_retention(self):
+        saver = AsyncCheckpointSaver(self._variables, self._checkpoint_dir, 2)
+        checkpoint_paths = []
+        for step in range(1, 4):
+            self._set_step_values(step)
+            checkpoint_paths.append(saver.save(self._session, self._save_path, step))
+        saver.wait()
+
+        checkpoint_state = tf.train.get_checkpoint_state(self._checkpoint_dir)
+        self.assertEqual(list(checkpoint_state.all_model_checkpoint_paths),
+                         checkpoint_paths[1:])
+        self.assertFalse(tf.train.checkpoint_exists(checkpoint_paths[0]))
+        saver.close()
+
+        # NOTE(brendan): A new saver on the same directory carries on deleting
+        # the checkpoints of the previous one.
+        saver = AsyncCheckpointSaver(self._variables, self._checkpoint_dir, 2)
+        saver.save(self._session, self._save_path, 4)
+        saver.close()
+
+        self.assertFalse(tf.train.checkpoint_exists(checkpoint_paths[1]))
+        self.assertTrue(tf.train.checkpoint_exists(checkpoint_paths[2]))
+
+    def test_restore_snapshot(self):
+        saver = AsyncCheckpointSaver(self._variables, self._checkpoint_dir)
+        self._set_step_values(7)
+        saver.save(self._session, self._save_path, 7)
+
+        with tf.Graph().as_default():
+            variables = _build_variables()
+            with tf.Session() as session:
+                saver.restore_snapshot(session, variables)
+                weights, bias = session.run(variables)
+
+        saver.close()
+
+        self.assertAllEqual(weights, np.full([2, 3], 7))
+        self.assertAllEqual(bias, np.full([3], -7))
+
+    def test_write_error_is_raised(self):
+        saver = AsyncCheckpointSaver(self._variables, self._checkpoint_dir)
+        bad_save_path = os.path.join(self._checkpoint_dir, 'missing', 'model.ckpt')
+        saver.save(self._session, bad_save_path, 1)
+
+        with self.assertRaises(ValueError):
+            saver.wait()
+
+        saver.close()
+
+
+if __name__ == "__main__":
+    tf.test.main()
@@ -0,0 +1,132 @@
+"""This module reads and writes a cache of the preprocessed validation set, so
+that repeated evaluations do not decode the same JPEGs again.
+
+The cache is a directory of NumPy `.npy` arrays, one row per validation
+example, holding the decoded images as uint8 and the dense joints, weights and
+head sizes needed to render ground truth and compute PCKh. The arrays are
+memory-mapped when read, so the cache does not have to fit in RAM.
+
+The cache is tied to the TFRecords it was built from by their names, sizes
+and modification times, and to the image dimension. A `metadata.json` file
+holding those is written last, so a cache whose build was interrupted is
+ignored (then rebuilt).
+"""
+import json
+import os
+import numpy as np
+import tensorflow as tf
+from dataset.mpii_datatypes import Person
+
+CACHE_FORMAT_VERSION = 1
+METADATA_FILENAME = 'metadata.json'
+ARRAY_NAMES = ('images',
+               'x_dense_joints',
+               'y_dense_joints',
+               'weights',
+               'is_visible_weights',
+               'head_size')
+
+def _get_array_specs(num_examples, image_dim):
+    """Returns a dictionary of (shape, dtype) of each cached array."""
+    joints_shape = (num_examples, Person.NUM_JOINTS)
+
+    return {'images': ((num_examples, image_dim, image_dim, 3), np.uint8),
+            'x_dense_joints': (joints_shape, np.float32),
+            'y_dense_joints': (joints_shape, np.float32),
+            'weights': (joints_shape, np.float32),
+            'is_visible_weights': (joints_shape, np.float32),
+            'head_size': ((num_examples,), np.float32)}
+
+
+def _get_array_filepath(cache_dir, array_name):
+    return os.path.join(cache_dir, array_name + '.npy')
+
+
+def _get_metadata(data_filenames, image_dim, num_examples):
+    """Returns the metadata that identifies the cache of `data_filenames`."""
+    data_files = []
+    for data_file in sorted(data_filenames):
+        data_stat = tf.gfile.Stat(data_file)
+        data_files.append([os.path.basename(data_file),
+                           data_stat.length,
+                           data_stat.mtime_nsec])
+
+    return {'format_version': CACHE_FORMAT_VERSION,
+            'image_dim': image_dim,
+            'num_examples': num_examples,
+            'data_files': data_files}
+
+
+def create_eval_cache(cache_dir, num_examples, image_dim):
+    """Creates empty, writable, memory-mapped arrays for a new cache in
+    `cache_dir`.
+
+    Any previous cache in `cache_dir` is invalidated. The new cache is only
+    valid once `finish_eval_cache` has been called.
+
+    Returns:
+        A dictionary of the arrays, to be filled in by the caller.
+    """
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
+
+    metadata_filepath = os.path.join(cache_dir, METADATA_FILENAME)
+    if os.path.exists(metadata_filepath):
+        os.remove(metadata_filepath)
+
+    cache_arrays = {}
+    for array_name, (shape, dtype) in _get_array_specs(num_examples, image_dim).items():
+        cache_arrays[array_name] = np.lib.format.open_memmap(
+            _get_array_filepath(cache_dir, array_name),
+            mode='w+',
+            dtype=dtype,
+            shape=shape)
+
+    return cache_arrays
+
+
+def finish_eval_cache(cache_dir, cache_arrays, data_filenames, image_dim):
+    """Flushes `cache_arrays` from `create_eval_cache` to disk, and marks the
+    cache in `cache_dir` as a valid cache of `data_filenames`.
+    """
+    for array in cache_arrays.values():
+        array.flush()
+
+    num_examples = len(cache_arrays['head_size'])
+    metadata = _get_metadata(data_filenames, image_dim, num_examples)
+    with open(os.path.join(cache_dir, METADATA_FILENAME), 'w') as f:
+        json.dump(metadata, f)
+
+
+def load_eval_cache(cache_dir, data_filenames, image_dim, in_memory=False):
+    """Loads the cache of the preprocessed `data_filenames` from `cache_dir`.
+
+    Args:
+        cache_dir: Directory that the cache was created in.
+        data_filenames: TFRecords that the cache should have been built from.
+        image_dim: Dimension of the cached images.
+        in_memory: Read the whole cache into RAM, instead of memory-mapping
+            it?
+
+    Returns:
+        A dictionary of the cached arrays, or `None` if there is no cache or
+        it was built from different TFRecords or image dimension.
+    """
+    metadata_filepath = os.path.join(cache_dir, METADATA_FILENAME)
+    if not os.path.exists(metadata_filepath):
+        return None
+
+    with open(metadata_filepath, 'r') as f:
+        metadata = json.load(f)
+
+    if metadata != _get_metadata(data_filenames, image_dim, metadata['num_examples']):
+        return None
+
+    if in_memory:
+        mmap_mode = None
+    else:
+        mmap_mode = 'r'
+
+    return {array_name: np.load(_get_array_filepath(cache_dir, array_name),
+                                mmap_mode=mmap_mode)
+            for array_name in ARRAY_NAMES}
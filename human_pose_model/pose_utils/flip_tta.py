@@ -0,0 +1,56 @@
+"""This module implements left-right flip test-time augmentation (TTA).
+
+Each batch of images is concatenated with its mirrored copy, so that both run
+through the network in one forward pass. The heatmaps predicted for the
+mirrored images are mirrored back, and their joints swapped left for right,
+before being averaged with the heatmaps predicted for the original images.
+"""
+import tensorflow as tf
+from dataset.mpii_datatypes import LEFT_RIGHT_FLIPPED_INDICES
+
+def flip_images(images):
+    """Mirrors a [batch_size, height, width, channels] batch of images
+    left-right.
+    """
+    return tf.reverse(images, axis=[2])
+
+
+def flip_joint_maps(joint_maps):
+    """Mirrors a [batch_size, height, width, NUM_JOINTS] batch of heatmaps or
+    binary maps left-right, and swaps the left and right joints, so that the
+    maps correspond to the mirrored images.
+    """
+    return tf.gather(params=flip_images(joint_maps),
+                     indices=LEFT_RIGHT_FLIPPED_INDICES,
+                     axis=3)
+
+
+def flip_joint_weights(weights):
+    """Swaps the left and right joints of [batch_size, NUM_JOINTS] weights."""
+    return tf.gather(params=weights, indices=LEFT_RIGHT_FLIPPED_INDICES, axis=1)
+
+
+def concat_flipped(tensor, flip_fn):
+    """Returns `tensor` concatenated, along the batch dimension, with its
+    mirrored copy from `flip_fn`.
+    """
+    return tf.concat(axis=0, values=[tensor, flip_fn(tensor)])
+
+
+def merge_flipped_logits(logits):
+    """Averages the logits predicted for a batch from `concat_flipped` into
+    the logits of the original batch.
+
+    Args:
+        logits: [2*batch_size, height, width, NUM_JOINTS] logits, the first
+            half predicted for the original images and the second half for
+            the mirrored images.
+
+    Returns:
+        [batch_size, height, width, NUM_JOINTS] averaged logits.
+    """
+    original_logits, flipped_logits = tf.split(value=logits,
+                                               num_or_size_splits=2,
+                                               axis=0)
+
+    return (original_logits + flip_joint_maps(flipped_logits))/2
@@ -0,0 +1,131 @@
+"""This module aggregates the time of each op across traced `session.run`
+calls, and reports the most expensive ops per profiled step.
+
+Op times are reported per profiled step, where a step may be made up of more
+than one traced `session.run`, e.g. the input staging and training phases of
+a training step.
+
+The aggregated op times are grouped by the part of the graph that the ops
+belong to, e.g. the `resnet_bulat` or `vgg_bulat` networks or the input
+pipeline, so that the most expensive ops of each can be reported.
+
+Only the fields of the `StepStats` protocol buffer are read here, so this
+module does not depend on TensorFlow.
+"""
+import collections
+import re
+
+# NOTE(brendan): Ops are grouped by the first name scope below any tower and
+# gradients scopes, e.g. tower_0/gradients/tower_0/resnet_v1_50/conv1/Conv2D
+# is in `resnet_v1_50`, which is then matched to a group by prefix.
+SCOPE_GROUPS = (('input_pipeline', ('batch_processing', 'input_staging', 'IteratorGetNext')),
+                ('resnet_bulat', ('resnet',)),
+                ('vgg_bulat', ('vgg',)))
+OTHER_GROUP = 'other'
+WRAPPER_SCOPE_REGEX = re.compile('^(tower_[0-9]+|gradients)$')
+
+def _get_scope_group(node_name):
+    """Returns the name of the group in `SCOPE_GROUPS` that the op
+    `node_name` belongs to.
+    """
+    scopes = [scope for scope in node_name.split('/')
+              if WRAPPER_SCOPE_REGEX.match(scope) is None]
+    if not scopes:
+        return OTHER_GROUP
+
+    for group_name, scope_prefixes in SCOPE_GROUPS:
+        if scopes[0].startswith(scope_prefixes):
+            return group_name
+
+    return OTHER_GROUP
+
+
+def _get_profiled_devices(step_stats):
+    """Returns the device stats of `step_stats` to take op times from.
+
+    GPU ops are recorded both on the GPU device, where the time is that of
+    launching the kernels, and on the GPU's `stream:all` device, where it is
+    the time the kernels ran for. Only the latter is used for GPUs, and the
+    individual streams are skipped, so that no op is counted twice.
+    """
+    device_names = [device_stats.device for device_stats in step_stats.dev_stats]
+    streamed_devices = [name.replace('/stream:all', '') for name in device_names
+                        if name.endswith('/stream:all')]
+
+    profiled_devices = []
+    for device_stats in step_stats.dev_stats:
+        device_name = device_stats.device
+        if '/stream:' in device_name:
+            if device_name.endswith('/stream:all'):
+                profiled_devices.append(device_stats)
+        elif device_name not in streamed_devices:
+            profiled_devices.append(device_stats)
+
+    return profiled_devices
+
+
+class OpTimes(object):
+    """Accumulates the time of each op across the `StepStats` of profiled
+    steps.
+    """
+    def __init__(self):
+        self._op_micros = collections.defaultdict(int)
+        self._num_steps = 0
+
+    @property
+    def num_steps(self):
+        return self._num_steps
+
+    def add_step_stats(self, step_stats, count_step=True):
+        """Adds the op times of a traced `session.run`'s `step_stats` to the
+        totals.
+
+        Args:
+            step_stats: `StepStats` of the traced `session.run`.
+            count_step: Does this `session.run` start a new profiled step? If
+                `False`, its op times are added to the current step instead.
+        """
+        for device_stats in _get_profiled_devices(step_stats):
+            for node_stats in device_stats.node_stats:
+                node_name = node_stats.node_name.split(':')[0]
+                self._op_micros[node_name] += node_stats.all_end_rel_micros
+
+        if count_step:
+            self._num_steps += 1
+
+    def get_top_ops(self, top_n):
+        """Returns a dictionary of the `top_n` ops with the most total time in
+        each group, as lists of (op name, milliseconds per profiled step)
+        pairs, along with the total milliseconds per profiled step of each
+        group.
+        """
+        grouped_op_micros = collections.defaultdict(list)
+        for node_name, micros in self._op_micros.items():
+            grouped_op_micros[_get_scope_group(node_name)].append((node_name, micros))
+
+        top_ops = {}
+        num_steps = max(self._num_steps, 1)
+        for group_name, op_micros in grouped_op_micros.items():
+            op_micros.sort(key=lambda name_micros: name_micros[1], reverse=True)
+            top_ops[group_name] = {
+                'total_ms': sum(micros for _, micros in op_micros)/(1000*num_steps),
+                'top_ops': [(node_name, micros/(1000*num_steps))
+                            for node_name, micros in op_micros[:top_n]]}
+
+        return top_ops
+
+    def format_report(self, top_n):
+        """Returns a human readable report of `get_top_ops`."""
+        report = 'Op times per profiled step, averaged over {} steps.\n'.format(
+            self._num_steps)
+
+        top_ops = self.get_top_ops(top_n)
+        for group_name in sorted(top_ops,
+                                 key=lambda name: top_ops[name]['total_ms'],
+                                 reverse=True):
+            report += '\n{}: {:.3f} ms\n'.format(group_name,
+                                                 top_ops[group_name]['total_ms'])
+            for node_name, millis in top_ops[group_name]['top_ops']:
+                report += '    {:10.3f} ms  {}\n'.format(millis, node_name)
+
+        return report
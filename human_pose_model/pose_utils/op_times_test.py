@@ -0,0 +1,89 @@
+"""Tests for the per-scope op time aggregation of the training profiler.
+
+The `StepStats` protocol buffers that the profiler gets from TensorFlow are
+stood in for by namespaces with the same fields.
+"""
+import types
+import unittest
+from pose_utils import op_times
+
+CPU_DEVICE = '/job:localhost/replica:0/task:0/device:CPU:0'
+GPU_DEVICE = '/job:localhost/replica:0/task:0/device:GPU:0'
+
+class ScopeGroupTest(unittest.TestCase):
+    def test_scope_groups(self):
+        self.assertEqual(
+            op_times._get_scope_group('tower_0/gradients/tower_0/resnet_v1_50/conv1/Conv2D'),
+            'resnet_bulat')
+        self.assertEqual(op_times._get_scope_group('tower_1/vgg_16/conv1/conv1_1/Conv2D'),
+                         'vgg_bulat')
+        self.assertEqual(op_times._get_scope_group('input_staging/StagingArea_get'),
+                         'input_pipeline')
+        self.assertEqual(op_times._get_scope_group('IteratorGetNext'), 'input_pipeline')
+        self.assertEqual(op_times._get_scope_group('RMSProp/update_weights'),
+                         op_times.OTHER_GROUP)
+        self.assertEqual(op_times._get_scope_group('tower_0'), op_times.OTHER_GROUP)
+
+
+class OpTimesTest(unittest.TestCase):
+    def setUp(self):
+        self._op_times = op_times.OpTimes()
+
+    def _add_trace(self, device_node_micros, count_step=True):
+        """Adds a trace with the op times {device: [(node name, micros)]}."""
+        dev_stats = [
+            types.SimpleNamespace(
+                device=device_name,
+                node_stats=[types.SimpleNamespace(node_name=node_name,
+                                                  all_end_rel_micros=micros)
+                            for node_name, micros in node_micros])
+            for device_name, node_micros in device_node_micros.items()]
+
+        self._op_times.add_step_stats(types.SimpleNamespace(dev_stats=dev_stats),
+                                      count_step)
+
+    def test_gpu_ops_counted_once(self):
+        self._add_trace({
+            GPU_DEVICE: [('tower_0/resnet_v1_50/conv1/Conv2D', 5)],
+            GPU_DEVICE + '/stream:all': [('tower_0/resnet_v1_50/conv1/Conv2D', 100)],
+            GPU_DEVICE + '/stream:7': [('tower_0/resnet_v1_50/conv1/Conv2D', 100)],
+            CPU_DEVICE: [('IteratorGetNext', 40)]})
+
+        top_ops = self._op_times.get_top_ops(10)
+
+        self.assertEqual(top_ops['resnet_bulat']['top_ops'],
+                         [('tower_0/resnet_v1_50/conv1/Conv2D', 0.1)])
+        self.assertEqual(top_ops['input_pipeline']['total_ms'], 0.04)
+
+    def test_top_ops_averaged_over_steps(self):
+        for micros in (1000, 3000):
+            self._add_trace({CPU_DEVICE: [('vgg_16/conv1/Conv2D:Conv2D', micros),
+                                          ('vgg_16/conv2/Conv2D', 500),
+                                          ('vgg_16/conv3/Conv2D', 100)]})
+
+        top_ops = self._op_times.get_top_ops(2)
+
+        self.assertEqual(self._op_times.num_steps, 2)
+        self.assertEqual(top_ops['vgg_bulat']['top_ops'],
+                         [('vgg_16/conv1/Conv2D', 2.0), ('vgg_16/conv2/Conv2D', 0.5)])
+        self.assertAlmostEqual(top_ops['vgg_bulat']['total_ms'], 2.6)
+        self.assertIn('vgg_bulat: 2.600 ms', self._op_times.format_report(2))
+
+    def test_phases_of_a_step_counted_once(self):
+        for _ in range(2):
+            self._add_trace({CPU_DEVICE: [('input_staging/StagingArea_put', 300)]},
+                            count_step=False)
+            self._add_trace({CPU_DEVICE: [('input_staging/StagingArea_get', 100),
+                                          ('vgg_16/conv1/Conv2D', 1000)]})
+
+        top_ops = self._op_times.get_top_ops(1)
+
+        self.assertEqual(self._op_times.num_steps, 2)
+        self.assertAlmostEqual(top_ops['input_pipeline']['total_ms'], 0.4)
+        self.assertAlmostEqual(top_ops['vgg_bulat']['total_ms'], 1.0)
+        self.assertIn('per profiled step, averaged over 2 steps',
+                      self._op_times.format_report(1))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,143 @@
+"""This module computes the PCKh metric inside the evaluation graph, so that
+only the match counts, rather than the full predicted heatmaps, have to be
+fetched from the session.
+
+A joint estimate matches the ground truth at threshold `t` if it lies within
+`t` times the head segment length of the ground truth joint. Head segment
+length is defined as the diagonal across the annotated head rectangle in the
+MPII data, multiplied by a factor of 0.6.
+
+Any number of thresholds can be accumulated at once, by `setup_streaming_pckh`.
+"""
+import tensorflow as tf
+from dataset.mpii_datatypes import Person
+
+PCKH_THRESHOLD = 0.5
+
+def parse_thresholds(thresholds_string):
+    """Parses a comma-separated list of thresholds, e.g. '0.1,0.5'."""
+    return [float(threshold) for threshold in thresholds_string.split(',')]
+
+
+class StreamingPCKh(object):
+    """Contains the local variables and ops that accumulate per-joint PCKh
+    match counts in the evaluation graph.
+
+    `matched_joints` is [num_thresholds, num_joints] and `total_joints` is
+    [num_joints], both weighted counts since `reset_op` was last run.
+    """
+    def __init__(self,
+                 thresholds,
+                 matched_joints,
+                 total_joints,
+                 update_op,
+                 reset_op):
+        self._thresholds = thresholds
+        self._matched_joints = matched_joints
+        self._total_joints = total_joints
+        self._update_op = update_op
+        self._reset_op = reset_op
+
+    @property
+    def thresholds(self):
+        return self._thresholds
+
+    @property
+    def matched_joints(self):
+        return self._matched_joints
+
+    @property
+    def total_joints(self):
+        return self._total_joints
+
+    @property
+    def update_op(self):
+        return self._update_op
+
+    @property
+    def reset_op(self):
+        return self._reset_op
+
+
+def _decode_argmax_joints_op(logits, image_dim):
+    """Decodes each joint's position as the location of the maximum of its
+    heatmap in `logits`, normalized to [-0.5, 0.5) like the ground truth.
+
+    Returns:
+        (x_joints, y_joints) tuple of [batch_size, num_joints] tensors.
+    """
+    logits_shape = logits.get_shape().as_list()
+    height, width, num_joints = logits_shape[1:]
+
+    flat_argmax = tf.argmax(tf.reshape(logits, [-1, height*width, num_joints]),
+                            axis=1)
+
+    y_joints = tf.cast(flat_argmax // width, tf.float32)/image_dim - 0.5
+    x_joints = tf.cast(flat_argmax % width, tf.float32)/image_dim - 0.5
+
+    return x_joints, y_joints
+
+
+def setup_streaming_pckh(logits,
+                         image_dim,
+                         x_gt,
+                         y_gt,
+                         weights,
+                         head_size,
+                         thresholds=(PCKH_THRESHOLD,),
+                         num_joints=Person.NUM_JOINTS):
+    """Builds ops that decode `logits` and accumulate the batch's PCKh match
+    counts into local variables, at each of `thresholds`.
+
+    Args:
+        logits: [batch_size, height, width, num_joints] predicted heatmaps.
+        image_dim: Dimension of the input images.
+        x_gt, y_gt: [batch_size, num_joints] ground truth joint coordinates.
+        weights: [batch_size, num_joints] weights, zero for joints that are
+            not annotated.
+        head_size: [batch_size] head segment lengths.
+        thresholds: Thresholds to accumulate PCKh at.
+
+    Returns:
+        A `StreamingPCKh`, whose `reset_op` must be run before the first
+        `update_op`.
+    """
+    thresholds = sorted(thresholds)
+
+    with tf.variable_scope('streaming_pckh'):
+        matched_joints = tf.Variable(
+            initial_value=tf.zeros([len(thresholds), num_joints]),
+            trainable=False,
+            collections=[tf.GraphKeys.LOCAL_VARIABLES],
+            name='matched_joints')
+        total_joints = tf.Variable(initial_value=tf.zeros([num_joints]),
+                                   trainable=False,
+                                   collections=[tf.GraphKeys.LOCAL_VARIABLES],
+                                   name='total_joints')
+
+        x_predicted, y_predicted = _decode_argmax_joints_op(
+            tf.cast(logits, tf.float32), image_dim)
+
+        distances = tf.sqrt(tf.square(x_predicted - x_gt) +
+                            tf.square(y_predicted - y_gt))
+        normalized_distances = distances/tf.reshape(head_size, [-1, 1])
+
+        # NOTE(brendan): The comparison against every threshold is
+        # [num_thresholds, batch_size, num_joints], which is negligible next
+        # to the argmax over the heatmaps.
+        joint_weights = weights[:, 0:num_joints]
+        is_matched = tf.less(tf.expand_dims(normalized_distances, 0),
+                             tf.reshape(thresholds, [-1, 1, 1]))
+        batch_matched_joints = tf.reduce_sum(
+            tf.cast(is_matched, tf.float32)*joint_weights, axis=1)
+
+        update_op = tf.group(
+            tf.assign_add(matched_joints, batch_matched_joints),
+            tf.assign_add(total_joints, tf.reduce_sum(joint_weights, axis=0)))
+        reset_op = tf.variables_initializer([matched_joints, total_joints])
+
+    return StreamingPCKh(thresholds,
+                         matched_joints,
+                         total_joints,
+                         update_op,
+                         reset_op)
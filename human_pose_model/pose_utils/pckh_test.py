@@ -0,0 +1,68 @@
+"""Tests for the in-graph PCKh metric."""
+import unittest
+import numpy as np
+import tensorflow as tf
+from pose_utils import pckh
+
+class ParseThresholdsTest(unittest.TestCase):
+    def test_single_threshold(self):
+        self.assertEqual(pckh.parse_thresholds('0.5'), [0.5])
+
+    def test_multiple_thresholds(self):
+        self.assertEqual(pckh.parse_thresholds('0.1,0.2, 0.5'), [0.1, 0.2, 0.5])
+
+    def test_invalid_threshold(self):
+        with self.assertRaises(ValueError):
+            pckh.parse_thresholds('0.1,half')
+
+
+class StreamingPCKhTest(tf.test.TestCase):
+    def setUp(self):
+        super(StreamingPCKhTest, self).setUp()
+
+        # NOTE(brendan): Joint 0's heatmap peaks at row 1, column 2, which is
+        # (0, -0.25) for 4x4 images, on its ground truth. Joint 1's peaks at
+        # (-0.5, -0.5), 0.6 head sizes from its ground truth.
+        logits = np.zeros([1, 4, 4, 2], dtype=np.float32)
+        logits[0, 1, 2, 0] = 1
+        logits[0, 0, 0, 1] = 1
+
+        self._streaming_pckh = pckh.setup_streaming_pckh(
+            logits=tf.constant(logits),
+            image_dim=4,
+            x_gt=tf.constant([[0.0, 0.1]]),
+            y_gt=tf.constant([[-0.25, -0.5]]),
+            weights=tf.constant([[1.0, 1.0]]),
+            head_size=tf.constant([1.0]),
+            thresholds=(1.0, 0.5),
+            num_joints=2)
+
+    def _run_updates(self, session, num_updates):
+        session.run(self._streaming_pckh.reset_op)
+        for _ in range(num_updates):
+            session.run(self._streaming_pckh.update_op)
+
+        return session.run([self._streaming_pckh.matched_joints,
+                            self._streaming_pckh.total_joints])
+
+    def test_thresholds_sorted(self):
+        self.assertEqual(self._streaming_pckh.thresholds, [0.5, 1.0])
+
+    def test_match_counts(self):
+        with tf.Session() as session:
+            matched_joints, total_joints = self._run_updates(session, 2)
+
+        self.assertAllClose(matched_joints, [[2, 0], [2, 2]])
+        self.assertAllClose(total_joints, [2, 2])
+
+    def test_reset(self):
+        with tf.Session() as session:
+            self._run_updates(session, 3)
+            matched_joints, total_joints = self._run_updates(session, 1)
+
+        self.assertAllClose(matched_joints, [[1, 0], [1, 1]])
+        self.assertAllClose(total_joints, [1, 1])
+
+
+if __name__ == "__main__":
+    tf.test.main()
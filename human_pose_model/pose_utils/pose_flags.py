@@ -60,8 +60,8 @@ tf.app.flags.DEFINE_integer('num_preprocess_threads', 4,
                             images.""")
 
 tf.app.flags.DEFINE_integer('num_readers', 4,
-                            """Number of threads to use to read example
-                            protobufs from TFRecords.""")
+                            """Number of TFRecords to read example protobufs
+                            from in parallel.""")
 
 tf.app.flags.DEFINE_integer('num_gpus', 4,
                             """Number of GPUs in system.""")
@@ -70,9 +70,21 @@ tf.app.flags.DEFINE_integer('batch_size', 32,
                             """Size of each mini-batch (number of examples
                             processed at once).""")
 
+tf.app.flags.DEFINE_integer('num_accumulation_steps', 1,
+                            """Number of mini-batches to accumulate the
+                            gradients of before each optimizer step, giving
+                            an effective batch of num_accumulation_steps times
+                            batch_size at the memory cost of batch_size.""")
+
+tf.app.flags.DEFINE_boolean('scale_learning_rate_by_accumulation', False,
+                            """Multiply the learning rate by
+                            num_accumulation_steps, to keep the update size
+                            per example the same as without accumulation?""")
+
 tf.app.flags.DEFINE_integer('input_queue_memory_factor', 4,
-                            """Factor by which to increase the minimum examples
-                            in RandomShuffleQueue.""")
+                            """Factor by which to multiply the mean examples
+                            per shard to get the example shuffle buffer
+                            size.""")
 
 tf.app.flags.DEFINE_integer('max_epochs', 90,
                             """Maximum number of epochs in training run.""")
@@ -80,6 +92,26 @@ tf.app.flags.DEFINE_integer('max_epochs', 90,
 tf.app.flags.DEFINE_integer('heatmap_stddev_pixels', 5,
                             """Standard deviation of Gaussian joint heatmap, in pixels.""")
 
+tf.app.flags.DEFINE_string('eval_cache_dir', None,
+                           """If set, the decoded validation set is cached in
+                           this directory the first time it is evaluated, and
+                           later evaluations read from the cache instead of
+                           the TFRecords.""")
+
+tf.app.flags.DEFINE_boolean('eval_cache_in_memory', False,
+                            """Read the whole validation cache into RAM,
+                            instead of memory-mapping it?""")
+
+tf.app.flags.DEFINE_string('pckh_thresholds', '0.1,0.2,0.3,0.4,0.5',
+                           """Comma-separated list of thresholds, as fractions
+                           of head segment length, to evaluate PCKh at. PCKh
+                           at 0.5 is always evaluated.""")
+
+tf.app.flags.DEFINE_boolean('flip_tta', False,
+                            """Evaluate with left-right flip test-time
+                            augmentation, averaging the predictions for each
+                            image and its mirrored copy?""")
+
 tf.app.flags.DEFINE_integer('eval_interval_secs', 360,
                             """Interval in seconds for which we will wait
                             between checking for new checkpoints and evaluating
@@ -88,6 +120,19 @@ tf.app.flags.DEFINE_integer('eval_interval_secs', 360,
 tf.app.flags.DEFINE_float('max_rotation_angle', math.pi/6,
                           """Maximum amount to rotate images, in radians.""")
 
+tf.app.flags.DEFINE_float('min_scale', 1.0,
+                          """Minimum factor to randomly scale training images
+                          by.""")
+
+tf.app.flags.DEFINE_float('max_scale', 1.0,
+                          """Maximum factor to randomly scale training images
+                          by.""")
+
+tf.app.flags.DEFINE_float('max_translation', 0.0,
+                          """Maximum amount to randomly translate training
+                          images by in x and in y, as a fraction of the image
+                          dimension.""")
+
 tf.app.flags.DEFINE_float('initial_learning_rate', 0.01,
                           """Initial learning rate.""")
 
@@ -106,6 +151,47 @@ tf.app.flags.DEFINE_boolean('restore_global_step', True,
                             """Set to True if restoring a training run that is
                             part-way complete.""")
 
+tf.app.flags.DEFINE_integer('input_seed', None,
+                            """If set, seeds the shuffling and augmentation of
+                            the training input, and reads shards in a
+                            deterministic order, so that the order of training
+                            examples is reproducible.""")
+
+tf.app.flags.DEFINE_boolean('checkpoint_input_position', False,
+                            """Save the position of the training input
+                            pipeline with each checkpoint, and restore it
+                            when resuming, so that training continues from
+                            the next example rather than from the start of
+                            the (seeded) input order? The input checkpoint
+                            holds the shuffle buffer of serialized examples
+                            and the prefetched batches, and is written
+                            synchronously, so training stalls while it is
+                            saved.""")
+
+tf.app.flags.DEFINE_integer('num_workers', 1,
+                            """Number of training processes splitting each
+                            epoch of training shards between them.""")
+
+tf.app.flags.DEFINE_integer('worker_index', 0,
+                            """Index of this training process, in
+                            [0, num_workers).""")
+
+tf.app.flags.DEFINE_boolean('reshuffle_worker_shards', False,
+                            """Reassign the training shards to workers randomly
+                            every epoch, rather than giving each worker the
+                            same shards every epoch? All workers must use the
+                            same input_seed.""")
+
+tf.app.flags.DEFINE_integer('profile_interval_steps', 0,
+                            """If non-zero, trace a training step every this
+                            many steps, writing Chrome timeline traces and a
+                            report of the most expensive ops to the profiles
+                            directory in log_dir.""")
+
+tf.app.flags.DEFINE_integer('profile_top_ops', 10,
+                            """Number of ops to report for each part of the
+                            graph in the profiling report.""")
+
 tf.app.flags.DEFINE_boolean('is_regression_subnetwork_pretrained', False,
                             """Set to True if restoring ILSVRC pre-trained
                             weights to the regression subnetwork.""")
@@ -116,6 +202,11 @@ tf.app.flags.DEFINE_string('optimizer', None,
 tf.app.flags.DEFINE_string('checkpoint_name', None,
                            """Name of checkpoint""")
 
+tf.app.flags.DEFINE_integer('max_checkpoints_to_keep', 5,
+                            """Number of most recent model checkpoints to
+                            keep in log_dir. Older checkpoints are deleted as
+                            new ones are written.""")
+
 tf.app.flags.DEFINE_string('email_address',
                            None,
                            """Address of e-mail to send to, if sending e-mail
@@ -5,6 +5,7 @@ import os
 import threading
 import numpy as np
 import tensorflow as tf
+from pose_utils import tfrecord_index
 
 def get_n_ranges(start, end, num_ranges):
     """Takes a start index, end index, and number of ranges, e.g. start=0,
@@ -31,8 +32,8 @@ def _thread_count_examples(num_examples_results,
     such that `num_examples_results` can be summed after all the threads are
     joined, in order to produce the total number of examples.
     """
-    options = tf.python_io.TFRecordOptions(
-        compression_type=tf.python_io.TFRecordCompressionType.ZLIB)
+    options = tfrecord_index.get_record_options(
+        tfrecord_index.LEGACY_COMPRESSION_TYPE)
     for file_index in range(ranges[thread_index][0], ranges[thread_index][1]):
         data_file = train_data_filenames[file_index]
         for _ in tf.python_io.tf_record_iterator(path=data_file, options=options):
@@ -40,26 +41,45 @@ def _thread_count_examples(num_examples_results,
 
 
 def count_training_examples(data_dir, num_threads, tfrecord_prefix):
-    """Counts training examples in the TFRecords given by
-    `train_data_filenames`, by creating `num_threads` threads, which will all
-    count the examples in roughly 1/train_data_filenames of the files.
+    """Counts training examples in the TFRecords in `data_dir` whose names
+    start with `tfrecord_prefix`.
+
+    The count of each shard is read from its sidecar index (see
+    `pose_utils.tfrecord_index`) where there is one. Shards without an index
+    are counted by creating `num_threads` threads, which will each iterate
+    through the examples in roughly 1/num_threads of those shards.
+
+    Returns:
+        (num_examples, data_filenames) tuple.
     """
     data_filenames = tf.gfile.Glob(
         os.path.join(data_dir, tfrecord_prefix + '*tfrecord'))
     assert data_filenames, ('No data files found.')
 
+    num_indexed_examples = 0
+    unindexed_filenames = []
+    for data_file in data_filenames:
+        shard_index = tfrecord_index.read_shard_index(data_file)
+        if shard_index is None:
+            unindexed_filenames.append(data_file)
+        else:
+            num_indexed_examples += shard_index['num_examples']
+
+    if not unindexed_filenames:
+        return num_indexed_examples, data_filenames
+
     coord = tf.train.Coordinator()
 
-    ranges = get_n_ranges(0, len(data_filenames), num_threads)
+    ranges = get_n_ranges(0, len(unindexed_filenames), num_threads)
 
     num_examples_results = num_threads*[0]
     threads = []
     for thread_index in range(num_threads):
-        args = (num_examples_results, data_filenames, ranges, thread_index)
+        args = (num_examples_results, unindexed_filenames, ranges, thread_index)
         t = threading.Thread(target=_thread_count_examples, args=args)
         t.start()
         threads.append(t)
 
     coord.join(threads)
 
-    return sum(num_examples_results), data_filenames
+    return num_indexed_examples + sum(num_examples_results), data_filenames
@@ -0,0 +1,81 @@
+"""This module profiles `session.run` calls, by capturing their `RunMetadata`,
+writing each as a Chrome timeline trace (viewable at chrome://tracing), and
+aggregating op-level time across all of the traces with `op_times.OpTimes`.
+"""
+import os
+import tensorflow as tf
+from tensorflow.python.client import timeline
+from pose_utils.op_times import OpTimes
+
+class Profiler(object):
+    """Runs traced `session.run` calls, writing a Chrome trace of each to
+    `trace_dir`, and accumulating the time of each op across profiled steps.
+    """
+    def __init__(self, trace_dir):
+        if not tf.gfile.Exists(trace_dir):
+            tf.gfile.MakeDirs(trace_dir)
+
+        self._trace_dir = trace_dir
+        self._op_times = OpTimes()
+
+    @property
+    def trace_dir(self):
+        return self._trace_dir
+
+    @property
+    def num_steps(self):
+        return self._op_times.num_steps
+
+    def run(self, session, fetches, trace_name, feed_dict=None, count_step=True):
+        """Runs `fetches` in `session` with full tracing.
+
+        Args:
+            session: Session to run `fetches` in.
+            fetches: Fetches of the `session.run`.
+            trace_name: Name to write the Chrome trace under.
+            feed_dict: Feeds of the `session.run`.
+            count_step: Does this `session.run` start a new profiled step? If
+                `False`, its op times are added to the current step instead.
+
+        Returns:
+            (results, trace_filepath) tuple, of the results of the
+            `session.run` and the path of the Chrome trace written for it.
+        """
+        run_metadata = tf.RunMetadata()
+        results = session.run(
+            fetches=fetches,
+            feed_dict=feed_dict,
+            options=tf.RunOptions(trace_level=tf.RunOptions.FULL_TRACE),
+            run_metadata=run_metadata)
+
+        trace_filepath = os.path.join(self._trace_dir,
+                                      'timeline-{}.json'.format(trace_name))
+        chrome_trace = timeline.Timeline(step_stats=run_metadata.step_stats)
+        with tf.gfile.GFile(trace_filepath, 'w') as f:
+            f.write(chrome_trace.generate_chrome_trace_format())
+
+        self.add_run_metadata(run_metadata, count_step)
+
+        return results, trace_filepath
+
+    def add_run_metadata(self, run_metadata, count_step=True):
+        """Adds the op times of a traced `run_metadata` to the totals.
+
+        See `run` for `count_step`.
+        """
+        self._op_times.add_step_stats(run_metadata.step_stats, count_step)
+
+    def get_top_ops(self, top_n):
+        """See `OpTimes.get_top_ops`."""
+        return self._op_times.get_top_ops(top_n)
+
+    def format_report(self, top_n):
+        """See `OpTimes.format_report`."""
+        return self._op_times.format_report(top_n)
+
+    def write_report(self, top_n, report_filename='op_report.txt'):
+        """Writes `format_report` to `report_filename` in the trace
+        directory.
+        """
+        with tf.gfile.GFile(os.path.join(self._trace_dir, report_filename), 'w') as f:
+            f.write(self.format_report(top_n))
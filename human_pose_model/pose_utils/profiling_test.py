@@ -0,0 +1,48 @@
+"""Tests for the tracing of `session.run` calls by the training profiler. The
+aggregation of op times is tested in `op_times_test`.
+"""
+import json
+import os
+import tempfile
+import tensorflow as tf
+from pose_utils import profiling
+
+class ProfilerTest(tf.test.TestCase):
+    def setUp(self):
+        super(ProfilerTest, self).setUp()
+        self._trace_dir = os.path.join(tempfile.mkdtemp(dir=self.get_temp_dir()),
+                                       'traces')
+
+    def test_run_writes_trace_and_counts_step(self):
+        profiler = profiling.Profiler(self._trace_dir)
+        with tf.Graph().as_default():
+            total = tf.add(tf.constant(1.0), tf.constant(2.0), name='total')
+            with tf.Session() as session:
+                results, trace_filepath = profiler.run(session, total, 'step-1')
+
+        self.assertEqual(results, 3.0)
+        self.assertEqual(trace_filepath,
+                         os.path.join(self._trace_dir, 'timeline-step-1.json'))
+        with open(trace_filepath) as f:
+            self.assertIn('traceEvents', json.load(f))
+
+        self.assertEqual(profiler.num_steps, 1)
+
+        profiler.write_report(10)
+        with open(os.path.join(self._trace_dir, 'op_report.txt')) as f:
+            self.assertTrue(f.read().startswith(
+                'Op times per profiled step, averaged over 1 steps.'))
+
+    def test_input_phase_not_counted(self):
+        profiler = profiling.Profiler(self._trace_dir)
+        with tf.Graph().as_default():
+            total = tf.add(tf.constant(1.0), tf.constant(2.0))
+            with tf.Session() as session:
+                profiler.run(session, total, 'step-1-input', count_step=False)
+                profiler.run(session, total, 'step-1')
+
+        self.assertEqual(profiler.num_steps, 1)
+
+
+if __name__ == "__main__":
+    tf.test.main()
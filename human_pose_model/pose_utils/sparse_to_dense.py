@@ -20,7 +20,11 @@ def _sparse_joints_to_dense_inner(dense_shape,
                                   num_joints):
     """Inner function for doing sparse joint conversion to dense joints.
 
-    See `sparse_joints_to_dense` for detailed explanation.
+    Returns:
+        (x_dense_joints, y_dense_joints, weights, sparse_indices) tuple, where
+        the dense joints have shape `dense_shape`, with zeros in the indices
+        not present in the sparse vector, and `weights` contains 1s for all
+        the present joints and 0s otherwise.
     """
     x_dense_joints, x_sparse_joints = _sparse_joints_to_dense_one_dim(
         dense_shape,
@@ -54,26 +58,3 @@ def sparse_joints_to_dense_single_example(x_joints,
                                          y_joints,
                                          joint_indices,
                                          num_joints)
-
-
-def sparse_joints_to_dense(batch, num_joints):
-    """Converts a sparse vector of joints to a dense format, and also returns a
-    set of weights indicating which joints are present.
-
-    Args:
-        batch: A batch of example images with associated joint vectors.
-
-    Returns:
-        (dense_joints, weights) tuple, where dense_joints is a dense vector of
-        shape [batch_size, NUM_JOINTS], with zeros in the indices not
-        present in the sparse vector. `weights` contains 1s for all the present
-        joints and 0s otherwise.
-    """
-    x_dense_joints, y_dense_joints, weights, _ = _sparse_joints_to_dense_inner(
-        [batch.batch_size, num_joints],
-        batch.x_joints,
-        batch.y_joints,
-        batch.joint_indices,
-        num_joints)
-
-    return x_dense_joints, y_dense_joints, tf.concat(axis=1, values=[weights, weights])
@@ -0,0 +1,43 @@
+"""This module writes per-step training statistics to a JSON lines file, one
+JSON object per training step, so that throughput can be plotted and input
+stalls found after the fact.
+
+Each step is split into the time spent waiting for the input pipeline to
+produce a batch, and the time spent computing the training step on it.
+"""
+import json
+
+STEP_STATS_FILENAME = 'step_stats.jsonl'
+
+class StepStatsWriter(object):
+    """Appends the statistics of each training step to a JSON lines file."""
+    def __init__(self, filepath, batch_size):
+        self._file_handle = open(filepath, 'a')
+        self._batch_size = batch_size
+
+    def write_step(self, step, loss, input_wait_secs, compute_secs):
+        """Writes the statistics of training step `step`.
+
+        Args:
+            step: Global step after the training step.
+            loss: Training loss of the step.
+            input_wait_secs: Seconds spent waiting for the batch from the input
+                pipeline.
+            compute_secs: Seconds spent running the training step on the
+                batch.
+        """
+        step_secs = input_wait_secs + compute_secs
+        step_stats = {'step': int(step),
+                      'loss': float(loss),
+                      'examples_per_sec': self._batch_size/step_secs,
+                      'step_secs': step_secs,
+                      'input_wait_secs': input_wait_secs,
+                      'compute_secs': compute_secs}
+
+        self._file_handle.write(json.dumps(step_stats) + '\n')
+
+    def flush(self):
+        self._file_handle.flush()
+
+    def close(self):
+        self._file_handle.close()
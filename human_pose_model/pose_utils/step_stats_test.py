@@ -0,0 +1,55 @@
+"""Tests for the JSON lines writer of per-step training statistics."""
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from pose_utils.step_stats import StepStatsWriter
+
+class StepStatsWriterTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp_dir = tempfile.mkdtemp()
+        self._filepath = os.path.join(self._tmp_dir, 'step_stats.jsonl')
+
+    def tearDown(self):
+        shutil.rmtree(self._tmp_dir)
+
+    def _read_steps(self):
+        with open(self._filepath) as f:
+            return [json.loads(line) for line in f]
+
+    def test_write_step(self):
+        writer = StepStatsWriter(self._filepath, 32)
+        writer.write_step(np.int64(7), np.float32(0.25), 0.5, 1.5)
+        writer.close()
+
+        steps = self._read_steps()
+
+        self.assertEqual(len(steps), 1)
+        self.assertEqual(steps[0]['step'], 7)
+        self.assertAlmostEqual(steps[0]['loss'], 0.25)
+        self.assertAlmostEqual(steps[0]['step_secs'], 2.0)
+        self.assertAlmostEqual(steps[0]['input_wait_secs'], 0.5)
+        self.assertAlmostEqual(steps[0]['compute_secs'], 1.5)
+        self.assertAlmostEqual(steps[0]['examples_per_sec'], 16.0)
+
+    def test_flush(self):
+        writer = StepStatsWriter(self._filepath, 1)
+        writer.write_step(1, 1.0, 0.0, 1.0)
+        writer.flush()
+
+        self.assertEqual([step['step'] for step in self._read_steps()], [1])
+        writer.close()
+
+    def test_appends_across_writers(self):
+        for step in range(3):
+            writer = StepStatsWriter(self._filepath, 1)
+            writer.write_step(step, 1.0, 0.0, 1.0)
+            writer.close()
+
+        self.assertEqual([step['step'] for step in self._read_steps()], [0, 1, 2])
+
+
+if __name__ == "__main__":
+    unittest.main()
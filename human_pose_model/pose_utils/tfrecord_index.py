@@ -0,0 +1,128 @@
+"""This module reads and writes the sidecar index files that `write_tf_record`
+writes next to each TFRecord shard.
+
+The index of `train0.tfrecord` is the JSON file `train0.tfrecord.index`,
+containing the exact number of examples in the shard, so that readers do not
+have to iterate through a shard to find out how many examples it holds.
+
+The index also holds the byte offset and length of every record. The offsets
+are into the uncompressed record stream, where each record is framed as
+(uint64 length, uint32 masked CRC of length, data, uint32 masked CRC of data).
+For uncompressed shards these are also offsets into the file itself, but for
+compressed shards they do not correspond to positions in the file.
+
+Finally, the index records the compression type the shard was written with,
+so that readers can pick the right decompression without being told. Shards
+without an index are assumed to be ZLIB compressed, which is what
+`write_tf_record` always used before the compression type was selectable.
+"""
+import json
+import numpy as np
+import tensorflow as tf
+
+INDEX_SUFFIX = '.index'
+
+# NOTE(brendan): The length header is a uint64 followed by its uint32 CRC, and
+# the data is followed by its uint32 CRC.
+RECORD_HEADER_BYTES = 12
+RECORD_FOOTER_BYTES = 4
+
+COMPRESSION_TYPES = {
+    'none': tf.python_io.TFRecordCompressionType.NONE,
+    'gzip': tf.python_io.TFRecordCompressionType.GZIP,
+    'zlib': tf.python_io.TFRecordCompressionType.ZLIB,
+}
+
+LEGACY_COMPRESSION_TYPE = 'zlib'
+
+def get_index_filepath(tfrecord_filepath):
+    """Returns the path of the sidecar index of `tfrecord_filepath`."""
+    return tfrecord_filepath + INDEX_SUFFIX
+
+
+def get_record_options(compression_type, compression_level=None):
+    """Returns the `TFRecordOptions` to read or write shards with.
+
+    Args:
+        compression_type: One of the keys of `COMPRESSION_TYPES`.
+        compression_level: zlib compression level from 0 to 9, used when
+            writing GZIP or ZLIB shards. `None` uses zlib's default level.
+    """
+    if compression_type not in COMPRESSION_TYPES:
+        raise ValueError('Unknown compression type {}, expected one of {}.'.format(
+            compression_type, sorted(COMPRESSION_TYPES)))
+
+    options = tf.python_io.TFRecordOptions(
+        compression_type=COMPRESSION_TYPES[compression_type])
+    if (compression_level is not None) and (compression_type != 'none'):
+        options.compression_level = compression_level
+
+    return options
+
+
+def get_dataset_compression_type(compression_type):
+    """Returns the `compression_type` string that `tf.data.TFRecordDataset`
+    expects for shards written with `compression_type`.
+    """
+    return tf.python_io.TFRecordOptions.get_compression_type_string(
+        get_record_options(compression_type))
+
+
+def write_shard_index(tfrecord_filepath, record_lengths, compression_type):
+    """Writes the sidecar index of the shard at `tfrecord_filepath`.
+
+    Args:
+        tfrecord_filepath: Path of the TFRecord shard that was written.
+        record_lengths: List of the lengths in bytes of the serialized
+            examples, in the order that they were written to the shard.
+        compression_type: Key of `COMPRESSION_TYPES` the shard was written
+            with.
+    """
+    record_lengths = np.array(record_lengths, dtype=np.int64)
+    framed_lengths = record_lengths + RECORD_HEADER_BYTES + RECORD_FOOTER_BYTES
+    record_offsets = np.cumsum(framed_lengths) - framed_lengths
+
+    shard_index = {'num_examples': len(record_lengths),
+                   'compression_type': compression_type,
+                   'record_offsets': record_offsets.tolist(),
+                   'record_lengths': record_lengths.tolist()}
+
+    with tf.gfile.GFile(get_index_filepath(tfrecord_filepath), 'w') as f:
+        f.write(json.dumps(shard_index))
+
+
+def read_shard_index(tfrecord_filepath):
+    """Reads the sidecar index of the shard at `tfrecord_filepath`.
+
+    Returns:
+        The index as a dictionary, or `None` if the shard has no index (e.g.
+        because it was written before indices were introduced).
+    """
+    index_filepath = get_index_filepath(tfrecord_filepath)
+    if not tf.gfile.Exists(index_filepath):
+        return None
+
+    with tf.gfile.GFile(index_filepath, 'r') as f:
+        return json.loads(f.read())
+
+
+def get_compression_type(data_filenames):
+    """Returns the compression type that the shards `data_filenames` were
+    written with, from their indexes.
+
+    All shards must have been written with the same compression type, since
+    they are read by the same readers.
+    """
+    compression_types = set()
+    for data_file in data_filenames:
+        shard_index = read_shard_index(data_file)
+        if shard_index is None:
+            compression_types.add(LEGACY_COMPRESSION_TYPE)
+        else:
+            compression_types.add(shard_index.get('compression_type',
+                                                  LEGACY_COMPRESSION_TYPE))
+
+    assert len(compression_types) == 1, (
+        'Shards have mixed compression types {}.'.format(sorted(compression_types)))
+
+    return compression_types.pop()
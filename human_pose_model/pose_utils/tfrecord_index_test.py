@@ -0,0 +1,92 @@
+"""Tests for the sidecar TFRecord shard indexes."""
+import os
+import struct
+import tempfile
+import tensorflow as tf
+from pose_utils import tfrecord_index
+
+class TFRecordIndexTest(tf.test.TestCase):
+    def setUp(self):
+        super(TFRecordIndexTest, self).setUp()
+        self._tmp_dir = tempfile.mkdtemp(dir=self.get_temp_dir())
+
+    def _get_shard_filepath(self, shard_number):
+        return os.path.join(self._tmp_dir, 'train{}.tfrecord'.format(shard_number))
+
+    def test_index_filepath(self):
+        self.assertEqual(tfrecord_index.get_index_filepath('/data/train0.tfrecord'),
+                         '/data/train0.tfrecord.index')
+
+    def test_missing_index(self):
+        self.assertIsNone(tfrecord_index.read_shard_index(self._get_shard_filepath(0)))
+
+    def test_index_round_trip(self):
+        shard_filepath = self._get_shard_filepath(0)
+        tfrecord_index.write_shard_index(shard_filepath, [10, 0, 5], 'gzip')
+
+        shard_index = tfrecord_index.read_shard_index(shard_filepath)
+
+        self.assertEqual(shard_index['num_examples'], 3)
+        self.assertEqual(shard_index['compression_type'], 'gzip')
+        self.assertEqual(shard_index['record_lengths'], [10, 0, 5])
+        self.assertEqual(shard_index['record_offsets'], [0, 26, 42])
+
+    def test_offsets_match_uncompressed_shard(self):
+        shard_filepath = self._get_shard_filepath(0)
+        records = [b'a'*10, b'', b'bcdef', b'g'*300]
+
+        options = tfrecord_index.get_record_options('none')
+        with tf.python_io.TFRecordWriter(shard_filepath, options=options) as writer:
+            for record in records:
+                writer.write(record)
+        tfrecord_index.write_shard_index(shard_filepath,
+                                         [len(record) for record in records],
+                                         'none')
+
+        shard_index = tfrecord_index.read_shard_index(shard_filepath)
+        with open(shard_filepath, 'rb') as f:
+            for offset, length, record in zip(shard_index['record_offsets'],
+                                              shard_index['record_lengths'],
+                                              records):
+                f.seek(offset)
+                header = f.read(tfrecord_index.RECORD_HEADER_BYTES)
+                self.assertEqual(struct.unpack('<Q', header[:8])[0], length)
+                self.assertEqual(f.read(length), record)
+
+            # NOTE(brendan): The last record's footer ends the file.
+            self.assertEqual(f.seek(0, os.SEEK_END),
+                             offset + length + tfrecord_index.RECORD_HEADER_BYTES +
+                             tfrecord_index.RECORD_FOOTER_BYTES)
+
+    def test_compressed_shard_is_readable(self):
+        shard_filepath = self._get_shard_filepath(0)
+        records = [b'abc'*100, b'def']
+
+        options = tfrecord_index.get_record_options('zlib', compression_level=1)
+        with tf.python_io.TFRecordWriter(shard_filepath, options=options) as writer:
+            for record in records:
+                writer.write(record)
+
+        self.assertEqual(list(tf.python_io.tf_record_iterator(shard_filepath, options)),
+                         records)
+
+    def test_compression_type(self):
+        legacy_filepath = self._get_shard_filepath(0)
+        self.assertEqual(tfrecord_index.get_compression_type([legacy_filepath]),
+                         tfrecord_index.LEGACY_COMPRESSION_TYPE)
+
+        none_filepaths = [self._get_shard_filepath(1), self._get_shard_filepath(2)]
+        for none_filepath in none_filepaths:
+            tfrecord_index.write_shard_index(none_filepath, [1], 'none')
+        self.assertEqual(tfrecord_index.get_compression_type(none_filepaths), 'none')
+
+        with self.assertRaises(AssertionError):
+            tfrecord_index.get_compression_type([legacy_filepath] + none_filepaths)
+
+    def test_unknown_compression_type(self):
+        with self.assertRaises(ValueError):
+            tfrecord_index.get_record_options('lz4')
+
+
+if __name__ == "__main__":
+    tf.test.main()
@@ -3,18 +3,229 @@ A tiny module to profile function calls.
 
 The code used originated from the Python Cookbook (O'Reilly), version 3,
 section 14.13.
+
+Rather than printing each call, the time of each call is recorded in a
+registry of named timers, and a summary table of call counts, totals and
+p50/p90/p99 quantiles is printed on demand (`print_summary`) and at exit.
+
+Functions are timed by decorating them with `@timethis`, and blocks of code by
+`with timer('name'):`.
+
+Each thread records into its own per-timer stats, so recording takes no lock;
+the stats of all threads are only merged when a summary is made. Quantiles
+are estimated from counts of times in logarithmic buckets, each
+`BUCKET_RATIO` times wider than the last, so they are within about 5% of the
+true quantiles.
+
+Timing is switched off by `disable()`, after which each timed call costs one
+check of a flag, or entirely by setting the environment variable
+`TIMETHIS_DISABLED=1`, in which case `@timethis` returns functions unchanged.
 """
+import atexit
+import collections
+import math
+import os
+import threading
 import time
 from functools import wraps
 
+BUCKET_RATIO = 1.1
+QUANTILES = (0.5, 0.9, 0.99)
+
+_LOG_BUCKET_RATIO = math.log(BUCKET_RATIO)
+_is_compiled_out = os.environ.get('TIMETHIS_DISABLED', '0') == '1'
+_is_enabled = not _is_compiled_out
+
+_registry_lock = threading.Lock()
+_registry = collections.defaultdict(list)
+_thread_stats = threading.local()
+
+class _TimerStats(object):
+    """Times recorded by one timer in one thread."""
+    __slots__ = ('count', 'total', 'max', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = collections.defaultdict(int)
+
+    def record(self, secs):
+        self.count += 1
+        self.total += secs
+        if secs > self.max:
+            self.max = secs
+
+        if secs > 0:
+            self.buckets[int(math.floor(math.log(secs)/_LOG_BUCKET_RATIO))] += 1
+        else:
+            self.buckets[None] += 1
+
+
+def _get_stats(name):
+    """Returns this thread's stats of the timer `name`, registering them on
+    first use.
+    """
+    try:
+        return _thread_stats.stats[name]
+    except AttributeError:
+        _thread_stats.stats = {}
+    except KeyError:
+        pass
+
+    stats = _TimerStats()
+    _thread_stats.stats[name] = stats
+    with _registry_lock:
+        _registry[name].append(stats)
+
+    return stats
+
+
+def _get_quantile(buckets, count, quantile):
+    """Returns an estimate of `quantile` of the times counted in `buckets`."""
+    rank = quantile*count
+    seen = buckets.get(None, 0)
+    if seen >= rank:
+        return 0.0
+
+    for bucket in sorted(bucket for bucket in buckets if bucket is not None):
+        seen += buckets[bucket]
+        if seen >= rank:
+            return BUCKET_RATIO**(bucket + 0.5)
+
+    return 0.0
+
+
+def enable():
+    """Switches recording of times back on, after `disable`."""
+    global _is_enabled
+    _is_enabled = not _is_compiled_out
+
+
+def disable():
+    """Switches recording of times off."""
+    global _is_enabled
+    _is_enabled = False
+
+
+def record(name, secs):
+    """Records a time of `secs` seconds for the timer `name`."""
+    if _is_enabled:
+        _get_stats(name).record(secs)
+
+
+class timer(object):
+    """Context manager recording the time taken by its block of code for the
+    timer `name`.
+    """
+    __slots__ = ('_name', '_start')
+
+    def __init__(self, name):
+        self._name = name
+
+    def __enter__(self):
+        if _is_enabled:
+            self._start = time.perf_counter()
+        else:
+            self._start = None
+
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._start is not None:
+            _get_stats(self._name).record(time.perf_counter() - self._start)
+
+        return False
+
+
 def timethis(func):
+    if _is_compiled_out:
+        return func
+
+    name = '{}.{}'.format(func.__module__, func.__name__)
+
     @wraps(func)
     def wrapper(*args, **kwargs):
+        if not _is_enabled:
+            return func(*args, **kwargs)
+
         start = time.perf_counter()
         r = func(*args, **kwargs)
-        end = time.perf_counter()
-        print('{}.{}: {}'.format(func.__module__, func.__name__, end - start))
+        _get_stats(name).record(time.perf_counter() - start)
 
         return r
 
     return wrapper
+
+
+def get_summary():
+    """Merges the stats of each timer across threads.
+
+    Returns:
+        Dictionary mapping timer names to dictionaries of count, total, mean,
+        max and p50/p90/p99 times in seconds.
+    """
+    with _registry_lock:
+        registry = {name: list(thread_stats) for name, thread_stats in _registry.items()}
+
+    summary = {}
+    for name, thread_stats in registry.items():
+        count = sum(stats.count for stats in thread_stats)
+        if count == 0:
+            continue
+
+        buckets = collections.Counter()
+        for stats in thread_stats:
+            buckets.update(dict(stats.buckets))
+
+        total = sum(stats.total for stats in thread_stats)
+        timer_summary = {'count': count,
+                         'total': total,
+                         'mean': total/count,
+                         'max': max(stats.max for stats in thread_stats)}
+        for quantile in QUANTILES:
+            timer_summary['p{}'.format(int(100*quantile))] = min(
+                _get_quantile(buckets, count, quantile), timer_summary['max'])
+
+        summary[name] = timer_summary
+
+    return summary
+
+
+def format_summary():
+    """Returns the summary of all timers as a table, slowest total first.
+
+    Times are in milliseconds, to four significant figures, so that both
+    sub-microsecond and long-running timers are readable.
+    """
+    summary = get_summary()
+
+    quantile_names = ['p{}'.format(int(100*quantile)) for quantile in QUANTILES]
+    columns = ['count', 'total', 'mean'] + quantile_names + ['max']
+
+    table = '{:<50} '.format('timer (times in ms)')
+    table += ' '.join('{:>10}'.format(column) for column in columns)
+    for name in sorted(summary, key=lambda name: summary[name]['total'], reverse=True):
+        timer_summary = summary[name]
+        table += '\n{:<50} {:>10}'.format(name, timer_summary['count'])
+        for column in columns[1:]:
+            table += ' {:>10.4g}'.format(1000*timer_summary[column])
+
+    return table
+
+
+def print_summary():
+    """Prints the summary table of all timers, if any times were recorded."""
+    if get_summary():
+        print(format_summary())
+
+
+def reset():
+    """Clears the times recorded by all timers in all threads."""
+    with _registry_lock:
+        for thread_stats in _registry.values():
+            for stats in thread_stats:
+                stats.__init__()
+
+
+atexit.register(print_summary)
@@ -0,0 +1,107 @@
+"""Tests for the registry of named timers and their quantile estimates."""
+import threading
+import unittest
+import numpy as np
+from pose_utils import timethis
+
+@timethis.timethis
+def _timed_function(value):
+    return 2*value
+
+
+@unittest.skipIf(timethis._is_compiled_out, 'TIMETHIS_DISABLED is set.')
+class TimethisTest(unittest.TestCase):
+    def setUp(self):
+        timethis.enable()
+        timethis.reset()
+
+    def tearDown(self):
+        timethis.enable()
+        timethis.reset()
+
+    def test_quantiles_within_bucket_ratio(self):
+        times = np.random.RandomState(0).lognormal(mean=-6, sigma=1, size=10000)
+        for secs in times:
+            timethis.record('lognormal', secs)
+
+        summary = timethis.get_summary()['lognormal']
+
+        self.assertEqual(summary['count'], len(times))
+        self.assertAlmostEqual(summary['total'], np.sum(times))
+        self.assertAlmostEqual(summary['max'], np.max(times))
+        for quantile in timethis.QUANTILES:
+            true_quantile = np.percentile(times, 100*quantile)
+            estimate = summary['p{}'.format(int(100*quantile))]
+            self.assertLess(abs(estimate/true_quantile - 1),
+                            timethis.BUCKET_RATIO - 1)
+
+    def test_quantiles_clamped_to_max(self):
+        timethis.record('single', 0.01)
+
+        summary = timethis.get_summary()['single']
+
+        self.assertLessEqual(summary['p99'], summary['max'])
+        self.assertAlmostEqual(summary['p50'], 0.01, delta=0.01*(timethis.BUCKET_RATIO - 1))
+
+    def test_zero_times(self):
+        for _ in range(9):
+            timethis.record('zeros', 0.0)
+        timethis.record('zeros', 1.0)
+
+        summary = timethis.get_summary()['zeros']
+
+        self.assertEqual(summary['p50'], 0.0)
+        self.assertEqual(summary['p90'], 0.0)
+        self.assertAlmostEqual(summary['p99'], 1.0, delta=timethis.BUCKET_RATIO - 1)
+
+    def test_timer_and_decorator(self):
+        with timethis.timer('block'):
+            pass
+        self.assertEqual(_timed_function(3), 6)
+
+        summary = timethis.get_summary()
+
+        self.assertEqual(summary['block']['count'], 1)
+        self.assertEqual(summary['{}._timed_function'.format(__name__)]['count'], 1)
+
+    def test_disable(self):
+        timethis.disable()
+        with timethis.timer('disabled'):
+            pass
+        timethis.record('disabled', 1.0)
+        _timed_function(1)
+        self.assertEqual(timethis.get_summary(), {})
+
+        timethis.enable()
+        timethis.record('disabled', 1.0)
+        self.assertEqual(timethis.get_summary()['disabled']['count'], 1)
+
+    def test_threads_merged(self):
+        def record_times():
+            for _ in range(100):
+                timethis.record('threaded', 0.001)
+
+        threads = [threading.Thread(target=record_times) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        record_times()
+
+        self.assertEqual(timethis.get_summary()['threaded']['count'], 500)
+
+    def test_format_summary(self):
+        timethis.record('fast', 3e-7)
+        timethis.record('slow', 2.0)
+
+        lines = timethis.format_summary().split('\n')
+
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(lines[1].startswith('slow'))
+        self.assertTrue(lines[2].startswith('fast'))
+        self.assertIn('0.0003', lines[2])
+        self.assertIn('2000', lines[1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -11,18 +11,33 @@ import tensorflow.contrib.slim as slim
 from tensorflow.python.ops import control_flow_ops
 from tensorflow.python.framework import ops
 from pose_utils import pose_util
+from pose_utils import async_checkpoint
+from pose_utils import profiling
+from pose_utils import step_stats
 from pose_utils.pose_flags import FLAGS
 from dataset.mpii_datatypes import JOINT_NAMES
-from input_pipeline import setup_train_input_pipeline
+from input_pipeline import (setup_train_input_pipeline,
+                            add_batch_summaries,
+                            INPUT_ITERATOR_SAVEABLES)
 from networks.inference import inference
 from evaluate import setup_evaluation, evaluate_single_epoch
 
 RMSPROP_DECAY = 0.9
 RMSPROP_MOMENTUM = 0.9
 RMSPROP_EPSILON = 1.0
+ADAM_LEARNING_RATE = 0.001
+INPUT_CHECKPOINT_FILENAME = 'input_checkpoint'
+SUMMARY_INTERVAL_STEPS = 100
+PROFILE_DIRNAME = 'profiles'
 
 
-def _setup_adam_optimizer():
+def _setup_adam_optimizer(learning_rate):
+    """Sets up the Adam optimizer, with a constant `learning_rate`.
+
+    Returns:
+        (global_step, optimizer, learning_rate) tuple, where `learning_rate`
+        is a tensor, as returned by `_setup_optimizer`.
+    """
     global_step = tf.get_variable(
         name='global_step',
         shape=[],
@@ -30,9 +45,12 @@ def _setup_adam_optimizer():
         initializer=tf.constant_initializer(0),
         trainable=False)
 
-    optimizer = tf.train.AdamOptimizer()
+    learning_rate = tf.constant(learning_rate, dtype=tf.float32, name='learning_rate')
+    optimizer = tf.train.AdamOptimizer(learning_rate=learning_rate)
 
-    return global_step, optimizer
+    tf.summary.scalar(name='learning_rate', tensor=learning_rate)
+
+    return global_step, optimizer, learning_rate
 
 # Legacy?
 def _setup_optimizer(batches_per_epoch,
@@ -100,9 +118,16 @@ def _get_variables_to_train():
 def _average_gradients(tower_grads):
     """Averages the gradients for all gradients in `tower_grads`, and returns a
     list of `(avg_grad, var)` tuples.
+
+    Variables with a `None` gradient, i.e. that the loss does not depend on,
+    are passed through with a `None` gradient, which `apply_gradients` skips.
     """
     avg_grad_and_vars = []
     for grad_and_vars in zip(*tower_grads):
+        if grad_and_vars[0][0] is None:
+            avg_grad_and_vars.append(grad_and_vars[0])
+            continue
+
         grads = []
         for grad, _ in grad_and_vars:
             grads.append(tf.expand_dims(input=grad, axis=0))
@@ -115,6 +140,59 @@ def _average_gradients(tower_grads):
     return avg_grad_and_vars
 
 
+def _accumulate_gradients(grad_and_vars, num_accumulation_steps):
+    """Sums the gradients in `grad_and_vars` over `num_accumulation_steps`
+    mini-batches, in local accumulator variables.
+
+    The accumulators are local variables, so that they are not written to or
+    restored from checkpoints. Checkpoints are only saved at the end of an
+    epoch, which is made to end on an optimizer step, when the accumulators
+    are zero.
+
+    Variables with a `None` gradient get no accumulator, and are left out of
+    `mean_grad_and_vars`, as `apply_gradients` would skip them anyway. Sparse
+    gradients (`tf.IndexedSlices`) are converted to dense tensors to be added
+    to their accumulators.
+
+    Returns:
+        accumulate_op: Operation that adds the gradients of the current
+            mini-batch to the accumulators.
+        mean_grad_and_vars: List of `(mean_grad, var)` tuples, of the
+            accumulated gradients divided by `num_accumulation_steps`, read
+            after `accumulate_op`.
+        accumulators: The accumulator variables, to be zeroed after each
+            optimizer step.
+    """
+    accumulators = []
+    accumulated_vars = []
+    accumulate_ops = []
+    for grad, var in grad_and_vars:
+        if grad is None:
+            continue
+
+        accumulator = tf.Variable(
+            initial_value=tf.zeros(shape=var.get_shape(),
+                                   dtype=var.dtype.base_dtype),
+            trainable=False,
+            collections=[tf.GraphKeys.LOCAL_VARIABLES],
+            name='{}/accumulator'.format(var.op.name))
+
+        accumulators.append(accumulator)
+        accumulated_vars.append(var)
+        accumulate_ops.append(tf.assign_add(ref=accumulator,
+                                            value=tf.convert_to_tensor(grad)))
+
+    accumulate_op = tf.group(*accumulate_ops, name='accumulate_gradients')
+
+    mean_grad_and_vars = []
+    with tf.control_dependencies([accumulate_op]):
+        for accumulator, var in zip(accumulators, accumulated_vars):
+            mean_grad = accumulator.read_value()/num_accumulation_steps
+            mean_grad_and_vars.append((mean_grad, var))
+
+    return accumulate_op, mean_grad_and_vars, accumulators
+
+
 def _setup_training_op(images,
                        binary_maps,
                        heatmaps,
@@ -122,10 +200,18 @@ def _setup_training_op(images,
                        is_visible_weights,
                        global_step,
                        optimizer,
-                       num_gpus):
+                       num_gpus,
+                       num_accumulation_steps):
     """Sets up inference (predictions), loss calculation, and minimization
     based on the input optimizer.
 
+    If `num_accumulation_steps` is greater than one, the gradients of each
+    mini-batch are summed by `accumulate_op`, and the optimizer step is taken
+    by `train_op` on the mean of the gradients of every
+    `num_accumulation_steps` mini-batches, including the mini-batch that
+    `train_op` is run on. Otherwise, `accumulate_op` and `train_op` are the
+    same operation, taking an optimizer step on each mini-batch.
+
     Args:
         images: Batch of preprocessed examples dequeued from the input
             pipeline.
@@ -135,8 +221,11 @@ def _setup_training_op(images,
         global_step: Training step counter.
         optimizer: Optimizer to minimize the loss function.
         num_gpus: Number of GPUs to split each mini-batch across.
+        num_accumulation_steps: Number of mini-batches to accumulate gradients
+            over before each optimizer step.
 
-    Returns: Operation to run a training step.
+    Returns:
+        (accumulate_op, train_op, total_loss) tuple.
     """
     images_split = tf.split(value=images, num_or_size_splits=num_gpus, axis=0)
     binary_maps_split = tf.split(value=binary_maps,
@@ -185,17 +274,30 @@ def _setup_training_op(images,
 
     avg_grad_and_vars = _average_gradients(tower_grads)
 
+    if num_accumulation_steps > 1:
+        accumulate_op, avg_grad_and_vars, accumulators = _accumulate_gradients(
+            avg_grad_and_vars, num_accumulation_steps)
+
     apply_gradient_op = optimizer.apply_gradients(
         grads_and_vars=avg_grad_and_vars,
         global_step=global_step)
 
+    if num_accumulation_steps > 1:
+        with tf.control_dependencies([apply_gradient_op]):
+            apply_gradient_op = tf.group(
+                *[accumulator.assign(tf.zeros_like(accumulator))
+                  for accumulator in accumulators],
+                name='apply_accumulated_gradients')
+    else:
+        accumulate_op = apply_gradient_op
+
     # TODO(brendan): It is possible to keep track of moving averages of
     # variables ("shadow variables"), and these shadow variables can be used
     # for evaluation.
     #
     # See TF models ImageNet Inception training code.
 
-    return apply_gradient_op, total_loss
+    return accumulate_op, apply_gradient_op, total_loss
 
 
 def _restore_checkpoint_variables(session,
@@ -236,9 +338,46 @@ def _restore_checkpoint_variables(session,
     restorer.restore(sess=session, save_path=checkpoint_path)
 
 
+def _restore_input_position(session, input_saver, global_step, log_dir):
+    """Restores the position of the input pipeline from the input checkpoint
+    in `log_dir` that was saved at the step that the model was restored to.
+    Input checkpoints are only saved with `FLAGS.checkpoint_input_position`.
+
+    Input checkpoints are written synchronously, while model checkpoints are
+    written in the background, so after a crash the latest input checkpoint
+    can be from a later step than the latest model checkpoint. Only an input
+    checkpoint from exactly the model's step is restored, and if there is
+    none, e.g. when starting a new training run, the input pipeline is left
+    to start from the beginning.
+    """
+    input_checkpoint_state = tf.train.get_checkpoint_state(
+        checkpoint_dir=log_dir, latest_filename=INPUT_CHECKPOINT_FILENAME)
+    if input_checkpoint_state is None:
+        return
+
+    total_steps = session.run(global_step)
+    step_suffix = '-{}'.format(total_steps)
+    matching_checkpoints = [
+        input_checkpoint
+        for input_checkpoint in input_checkpoint_state.all_model_checkpoint_paths
+        if (input_checkpoint.endswith(step_suffix) and
+            tf.train.checkpoint_exists(input_checkpoint))]
+    if not matching_checkpoints:
+        print('Not restoring input position, since no input checkpoint in {} '
+              'matches step {}.'.format(log_dir, total_steps))
+        return
+
+    input_saver.restore(sess=session, save_path=matching_checkpoints[-1])
+
+
 def _train_single_epoch(session,
-                        saver,
+                        checkpoint_saver,
+                        input_saver,
                         train_writer,
+                        step_stats_writer,
+                        profiler,
+                        stage_op,
+                        accumulate_op,
                         train_op,
                         loss,
                         global_step,
@@ -253,7 +392,26 @@ def _train_single_epoch(session,
     and for every epoch executes the graph in `val_session`, which will
     evaluate the latest model checkpoint on a validation set.
 
-    After the epoch, a checkpoint is saved to `log_dir`.
+    Each step is run in two phases: first `stage_op` moves the next batch from
+    the input pipeline into the staging area, then the training step runs on
+    the staged batch. Timing the phases separately tells how long each step
+    waited for input, which is written to `step_stats_writer` along with the
+    compute time. Summaries are fetched in the same `session.run` as the
+    training step, every `SUMMARY_INTERVAL_STEPS` steps.
+
+    Every `FLAGS.num_accumulation_steps`th mini-batch is run with `train_op`,
+    which takes an optimizer step and increments `global_step`, and the rest
+    with `accumulate_op`, which only accumulates their gradients. Summaries and
+    profiles are only taken on optimizer steps.
+
+    If `profiler` is not `None`, both phases of every
+    `FLAGS.profile_interval_steps`th step are traced by it, as one profiled
+    step, and its report is rewritten at the end of the epoch.
+
+    After the epoch, the variables are snapshotted by `checkpoint_saver`,
+    which writes the checkpoint to `log_dir` in the background. If
+    `input_saver` is not `None`, a checkpoint of the position of the input
+    pipeline at the same step is then saved by it, which blocks until written.
 
     Returns:
         epoch: The epoch number that was just trained, calculated from the
@@ -262,36 +420,82 @@ def _train_single_epoch(session,
     train_epoch_mean_loss = 0
     Epoch = trange(num_batches_per_epoch, desc='Loss', leave=True)
     feed_dict = {initial_lr_holder: initial_learning_rate}
+    total_steps = session.run(global_step)
     for batch_step in Epoch:
-        start_time = time.time()
-        _, batch_loss, total_steps, learning_rate = session.run(
-            fetches=[train_op,
-                     loss,
-                     global_step,
-                     learning_rate_tensor],
-            feed_dict=feed_dict)
+        is_optimizer_step = ((batch_step + 1) % FLAGS.num_accumulation_steps) == 0
+        if is_optimizer_step:
+            fetches = [train_op, loss, global_step, learning_rate_tensor]
+        else:
+            fetches = [accumulate_op, loss, global_step, learning_rate_tensor]
+
+        is_summary_step = (is_optimizer_step and
+                           ((total_steps + 1) % SUMMARY_INTERVAL_STEPS) == 0)
+        if is_summary_step:
+            fetches.append(summary_op)
 
-        duration = time.time() - start_time
+        is_profile_step = (is_optimizer_step and
+                           (profiler is not None) and
+                           ((total_steps + 1) % FLAGS.profile_interval_steps) == 0)
 
-        step_desc = ('step {}: loss = {} ({:.2f} sec/step)'
-                     .format(total_steps, batch_loss, duration))
+        start_time = time.time()
+        if is_profile_step:
+            profiler.run(session,
+                         stage_op,
+                         '{}-input'.format(total_steps + 1),
+                         count_step=False)
+            staged_time = time.time()
+            results, _ = profiler.run(session,
+                                      fetches,
+                                      '{}-train'.format(total_steps + 1),
+                                      feed_dict)
+        else:
+            session.run(fetches=stage_op)
+            staged_time = time.time()
+            results = session.run(fetches=fetches, feed_dict=feed_dict)
+        end_time = time.time()
+
+        _, batch_loss, total_steps, learning_rate = results[0:4]
+
+        input_wait_secs = staged_time - start_time
+        compute_secs = end_time - staged_time
+        step_stats_writer.write_step(total_steps,
+                                     batch_loss,
+                                     input_wait_secs,
+                                     compute_secs)
+
+        step_desc = ('step {}: loss = {} ({:.2f} sec/step, {:.2f} sec input wait)'
+                     .format(total_steps,
+                             batch_loss,
+                             input_wait_secs + compute_secs,
+                             input_wait_secs))
         train_epoch_mean_loss += batch_loss
         Epoch.set_description(step_desc)
         Epoch.refresh()
 
         assert not np.isnan(batch_loss)
 
-        if (total_steps % 100) == 0:
-            summary_str = session.run(summary_op, feed_dict=feed_dict)
-            train_writer.add_summary(summary=summary_str,
+        if is_summary_step:
+            train_writer.add_summary(summary=results[4],
                                      global_step=total_steps)
 
-    checkpoint_path = os.path.join(log_dir, FLAGS.checkpoint_name+'.ckpt')
-    saver.save(sess=session,
-               save_path=checkpoint_path,
-               global_step=total_steps)
+    step_stats_writer.flush()
+    if (profiler is not None) and (profiler.num_steps > 0):
+        profiler.write_report(FLAGS.profile_top_ops)
 
-    epoch = int(total_steps/num_batches_per_epoch)
+    checkpoint_path = os.path.join(log_dir, FLAGS.checkpoint_name+'.ckpt')
+    checkpoint_saver.save(session=session,
+                          save_path=checkpoint_path,
+                          global_step=total_steps)
+
+    if input_saver is not None:
+        input_checkpoint_path = os.path.join(log_dir,
+                                             FLAGS.checkpoint_name+'.input.ckpt')
+        input_saver.save(sess=session,
+                         save_path=input_checkpoint_path,
+                         global_step=total_steps,
+                         latest_filename=INPUT_CHECKPOINT_FILENAME)
+
+    epoch = int(total_steps*FLAGS.num_accumulation_steps/num_batches_per_epoch)
     train_epoch_mean_loss /= num_batches_per_epoch
     log_handle.write('Epoch {} done.\n'.format(epoch))
     log_handle.write('Mean training loss is {}.\n'.format(train_epoch_mean_loss))
@@ -309,36 +513,71 @@ def _setup_training(FLAGS, initial_learning_rate):
             the top of this file.
 
     Returns:
-        (num_batches_per_epoch, train_op, train_loss, global_step) tuple needed
-        to run training steps.
+        (num_batches_per_epoch, stage_op, accumulate_op, train_op, train_loss,
+        global_step, learning_rate) tuple needed to run training steps.
+        `num_batches_per_epoch` counts mini-batches, of which every
+        `FLAGS.num_accumulation_steps`th is run with `train_op`, and the rest
+        with `accumulate_op`.
     """
     num_counting_threads = FLAGS.num_preprocess_threads + FLAGS.num_readers
     num_training_examples, train_data_filenames = pose_util.count_training_examples(
         FLAGS.train_data_dir, num_counting_threads, 'train')
 
-    images, binary_maps, heatmaps, weights, is_visible_weights = setup_train_input_pipeline(FLAGS, train_data_filenames)
-
-    num_batches_per_epoch = int(num_training_examples / FLAGS.batch_size)
+    examples_per_shard = int(num_training_examples/len(train_data_filenames))
+    input_batch = setup_train_input_pipeline(FLAGS,
+                                             train_data_filenames,
+                                             examples_per_shard)
+
+    # NOTE(brendan): The batch is staged by a separate `session.run` of
+    # `stage_op` before each training step, so that the time spent waiting on
+    # the input pipeline can be measured apart from the training step.
+    with tf.name_scope('input_staging'):
+        staging_area = tf.contrib.staging.StagingArea(
+            dtypes=[tensor.dtype for tensor in input_batch],
+            shapes=[tensor.get_shape() for tensor in input_batch])
+        stage_op = staging_area.put(input_batch)
+        images, binary_maps, heatmaps, weights, is_visible_weights = staging_area.get()
+
+    add_batch_summaries(images, binary_maps, heatmaps)
+
+    # NOTE(brendan): Each of the `num_workers` training processes reads its own
+    # share of the shards, so an epoch of one process is a share of the data.
+    # With gradient accumulation, `global_step` counts optimizer steps, and
+    # each epoch is cut to a whole number of them.
+    num_steps_per_epoch = int(num_training_examples /
+                              (FLAGS.num_workers*FLAGS.batch_size*FLAGS.num_accumulation_steps))
+    num_batches_per_epoch = num_steps_per_epoch*FLAGS.num_accumulation_steps
+
+    # NOTE(brendan): Adam keeps its own default learning rate, rather than
+    # `initial_learning_rate`, but is scaled for accumulation all the same.
+    if FLAGS.scale_learning_rate_by_accumulation:
+        learning_rate_scale = FLAGS.num_accumulation_steps
+    else:
+        learning_rate_scale = 1
 
     if FLAGS.optimizer == 'adam':
-        global_step, optimizer = _setup_adam_optimizer()
+        global_step, optimizer, learning_rate = _setup_adam_optimizer(
+            learning_rate_scale*ADAM_LEARNING_RATE)
     else:
+        initial_learning_rate *= learning_rate_scale
         global_step, optimizer, learning_rate = _setup_optimizer(
-            num_batches_per_epoch,
+            num_steps_per_epoch,
             FLAGS.num_epochs_per_decay,
             initial_learning_rate,
             FLAGS.learning_rate_decay_factor)
 
-    train_op, train_loss = _setup_training_op(images,
-                                              binary_maps,
-                                              heatmaps,
-                                              weights,
-                                              is_visible_weights,
-                                              global_step,
-                                              optimizer,
-                                              FLAGS.num_gpus)
+    accumulate_op, train_op, train_loss = _setup_training_op(images,
+                                                             binary_maps,
+                                                             heatmaps,
+                                                             weights,
+                                                             is_visible_weights,
+                                                             global_step,
+                                                             optimizer,
+                                                             FLAGS.num_gpus,
+                                                             FLAGS.num_accumulation_steps)
 
-    return num_batches_per_epoch, train_op, train_loss, global_step, learning_rate
+    return (num_batches_per_epoch, stage_op, accumulate_op, train_op, train_loss,
+            global_step, learning_rate)
 
 
 def _init_regression_subnetwork_first_layer(session, second_checkpoint_path):
@@ -462,14 +701,17 @@ def train():
     validation records and M + 1 records in total.
     """
     with tf.Graph().as_default():
+        if FLAGS.input_seed is not None:
+            tf.set_random_seed(FLAGS.input_seed)
+
         with tf.device('/cpu:0'):
             initial_lr_holder = tf.placeholder(dtype=tf.float32)
-            num_batches_per_epoch, train_op, train_loss, global_step, learning_rate_tensor = _setup_training(
-                FLAGS, initial_lr_holder)
+            (num_batches_per_epoch, stage_op, accumulate_op, train_op, train_loss,
+             global_step, learning_rate_tensor) = _setup_training(FLAGS, initial_lr_holder)
 
             eval_graph = tf.Graph()
             with eval_graph.as_default():
-                num_val_examples, val_loss, val_logits, gt_data = setup_evaluation(FLAGS)
+                num_val_examples, val_loss, streaming_pckh, val_input_initializer = setup_evaluation(FLAGS)
 
             session = tf.Session(
                 config=tf.ConfigProto(allow_soft_placement=True))
@@ -493,21 +735,43 @@ def train():
                                               FLAGS.second_checkpoint_exclude_scopes,
                                               FLAGS.is_regression_subnetwork_pretrained)
 
-            coord = tf.train.Coordinator()
-            threads = tf.train.start_queue_runners(sess=session, coord=coord)
-
             train_writer = tf.summary.FileWriter(
                 logdir=FLAGS.log_dir,
                 graph=session.graph)
 
             # Human Edible Report
             log_handle = open(os.path.join(FLAGS.log_dir, FLAGS.log_filename), 'a')
+            step_stats_writer = step_stats.StepStatsWriter(
+                os.path.join(FLAGS.log_dir, step_stats.STEP_STATS_FILENAME),
+                FLAGS.batch_size)
+
+            profiler = None
+            if FLAGS.profile_interval_steps > 0:
+                profiler = profiling.Profiler(os.path.join(FLAGS.log_dir,
+                                                           PROFILE_DIRNAME))
             log_df, runtime_df = _init_df(FLAGS.restore_global_step,
                                           FLAGS.checkpoint_name)
-            saver = tf.train.Saver(var_list=tf.global_variables())
+            checkpoint_saver = async_checkpoint.AsyncCheckpointSaver(
+                var_list=tf.global_variables(),
+                checkpoint_dir=FLAGS.log_dir,
+                max_to_keep=FLAGS.max_checkpoints_to_keep)
+
+            input_saver = None
+            if FLAGS.checkpoint_input_position:
+                input_saver = tf.train.Saver(
+                    var_list=tf.get_collection(INPUT_ITERATOR_SAVEABLES),
+                    max_to_keep=FLAGS.max_checkpoints_to_keep)
+
+                if FLAGS.restore_global_step:
+                    _restore_input_position(session,
+                                            input_saver,
+                                            global_step,
+                                            FLAGS.log_dir)
 
             with eval_graph.as_default():
                 restorer = tf.train.Saver(var_list=tf.global_variables())
+                eval_session = tf.Session(
+                    config=tf.ConfigProto(allow_soft_placement=True))
 
             summary_op = tf.summary.merge_all()
 
@@ -518,8 +782,13 @@ def train():
                 next_row = _get_runtime_row_dict(FLAGS.checkpoint_name)
                 epoch, train_epoch_mean_loss, learning_rate = _train_single_epoch(
                     session,
-                    saver,
+                    checkpoint_saver,
+                    input_saver,
                     train_writer,
+                    step_stats_writer,
+                    profiler,
+                    stage_op,
+                    accumulate_op,
                     train_op,
                     train_loss,
                     global_step,
@@ -535,15 +804,21 @@ def train():
                 next_row['Mean_Training_Loss'].append(train_epoch_mean_loss)
                 next_row['Learning_Rate'].append(learning_rate)
                 with eval_graph.as_default():
+                    # NOTE(brendan): The evaluation variables are loaded from
+                    # the snapshot just taken, rather than restored from the
+                    # checkpoint, so that evaluation runs while the checkpoint
+                    # is still being written.
+                    checkpoint_saver.restore_snapshot(eval_session,
+                                                      tf.global_variables())
                     valid_epoch_mean_loss = evaluate_single_epoch(
+                        eval_session,
                         restorer,
-                        FLAGS.log_dir,
+                        None,
                         val_loss,
-                        val_logits,
-                        gt_data,
+                        streaming_pckh,
+                        val_input_initializer,
                         num_val_examples,
                         FLAGS.batch_size,
-                        FLAGS.image_dim,
                         epoch,
                         log_handle,
                         next_row)
@@ -570,10 +845,11 @@ def train():
                                                     runtime_df,
                                                     epoch)
 
+            checkpoint_saver.close()
             log_handle.close()
+            step_stats_writer.close()
             train_writer.close()
-            coord.request_stop()
-            coord.join(threads=threads)
+            eval_session.close()
 
 
 def main(argv=None):
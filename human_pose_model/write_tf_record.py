@@ -1,13 +1,14 @@
 import os
 import threading
-import math
 import numpy as np
 import tensorflow as tf
-from pose_utils import pose_util
+from pose_utils import tfrecord_index
 from dataset.mpii_read import mpii_read
 from dataset.mpii_datatypes import Person
+from dataset.person_crops import plan_person_crops
+from dataset.shard_plan import plan_shards
 from pose_utils.timethis import timethis
-from dataset.shapes import Point, Rectangle
+from dataset.shapes import Point
 from pose_utils.sparse_to_dense import sparse_joints_to_dense_single_example
 
 FLAGS = tf.app.flags.FLAGS
@@ -18,6 +19,15 @@ tf.app.flags.DEFINE_string(
     """Filepath to the .mat file from the MPII HumanPose
     [website](human-pose.mpi-inf.mpg.de)""")
 
+tf.app.flags.DEFINE_boolean('use_mpii_cache', True,
+                            """Cache the annotations parsed from the .mat file
+                            on disk, and read them from that cache on later
+                            runs?""")
+
+tf.app.flags.DEFINE_string('mpii_cache_dir', None,
+                           """Directory in which to cache parsed annotations.
+                           Defaults to the directory of the .mat file.""")
+
 tf.app.flags.DEFINE_string('train_dir', '/mnt/data/datasets/MPII_HumanPose/train_512px',
                             """Path in which to write the TFRecord files.""")
 
@@ -35,6 +45,17 @@ tf.app.flags.DEFINE_integer('train_shards', 80,
 tf.app.flags.DEFINE_integer('image_dim', 512,
                             """Dimension of the square image to output.""")
 
+tf.app.flags.DEFINE_string('compression_type', 'zlib',
+                           """Compression of the TFRecord files, one of
+                           'none', 'gzip' or 'zlib'. Since the images are
+                           already JPEG compressed, 'none' costs little disk
+                           space and saves reader CPU.""")
+
+tf.app.flags.DEFINE_integer('compression_level', None,
+                            """zlib compression level (0-9) for 'gzip' and
+                            'zlib' compression. Defaults to zlib's default
+                            level.""")
+
 class ImageCoder(object):
     """A class that holds a session, passed using dependency injection during
     `ImageCoder` instantiations, which is used to run a TF graph to decode JPEG
@@ -53,7 +74,6 @@ class ImageCoder(object):
 
         self._decode_jpeg_data = tf.placeholder(dtype=tf.string)
         raw_image = tf.image.decode_jpeg(contents=self._decode_jpeg_data, channels=3)
-        self._img_shape = tf.shape(input=raw_image)
 
         self._crop_height_offset = tf.placeholder(dtype=tf.int32)
         self._crop_width_offset = tf.placeholder(dtype=tf.int32)
@@ -99,22 +119,6 @@ class ImageCoder(object):
 
         self._binary_maps = _get_binary_maps(FLAGS.image_dim, x_dense_joints, y_dense_joints)
 
-    def decode_jpeg(self, image_data):
-        """Returns the shape of an input JPEG image.
-
-        Args:
-            image_data: A JPEG image to find the shape of.
-
-        Returns:
-            shape: Shape of the image in the format Point(width, height).
-        """
-        shape = self._sess.run(fetches=self._img_shape,
-                               feed_dict={self._decode_jpeg_data: image_data})
-        assert len(shape) == 3
-        assert shape[2] == 3
-
-        return Point(shape[1], shape[0])
-
     def scale_encode(self,
                      image_data,
                      crop_offsets,
@@ -166,39 +170,6 @@ class ImageCoder(object):
         return self._sess.run(fetches=self._binary_maps, feed_dict=feed_dict)
 
 
-def _clamp_range(value, min_val, max_val):
-    """Clamps value to the range [min_val, max_val].
-
-    Args:
-        value: A number to be clamped.
-        min_val: Minimum value to return.
-        max_val: Maximum value to return.
-
-    Return:
-        value if value is in [min_val, max_val], otherwise whichever of
-        `min_val` or `max_val` is closer to value.
-    """
-    return max(min_val, min(value, max_val))
-
-
-def _clamp_point_to_image(point, image_shape):
-    """Clamps `point` so that it is inside the image whose shape is given by
-    `image_shape`.
-
-    Args:
-        point: `Point` to clamp.
-        image_shape: Dimensions of an image in the format Point(width, height).
-
-    Returns:
-        clamped_point: `point` with its dimensions clamped to the edges of the
-            image.
-    """
-    clamped_point = (_clamp_range(point.x, 0, image_shape.x),
-                     _clamp_range(point.y, 0, image_shape.y))
-
-    return clamped_point
-
-
 def _bytes_feature(value):
     """Wrapper for inserting bytes feature into Example proto"""
     return tf.train.Feature(bytes_list=tf.train.BytesList(value=[value]))
@@ -220,148 +191,6 @@ def _int64_feature(value):
     return tf.train.Feature(int64_list=tf.train.Int64List(value=value))
 
 
-def _append_scaled_joint(joints, joint_dim, max_joint_dim, image_center):
-    """Appends to joints the value of joint_dim, scaled down to be in the range
-    [-0.5, 0.5].
-
-    Args:
-        joints: List of joints, in the order [x0, y0, x1, y1, ...]
-        joint_dim: Next either xi or yi to append.
-        max_joint_dim: Maximum dimension of the image in which the joint
-            appears, e.g. height of 1080 in a 1920x1080 image.
-    """
-    scaled_joint = _clamp_range(
-        (joint_dim - image_center)/max_joint_dim, -0.5, 0.5)
-    joints.append(scaled_joint)
-
-
-def _extract_labeled_joints(person_joints,
-                            cropped_img_shape,
-                            padding,
-                            offsets):
-    """Extracts all of the joints for a single person in image, and puts them
-    in a list in the format [x0, y0, x1, y1, ...].
-
-    Not all joints are labeled for each person, so this function also returns a
-    sparse list of indices for person, where each index indicates which joint
-    is labeled. The indices correspond to two sparse lists of joint
-    coordinates, one for x and one for y.
-
-    Args:
-        person_joints: Joints of person in the image.
-        cropped_img_shape: The shape of the given image post-cropping, in the
-            format Point(cols, rows).
-        padding: Pixels of padding in Point(width, height) dimensions.
-        offsets: The Point(width, height) offsets of the top left corner of
-            this cropped image in the original image. This is needed to
-            translate the joint labels.
-
-    Returns:
-        (x_sparse_joints, y_sparse_joints, sparse_joint_indices) tuple, where
-        `*_sparse_joints` are lists of x and y joint coordinates, and
-        sparse_joint_indices is a list of indices indicate which joints are
-        which.
-
-        Visually: `x_sparse_joints` [x0, x1, x2]
-                  `y_sparse_joints` [y0, y1, y2]
-                  `sparse_joint_indices` [0, 1, 3]
-
-                  The above corresponds to a person for whom (x0, y0), (x1, y1)
-                  and (x2, y2) are joints 0, 1 and 3 (indexed 0-15 in (x, y)
-                  pairs as in the MPII dataset) for `person`, respectively.
-    """
-    x_sparse_joints = []
-    y_sparse_joints = []
-    sparse_joint_indices = []
-    is_visible_list = []
-    max_cropped_img_dim = max(cropped_img_shape.x, cropped_img_shape.y)
-    abs_image_center = Point(offsets.x + cropped_img_shape.x/2,
-                             offsets.y + cropped_img_shape.y/2)
-
-    for joint_index in range(len(person_joints)):
-        joint = person_joints[joint_index]
-        if joint is not None:
-            if ((offsets.x <= joint.x <= (offsets.x + cropped_img_shape.x)) and
-                (offsets.y <= joint.y <= (offsets.y + cropped_img_shape.y))):
-                _append_scaled_joint(x_sparse_joints,
-                                     joint.x,
-                                     max_cropped_img_dim,
-                                     abs_image_center.x)
-                _append_scaled_joint(y_sparse_joints,
-                                     joint.y,
-                                     max_cropped_img_dim,
-                                     abs_image_center.y)
-
-                sparse_joint_indices.append(joint_index)
-
-                is_visible_list.append(joint.is_visible)
-
-    return x_sparse_joints, y_sparse_joints, sparse_joint_indices, is_visible_list
-
-
-def _find_person_bounding_box(person, img_shape):
-    """Finds an enclosing bounding box for `person` in the image with
-    `img_shape` dimensions.
-
-    Currently the bounding box is found by taking the
-    (scale*200px) by (scale*200px) rectangle centered around `objpos`.
-
-    One experiment would be to take the bounding box found with the current
-    method, and expand or shrink each dimension to the minimum spanning
-    rectangle such that all the labelled joints are contained.
-
-    Args:
-        person: Person to find bounding box for.
-        img_shape: Dimensions of the image that the person is in.
-
-    Returns:
-        A `Rectangle` describing the box bounding `person`.
-    """
-    x = person.objpos.x
-    y = person.objpos.y
-
-    # NOTE(brendan): The MPII `scale` is with respect to 200px object height,
-    # and `objpos` is at the person's center.
-    person_half_dim = 100*person.scale
-    top_left = Point(x - person_half_dim, y - person_half_dim)
-    bottom_right = Point(x + person_half_dim, y + person_half_dim)
-
-    return Rectangle(_clamp_point_to_image(top_left, img_shape) +
-                     _clamp_point_to_image(bottom_right, img_shape))
-
-
-def _find_padded_person_dim(person_rect):
-    """Finds the large dimension, shape and padding needed for the bounding box
-    around a person.
-
-    Args:
-        person_rect: A `Rectangle` describing the bounding box of a person.
-
-    Returns:
-        padded_img_dim: Larger dimension of the person's bounding box.
-        person_shape_xy: Point(width, height) describing the person's
-            bounding box dimensions.
-        padding_xy: Point(padding_x, padding_y) describing the padding for the
-            person in the x and y dimensions, at least one of which will be
-            zero.
-    """
-    person_width = person_rect.get_width()
-    person_height = person_rect.get_height()
-    padding = abs(person_height - person_width)/2
-    if person_height > person_width:
-        height_pad = 0
-        width_pad = padding
-    else:
-        height_pad = padding
-        width_pad = 0
-
-    padded_img_dim = max(person_width, person_height)
-    person_shape_xy = Point(person_width, person_height)
-    padding_xy = Point(width_pad, height_pad)
-
-    return padded_img_dim, person_shape_xy, padding_xy
-
-
 def _get_binary_maps(image_dim, x_dense_joints, y_dense_joints):
     """
     Creates binary maps of shape [image_dim, image_dim, Person.NUM_JOINTS],
@@ -381,32 +210,30 @@ def _get_binary_maps(image_dim, x_dense_joints, y_dense_joints):
     return tf.cast(binary_maps, tf.uint8)
 
 
-def _write_example(coder, image_jpeg, people_in_img, writer):
-    """Writes an example to the TFRecord file owned by `writer`.
+def _write_example(coder, image_jpeg, person_indices, person_crops, writer):
+    """Writes one example per person in `person_indices` to the TFRecord file
+    owned by `writer`, using the crops and labels planned in `person_crops`.
 
-    See `_extract_labeled_joints` for the format of `*_sparse_joints` and
+    See `PersonCrops.get_sparse_labels` for the format of `*_sparse_joints` and
     `sparse_joint_indices`.
-    """
-    img_shape = coder.decode_jpeg(image_jpeg)
-
-    for person in people_in_img:
-        person_rect = _find_person_bounding_box(person, img_shape)
 
-        padded_img_dim, person_shape_xy, padding_xy = _find_padded_person_dim(
-            person_rect)
+    Returns:
+        List of the lengths in bytes of the serialized examples written.
+    """
+    record_lengths = []
+    for person_index in person_indices:
+        top_left = person_crops.top_left[person_index]
+        crop_dims = person_crops.crop_dims[person_index]
+        padding = person_crops.padding[person_index]
 
         scaled_img_jpeg = coder.scale_encode(
             image_jpeg,
-            person_rect.top_left,
-            person_shape_xy,
-            padding_xy,
-            padded_img_dim)
+            Point(*top_left),
+            Point(*crop_dims),
+            Point(*padding),
+            person_crops.padded_dim[person_index])
 
-        labels = _extract_labeled_joints(
-            person.joints,
-            person_shape_xy,
-            padding_xy,
-            person_rect.top_left)
+        labels = person_crops.get_sparse_labels(person_index)
 
         x_joints, y_joints, joint_indices, is_visible_list = labels
 
@@ -416,9 +243,7 @@ def _write_example(coder, image_jpeg, people_in_img, writer):
                                             np.reshape(joint_indices, [joints_shape, 1]),
                                             [joints_shape])
 
-        head_rect_width = person.head_rect.get_width()/padded_img_dim
-        head_rect_height = person.head_rect.get_height()/padded_img_dim
-        head_size = 0.6*math.sqrt(head_rect_width**2 + head_rect_height**2)
+        head_size = float(person_crops.head_size[person_index])
 
         example = tf.train.Example(
             features=tf.train.Features(
@@ -431,48 +256,60 @@ def _write_example(coder, image_jpeg, people_in_img, writer):
                     'is_visible_list': _int64_feature(is_visible_list),
                     'head_size': _float_feature(head_size)
                 }))
-        writer.write(tf.compat.as_bytes(example.SerializeToString()))
+        serialized_example = tf.compat.as_bytes(example.SerializeToString())
+        writer.write(serialized_example)
+        record_lengths.append(len(serialized_example))
 
+    return record_lengths
 
-def _process_image_files_single_thread(coder, thread_index, ranges, mpii_dataset):
-    """Processes a range of filenames and labels in the MPII dataset
-    corresponding to the given thread index.
+
+def _process_image_files_single_thread(coder,
+                                       thread_index,
+                                       shard_plan,
+                                       mpii_dataset,
+                                       person_crops):
+    """Writes the shards in `shard_plan` that belong to the given thread index,
+    i.e. every FLAGS.num_threads'th shard starting from `thread_index`, along
+    with each shard's sidecar index.
 
     Args:
         coder: An instance of `ImageCoder`, which is used to decode JPEG images
             from MPII.
         thread_index: Index of the current thread (must be unique).
+        shard_plan: List of arrays of image indices in each shard, from
+            `plan_shards`.
         mpii_dataset: Instance of `MpiiDataset` containing data shuffled in the
             order that those data should be written to TF Record.
+        person_crops: `PersonCrops` planned for `mpii_dataset`.
     """
     if FLAGS.is_train:
         base_name = 'train'
     else:
         base_name = 'test'
 
-    shards_per_thread = FLAGS.train_shards/FLAGS.num_threads
-    shard_ranges = pose_util.get_n_ranges(ranges[thread_index][0],
-                                          ranges[thread_index][1],
-                                          shards_per_thread)
-
-    for shard_index in range(len(shard_ranges)):
-        tfrecord_index = int(thread_index*shards_per_thread + shard_index)
-        tfrecord_filename = '{}{}.tfrecord'.format(base_name, tfrecord_index)
+    for shard_index in range(thread_index, len(shard_plan), FLAGS.num_threads):
+        tfrecord_filename = '{}{}.tfrecord'.format(base_name, shard_index)
         tfrecord_filepath = os.path.join(FLAGS.train_dir, tfrecord_filename)
 
-        options = tf.python_io.TFRecordOptions(
-            compression_type=tf.python_io.TFRecordCompressionType.ZLIB)
+        record_lengths = []
+        options = tfrecord_index.get_record_options(FLAGS.compression_type,
+                                                    FLAGS.compression_level)
         with tf.python_io.TFRecordWriter(path=tfrecord_filepath, options=options) as writer:
-            shard_start = shard_ranges[shard_index][0]
-            shard_end = shard_ranges[shard_index][1]
-            for img_index in range(shard_start, shard_end):
+            for img_index in shard_plan[shard_index]:
                 with tf.gfile.FastGFile(name=mpii_dataset.img_filenames[img_index], mode='rb') as f:
                     image_jpeg = f.read()
 
-                _write_example(coder,
-                               image_jpeg,
-                               mpii_dataset.people_in_imgs[img_index],
-                               writer)
+                person_indices = range(mpii_dataset.people_offsets[img_index],
+                                       mpii_dataset.people_offsets[img_index + 1])
+                record_lengths += _write_example(coder,
+                                                 image_jpeg,
+                                                 person_indices,
+                                                 person_crops,
+                                                 writer)
+
+        tfrecord_index.write_shard_index(tfrecord_filepath,
+                                         record_lengths,
+                                         FLAGS.compression_type)
 
 
 def _process_image_files(mpii_dataset, num_examples, session):
@@ -484,13 +321,17 @@ def _process_image_files(mpii_dataset, num_examples, session):
 
     num_threads = FLAGS.num_threads
 
-    ranges = pose_util.get_n_ranges(0, num_examples, num_threads)
+    if num_examples < len(mpii_dataset.img_filenames):
+        mpii_dataset = mpii_dataset.take(np.arange(num_examples))
 
     coder = ImageCoder(session)
 
+    person_crops = plan_person_crops(mpii_dataset)
+    shard_plan = plan_shards(mpii_dataset, FLAGS.train_shards, FLAGS.image_dim)
+
     threads = []
     for thread_index in range(num_threads):
-        args = (coder, thread_index, ranges, mpii_dataset)
+        args = (coder, thread_index, shard_plan, mpii_dataset, person_crops)
         t = threading.Thread(target=_process_image_files_single_thread, args=args)
         t.start()
         threads.append(t)
@@ -501,8 +342,6 @@ def _process_image_files(mpii_dataset, num_examples, session):
 @timethis
 def write_tf_record(mpii_dataset, num_examples=None):
     # TODO(brendan): Docstring...
-    assert ((FLAGS.train_shards % FLAGS.num_threads) == 0)
-
     if not os.path.exists(FLAGS.train_dir):
         os.mkdir(FLAGS.train_dir)
 
@@ -523,7 +362,10 @@ def main(argv=None):
 
      Type 'python3 -m write_tf_record --help' for options.
     """
-    mpii_dataset = mpii_read(FLAGS.mpii_filepath, FLAGS.is_train)
+    mpii_dataset = mpii_read(FLAGS.mpii_filepath,
+                             FLAGS.is_train,
+                             FLAGS.use_mpii_cache,
+                             FLAGS.mpii_cache_dir)
     write_tf_record(mpii_dataset)
 
 
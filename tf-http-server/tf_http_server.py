@@ -20,6 +20,9 @@ import tensorflow.contrib.slim as slim
 sys.path.append(os.path.abspath('..'))
 sys.path.append(os.path.abspath('../human_pose_model'))
 from human_pose_model.networks import resnet_bulat
+from human_pose_model.pose_utils import flip_tta
+from human_pose_model.pose_utils import profiling
+from human_pose_model.pose_utils import timethis as timers
 from human_pose_model.pose_utils.timethis import timethis
 
 JOINT_NAMES_NO_SPACE = ['r_ankle',
@@ -42,6 +45,11 @@ JOINT_NAMES_NO_SPACE = ['r_ankle',
 RESTORE_PATH = '/mnt/data/datasets/MPII_HumanPose/logs/resnet_brendan/regressor/8'
 IMAGE_DIM = 384
 BATCH_SIZE = 16
+# NOTE(brendan): Flip test-time augmentation doubles the batch run through the
+# network, trading latency for accuracy.
+FLIP_TTA = False
+PROFILE_DIR = './profiles'
+PROFILE_TOP_OPS = 10
 
 @timethis
 def _get_image_joint_predictions(image,
@@ -150,7 +158,8 @@ def TFHttpRequestHandlerFactory(session,
                                 image_bytes_feed,
                                 logits_tensor,
                                 resized_image_tensor,
-                                endpoints):
+                                endpoints,
+                                profiler):
     """This function returns subclasses of
     `http.server.BaseHTTPRequestHandler`, using the closure of the function
     call to allow extra parameters (namely the session to run a computation
@@ -208,6 +217,21 @@ def TFHttpRequestHandlerFactory(session,
 
             self._send_response_headers(json.dumps(b64_heatmap_jpegs))
 
+        def _respond_with_profile(self, frames):
+            """Does joint inference on `frames` with full tracing, and responds
+            with the path of the Chrome trace written on the server, and the
+            most expensive ops averaged over all requests profiled so far.
+            """
+            _, trace_filepath = profiler.run(
+                session,
+                logits_tensor,
+                'serving-{}'.format(profiler.num_steps),
+                {image_bytes_feed: frames})
+
+            profile = {'trace': trace_filepath,
+                       'top_ops': profiler.get_top_ops(PROFILE_TOP_OPS)}
+            self._send_response_headers(json.dumps(profile))
+
         def do_GET(self):
             """This implementation of an HTTP GET request handler will take an
             image URL (JPEG) passed as an option parameter
@@ -218,8 +242,15 @@ def TFHttpRequestHandlerFactory(session,
             E.g., the below curl command should return a string of JSON.
 
             curl -X GET https://brendanduke.ca:8765/?image_url=http://st2.depositphotos.com/1912333/10089/i/950/depositphotos_100892946-stock-photo-sporty-woman-waving-hands.jpg --insecure
+
+            A GET request to /debug/timers instead returns the summary of the
+            server's `timethis` timers as JSON.
             """
             image_url = self.requestline.split()[1]
+            if re.match('/debug/timers', image_url) is not None:
+                self._send_response_headers(json.dumps(timers.get_summary()))
+                return
+
             image_url = urllib.parse.unquote(image_url)
             image_url = re.match('/\?image_url=(.*)', image_url)
             if image_url is None:
@@ -242,6 +273,9 @@ def TFHttpRequestHandlerFactory(session,
             The server will attempt to decode the base 64 image and do
             joint-position inference, returning a JSON string representing the
             inferred joint positions.
+
+            POST requests to /debug/profile instead trace the inference, and
+            return a JSON string of the trace path and op-level profile.
             """
             content_length = int(self.headers['Content-Length'])
             post_data = self.rfile.read(content_length).decode('utf-8')
@@ -254,6 +288,8 @@ def TFHttpRequestHandlerFactory(session,
             post_url = self.requestline.split()[1]
             if re.match('/heatmap', post_url) is not None:
                 self._respond_with_heatmaps(decoded_img)
+            elif re.match('/debug/profile', post_url) is not None:
+                self._respond_with_profile(decoded_img)
             else:
                 self._respond_with_joints(decoded_img)
 
@@ -265,6 +301,9 @@ def _get_joint_position_inference_graph(image_bytes_feed):
     input placeholder image `image_bytes_feed`, pad and resize it to shape
     [IMAGE_DIM, IMAGE_DIM], then run human pose inference on the image using
     the "Two VGG-16s cascade" model.
+
+    If `FLIP_TTA` is set, the batch is run through the network along with its
+    mirrored copy, and the logits of the two are averaged.
     """
     decoded_image = tf.image.decode_jpeg(contents=image_bytes_feed)
 
@@ -276,6 +315,9 @@ def _get_joint_position_inference_graph(image_bytes_feed):
 
     normalized_image = tf.reshape(tensor=normalized_image,
                                   shape=[BATCH_SIZE, IMAGE_DIM, IMAGE_DIM, 3])
+    if FLIP_TTA:
+        normalized_image = flip_tta.concat_flipped(normalized_image,
+                                                   flip_tta.flip_images)
 
     with tf.device(device_name_or_function='/gpu:0'):
         with slim.arg_scope([slim.model_variable], device='/cpu:0'):
@@ -284,6 +326,8 @@ def _get_joint_position_inference_graph(image_bytes_feed):
                                                                     16,
                                                                     False,
                                                                     False)
+                if FLIP_TTA:
+                    logits = flip_tta.merge_flipped_logits(logits)
 
     return (logits,
             tf.image.convert_image_dtype(image=decoded_image, dtype=tf.uint8),
@@ -322,7 +366,8 @@ def run():
                                                           image_bytes_feed,
                                                           logits,
                                                           resized_image,
-                                                          endpoints)
+                                                          endpoints,
+                                                          profiling.Profiler(PROFILE_DIR))
             server_address = ('localhost', 8765)
             httpd = http.server.HTTPServer(server_address, request_handler)
             httpd.socket = ssl.wrap_socket(httpd.socket,